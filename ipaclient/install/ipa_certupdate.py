@@ -117,8 +117,9 @@ class CertUpdate(admintool.AdminTool):
         ipa_db = certdb.NSSDatabase(api.env.nss_dir)
 
         # Remove old IPA certs from /etc/ipa/nssdb
+        nicknames = set(name for name, _flags in ipa_db.list_certs())
         for nickname in ('IPA CA', 'External CA cert'):
-            while ipa_db.has_nickname(nickname):
+            while nickname in nicknames and ipa_db.has_nickname(nickname):
                 try:
                     ipa_db.delete_cert(nickname)
                 except ipautil.CalledProcessError as e:
@@ -133,14 +134,14 @@ class CertUpdate(admintool.AdminTool):
 
     def update_server(self, certs):
         instance = '-'.join(api.env.realm.split('.'))
-        self.update_db(
-            paths.ETC_DIRSRV_SLAPD_INSTANCE_TEMPLATE % instance, certs)
-        if services.knownservices.dirsrv.is_running():
+        if (self.update_db(
+                paths.ETC_DIRSRV_SLAPD_INSTANCE_TEMPLATE % instance, certs) and
+                services.knownservices.dirsrv.is_running()):
             services.knownservices.dirsrv.restart(instance)
 
-        self.update_db(paths.HTTPD_ALIAS_DIR, certs)
-        self.update_db(paths.IPA_RADB_DIR, certs)
-        if services.knownservices.httpd.is_running():
+        httpd_changed = self.update_db(paths.HTTPD_ALIAS_DIR, certs)
+        httpd_changed |= self.update_db(paths.IPA_RADB_DIR, certs)
+        if httpd_changed and services.knownservices.httpd.is_running():
             services.knownservices.httpd.restart()
 
         criteria = {
@@ -173,19 +174,42 @@ class CertUpdate(admintool.AdminTool):
         self.update_file(paths.CA_CRT, certs)
 
     def update_file(self, filename, certs, mode=0o444):
-        certs = (c[0] for c in certs if c[2] is not False)
+        certs = [x509.normalize_certificate(c[0])
+                 for c in certs if c[2] is not False]
+        try:
+            with open(filename) as f:
+                current = [x509.normalize_certificate(c)
+                           for c in x509.PEM_REGEX.findall(f.read())]
+        except Exception:
+            pass
+        else:
+            if current == certs:
+                self.log.debug("%s is up to date", filename)
+                return
         try:
             x509.write_certificate_list(certs, filename)
         except Exception as e:
             self.log.error("failed to update %s: %s", filename, e)
 
     def update_db(self, path, certs):
+        """
+        Add the certificates to the NSS database in path, skipping those
+        which are already there.
+
+        Returns True if the database was modified.
+        """
         db = certdb.NSSDatabase(path)
+        updates = []
         for cert, nickname, trusted, eku in certs:
             trust_flags = certstore.key_policy_to_trust_flags(
                 trusted, True, eku)
-            try:
-                db.add_cert(cert, nickname, trust_flags)
-            except ipautil.CalledProcessError as e:
-                self.log.error(
-                    "failed to update %s in %s: %s", nickname, path, e)
+            updates.append(
+                (x509.normalize_certificate(cert), nickname, trust_flags))
+        try:
+            changed = db.update_certs(updates)
+        except ipautil.CalledProcessError as e:
+            self.log.error("failed to update %s: %s", path, e)
+            return False
+        if changed:
+            self.log.debug("updated %s in %s", ', '.join(changed), path)
+        return bool(changed)
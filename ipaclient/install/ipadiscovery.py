@@ -18,6 +18,8 @@
 #
 
 import socket
+import threading
+import time
 
 import six
 
@@ -41,6 +43,10 @@ UNKNOWN_ERROR = -15
 
 IPA_BASEDN_INFO = 'ipa v2.0'
 
+# seconds to wait for all servers to be verified
+CHECK_TIMEOUT = 60
+MAX_CONCURRENT_CHECKS = 8
+
 error_names = {
     0: 'Success',
     NOT_FQDN: 'NOT_FQDN',
@@ -287,11 +293,16 @@ class IPADiscovery(object):
         ldapaccess = True
         root_logger.debug("[LDAP server check]")
         valid_servers = []
-        for server in servers:
-            root_logger.debug('Verifying that %s (realm %s) is an IPA server',
-                server, self.realm)
-            # check ldap now
-            ldapret = self.ipacheckldap(server, self.realm, ca_cert_path=ca_cert_path)
+        for server, ldapret, info in self._check_servers(
+                servers, ca_cert_path):
+            if 'basedn' in info:
+                self.basedn = info['basedn']
+                self.basedn_source = info['basedn_source']
+
+            if 'realms' in info and info['realm'] != self.realm:
+                # the realm was learned from a server checked before, match
+                # it as if the server had been checked with it
+                ldapret = self._match_realm(server, self.realm, info['realms'])
 
             if ldapret[0] == 0:
                 self.server = ldapret[1]
@@ -359,6 +370,52 @@ class IPADiscovery(object):
 
         return ldapret[0]
 
+    def _check_servers(self, servers, ca_cert_path=None):
+        """
+        Verify servers concurrently
+
+        Checks of all servers are started at once (at most
+        MAX_CONCURRENT_CHECKS at a time) so that unreachable servers do not
+        delay each other, while the results are yielded in the order of
+        servers as tuples (server, ldapret, info), see `_checkldap` for info.
+        Servers which do not answer until the common deadline are reported
+        as NO_LDAP_SERVER.
+        """
+        realm = self.realm
+        deadline = time.time() + CHECK_TIMEOUT
+        semaphore = threading.BoundedSemaphore(MAX_CONCURRENT_CHECKS)
+        results = {}
+
+        def check(server):
+            with semaphore:
+                root_logger.debug(
+                    'Verifying that %s (realm %s) is an IPA server',
+                    server, realm)
+                info = {'realm': realm}
+                try:
+                    ldapret = self._checkldap(
+                        server, realm, ca_cert_path, info)
+                except Exception as e:
+                    root_logger.debug("Error checking LDAP: %s", e)
+                    ldapret = [UNKNOWN_ERROR]
+                results[server] = (ldapret, info)
+
+        threads = []
+        for server in servers:
+            thread = threading.Thread(target=check, args=(server,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        for server, thread in zip(servers, threads):
+            thread.join(max(deadline - time.time(), 0))
+            if thread.is_alive():
+                root_logger.debug("LDAP Error: timeout checking %s", server)
+                yield server, [NO_LDAP_SERVER], {}
+            else:
+                ldapret, info = results[server]
+                yield server, ldapret, info
+
     def ipacheckldap(self, thost, trealm, ca_cert_path=None):
         """
         Given a host and kerberos realm verify that it is an IPA LDAP
@@ -371,7 +428,21 @@ class IPADiscovery(object):
                 anonymous binds are disabled)
             2 means the server is certainly not an IPA server
         """
+        info = {}
+        ldapret = self._checkldap(thost, trealm, ca_cert_path, info)
+        if 'basedn' in info:
+            self.basedn = info['basedn']
+            self.basedn_source = info['basedn_source']
+        return ldapret
+
+    def _checkldap(self, thost, trealm, ca_cert_path, info):
+        """
+        Check the server as `ipacheckldap` does, without modifying the
+        object, so that several servers can be checked concurrently.
 
+        The base DN and its source and the realms found on the server are
+        stored in info as 'basedn', 'basedn_source' and 'realms'.
+        """
         lrealms = []
 
         #now verify the server is really an IPA server
@@ -409,16 +480,16 @@ class IPADiscovery(object):
                 root_logger.debug("The server is not an IPA server")
                 return [NOT_IPA_SERVER]
 
-            self.basedn = basedn
-            self.basedn_source = 'From IPA server %s' % lh.ldap_uri
+            info['basedn'] = basedn
+            info['basedn_source'] = 'From IPA server %s' % lh.ldap_uri
 
             #search and return known realms
             root_logger.debug(
                 "Search for (objectClass=krbRealmContainer) in %s (sub)",
-                self.basedn)
+                basedn)
             try:
                 lret = lh.get_entries(
-                    DN(('cn', 'kerberos'), self.basedn),
+                    DN(('cn', 'kerberos'), basedn),
                     lh.SCOPE_SUBTREE, "(objectClass=krbRealmContainer)")
             except errors.NotFound:
                 #something very wrong
@@ -430,27 +501,9 @@ class IPADiscovery(object):
                 if six.PY3:
                     cn = cn.decode('utf-8')
                 lrealms.append(cn)
+            info['realms'] = lrealms
 
-            if trealm:
-                for r in lrealms:
-                    if trealm == r:
-                        return [0, thost, trealm]
-                # must match or something is very wrong
-                root_logger.debug("Realm %s does not match any realm in LDAP "
-                                  "database", trealm)
-                return [REALM_NOT_FOUND]
-            else:
-                if len(lrealms) != 1:
-                    #which one? we can't attach to a multi-realm server without DNS working
-                    root_logger.debug("Multiple realms found, cannot decide "
-                                      "which realm is the right without "
-                                      "working DNS")
-                    return [REALM_NOT_FOUND]
-                else:
-                    return [0, thost, lrealms[0]]
-
-            #we shouldn't get here
-            assert False, "Unknown error in ipadiscovery"
+            return self._match_realm(thost, trealm, lrealms)
 
         except errors.DatabaseTimeout:
             root_logger.debug("LDAP Error: timeout")
@@ -469,6 +522,28 @@ class IPADiscovery(object):
 
             return [UNKNOWN_ERROR]
 
+    def _match_realm(self, thost, trealm, lrealms):
+        """
+        Match the realm against the realms lrealms found on the server thost
+        """
+        if trealm:
+            for r in lrealms:
+                if trealm == r:
+                    return [0, thost, trealm]
+            # must match or something is very wrong
+            root_logger.debug("Realm %s does not match any realm in LDAP "
+                              "database", trealm)
+            return [REALM_NOT_FOUND]
+        else:
+            if len(lrealms) != 1:
+                #which one? we can't attach to a multi-realm server without DNS working
+                root_logger.debug("Multiple realms found, cannot decide "
+                                  "which realm is the right without "
+                                  "working DNS")
+                return [REALM_NOT_FOUND]
+            else:
+                return [0, thost, lrealms[0]]
+
 
     def ipadns_search_srv(self, domain, srv_record_name, default_port,
                           break_on_first=True):
@@ -491,11 +566,7 @@ class IPADiscovery(object):
 
         root_logger.debug("Search DNS for SRV record of %s", qname)
 
-        try:
-            answers = resolver.query(qname, rdatatype.SRV)
-        except DNSException as e:
-            root_logger.debug("DNS record not found: %s", e.__class__.__name__)
-            answers = []
+        answers = self._query_srv(qname)
 
         for answer in answers:
             root_logger.debug("DNS record found: %s", answer)
@@ -511,6 +582,20 @@ class IPADiscovery(object):
 
         return servers
 
+    def _query_srv(self, qname):
+        """
+        Return SRV records of qname ordered by priority and weight
+        """
+        try:
+            answers = list(resolver.query(qname, rdatatype.SRV))
+        except DNSException as e:
+            root_logger.debug("DNS record not found: %s", e.__class__.__name__)
+            answers = []
+
+        # lower priority first, higher weight first within the priority
+        answers.sort(key=lambda answer: (answer.priority, -answer.weight))
+        return answers
+
     def ipadnssearchkrbrealm(self, domain=None):
         realm = None
         if not domain:
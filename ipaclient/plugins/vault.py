@@ -20,12 +20,16 @@
 from __future__ import print_function
 
 import base64
+import datetime
+import errno
 import getpass
 import io
 import json
 import os
 import sys
+import time
 
+from cryptography import x509
 from cryptography.fernet import Fernet, InvalidToken
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
@@ -37,12 +41,15 @@ from cryptography.hazmat.primitives.serialization import load_pem_public_key,\
 import nss.nss as nss
 
 from ipaclient.frontend import MethodOverride
+from ipaclient.remote_plugins.schema import USER_CACHE_PATH
 from ipalib.frontend import Local, Method, Object
 from ipalib.util import classproperty
 from ipalib import api, errors
 from ipalib import Bytes, Flag, Str
 from ipalib.plugable import Registry
 from ipalib import _
+from ipapython.dnsutil import DNSName
+from ipapython.ipa_log_manager import log_mgr
 
 
 def validated_read(argname, filename, mode='r', encoding=None):
@@ -75,6 +82,8 @@ register = Registry()
 
 MAX_VAULT_DATA_SIZE = 2**20  # = 1 MB
 
+logger = log_mgr.get_logger(__name__)
+
 
 def get_new_password():
     """
@@ -169,6 +178,120 @@ def decrypt(data, symmetric_key=None, private_key=None):
                 message=_('Invalid credentials'))
 
 
+class TransportCertCache(object):
+    """
+    Per-server cache of the KRA transport certificate
+
+    The transport certificate is needed by every vault_archive and
+    vault_retrieve call. Caching it on disk saves a vaultconfig_show
+    round-trip per call. A cached certificate is used only while its
+    fingerprint matches the stored one, it has not expired and the cache
+    entry is younger than ``ttl`` seconds.
+    """
+    _DIR = os.path.join(USER_CACHE_PATH, 'ipa', 'kra-transport')
+    ttl = 24 * 3600
+
+    def __init__(self, api):
+        self.api = api
+        self._enabled = not api.env.in_server
+        hostname = DNSName(api.env.server).ToASCII()
+        self._path = os.path.join(self._DIR, hostname)
+
+    @staticmethod
+    def _fingerprint(cert):
+        return base64.b16encode(cert.fingerprint(hashes.SHA256())).decode(
+            'ascii')
+
+    def _read(self):
+        try:
+            with open(self._path, 'r') as f:
+                entry = json.load(f)
+            cert_der = base64.b64decode(entry['transport_cert'])
+            cert = x509.load_der_x509_certificate(cert_der, default_backend())
+        except Exception as e:
+            if not (isinstance(e, EnvironmentError) and
+                    e.errno == errno.ENOENT):  # pylint: disable=no-member
+                logger.warning(
+                    'Failed to read KRA transport certificate cache: %s', e)
+            return None
+
+        now = time.time()
+        if entry.get('fingerprint') != self._fingerprint(cert):
+            return None
+        if entry.get('expiration', 0) < now:
+            return None
+        if cert.not_valid_after < datetime.datetime.utcnow():
+            return None
+
+        return cert_der
+
+    def _write(self, cert_der):
+        cert = x509.load_der_x509_certificate(cert_der, default_backend())
+        entry = {
+            'transport_cert': base64.b64encode(cert_der).decode('ascii'),
+            'fingerprint': self._fingerprint(cert),
+            'expiration': time.time() + self.ttl,
+        }
+        try:
+            try:
+                os.makedirs(self._DIR)
+            except EnvironmentError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            tmp_path = '{}.{}'.format(self._path, os.getpid())
+            with open(tmp_path, 'w') as f:
+                json.dump(entry, f)
+            os.rename(tmp_path, self._path)
+        except EnvironmentError as e:
+            logger.warning(
+                'Failed to write KRA transport certificate cache: %s', e)
+
+    def invalidate(self):
+        try:
+            os.unlink(self._path)
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                logger.warning(
+                    'Failed to remove KRA transport certificate cache: %s', e)
+
+    def store(self, cert_der):
+        if self._enabled:
+            self._write(cert_der)
+
+    def get(self, force_fetch=False):
+        """
+        Return DER encoded transport certificate and whether it came from
+        the cache
+        """
+        if self._enabled and not force_fetch:
+            cert_der = self._read()
+            if cert_der is not None:
+                return cert_der, True
+
+        config = self.api.Command.vaultconfig_show()['result']
+        cert_der = config['transport_cert']
+        self.store(cert_der)
+        return cert_der, False
+
+    def call(self, func):
+        """
+        Call ``func`` with the DER encoded transport certificate
+
+        If the call fails with a cached certificate (e.g. because the KRA
+        transport certificate was renewed), the cache is dropped and the
+        call is retried once with a freshly fetched certificate.
+        """
+        cert_der, cached = self.get()
+        try:
+            return func(cert_der)
+        except errors.InternalError:
+            if not cached:
+                raise
+        self.invalidate()
+        cert_der, _cached = self.get(force_fetch=True)
+        return func(cert_der)
+
+
 @register(no_fail=True)
 class _fake_vault(Object):
     name = 'vault'
@@ -765,9 +888,20 @@ class vault_archive(Local):
         # initialize NSS database
         nss.nss_init(api.env.nss_dir)
 
-        # retrieve transport certificate
-        config = self.api.Command.vaultconfig_show()['result']
-        transport_cert_der = config['transport_cert']
+        vault_data = {}
+        vault_data[u'data'] = base64.b64encode(data).decode('utf-8')
+
+        if encrypted_key:
+            vault_data[u'encrypted_key'] = base64.b64encode(encrypted_key)\
+                .decode('utf-8')
+
+        json_vault_data = json.dumps(vault_data)
+
+        return TransportCertCache(self.api).call(
+            lambda transport_cert_der: self._archive(
+                transport_cert_der, json_vault_data, *args, **options))
+
+    def _archive(self, transport_cert_der, json_vault_data, *args, **options):
         nss_transport_cert = nss.Certificate(transport_cert_der)
 
         # generate session key
@@ -790,15 +924,6 @@ class vault_archive(Local):
         nonce = nss.generate_random(nonce_length)
         options['nonce'] = nonce
 
-        vault_data = {}
-        vault_data[u'data'] = base64.b64encode(data).decode('utf-8')
-
-        if encrypted_key:
-            vault_data[u'encrypted_key'] = base64.b64encode(encrypted_key)\
-                .decode('utf-8')
-
-        json_vault_data = json.dumps(vault_data)
-
         # wrap vault_data with session key
         iv_si = nss.SecItem(nonce)
         iv_param = nss.param_from_iv(mechanism, iv_si)
@@ -893,44 +1018,7 @@ class vault_retrieve(Local):
     def _iter_output(self):
         return self.api.Command.vault_retrieve_internal.output()
 
-    def forward(self, *args, **options):
-        output_file = options.get('out')
-
-        password = options.get('password')
-        password_file = options.get('password_file')
-        private_key = options.get('private_key')
-        private_key_file = options.get('private_key_file')
-
-        # don't send these parameters to server
-        if 'out' in options:
-            del options['out']
-        if 'password' in options:
-            del options['password']
-        if 'password_file' in options:
-            del options['password_file']
-        if 'private_key' in options:
-            del options['private_key']
-        if 'private_key_file' in options:
-            del options['private_key_file']
-
-        if self.api.env.in_server:
-            backend = self.api.Backend.ldap2
-        else:
-            backend = self.api.Backend.rpcclient
-        if not backend.isconnected():
-            backend.connect()
-
-        # retrieve vault info
-        vault = self.api.Command.vault_show(*args, **options)['result']
-
-        vault_type = vault['ipavaulttype'][0]
-
-        # initialize NSS database
-        nss.nss_init(api.env.nss_dir)
-
-        # retrieve transport certificate
-        config = self.api.Command.vaultconfig_show()['result']
-        transport_cert_der = config['transport_cert']
+    def _retrieve(self, transport_cert_der, *args, **options):
         nss_transport_cert = nss.Certificate(transport_cert_der)
 
         # generate session key
@@ -969,6 +1057,47 @@ class vault_retrieve(Local):
         json_vault_data = decoding_ctx.cipher_op(wrapped_vault_data)\
             + decoding_ctx.digest_final()
 
+        return response, json_vault_data
+
+    def forward(self, *args, **options):
+        output_file = options.get('out')
+
+        password = options.get('password')
+        password_file = options.get('password_file')
+        private_key = options.get('private_key')
+        private_key_file = options.get('private_key_file')
+
+        # don't send these parameters to server
+        if 'out' in options:
+            del options['out']
+        if 'password' in options:
+            del options['password']
+        if 'password_file' in options:
+            del options['password_file']
+        if 'private_key' in options:
+            del options['private_key']
+        if 'private_key_file' in options:
+            del options['private_key_file']
+
+        if self.api.env.in_server:
+            backend = self.api.Backend.ldap2
+        else:
+            backend = self.api.Backend.rpcclient
+        if not backend.isconnected():
+            backend.connect()
+
+        # retrieve vault info
+        vault = self.api.Command.vault_show(*args, **options)['result']
+
+        vault_type = vault['ipavaulttype'][0]
+
+        # initialize NSS database
+        nss.nss_init(api.env.nss_dir)
+
+        response, json_vault_data = TransportCertCache(self.api).call(
+            lambda transport_cert_der: self._retrieve(
+                transport_cert_der, *args, **options))
+
         vault_data = json.loads(json_vault_data.decode('utf-8'))
         data = base64.b64decode(vault_data[u'data'].encode('utf-8'))
 
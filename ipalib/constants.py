@@ -157,6 +157,14 @@ DEFAULT_CONFIG = (
     ('mode', 'production'),
     ('wait_for_dns', 0),
 
+    # Command timing and profiling (server only):
+    # log the timing of each command at info level instead of debug level
+    ('log_timing', False),
+    # return the timing of each command in the X-IPA-Timing response header
+    ('timing_header', False),
+    # profile one command in profile_sample and log the profile, 0 disables
+    ('profile_sample', 0),
+
     # CA plugin:
     ('ca_host', FQDN),  # Set in Env._finalize_core()
     ('ca_port', 80),
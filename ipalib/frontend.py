@@ -34,7 +34,7 @@ from ipalib.text import _
 from ipalib.errors import (ZeroArgumentError, MaxArgumentError, OverlapError,
     VersionError, OptionError,
     ValidationError, ConversionError)
-from ipalib import errors, messages
+from ipalib import errors, messages, timing
 from ipalib.request import context, context_frame
 from ipalib.util import classproperty, json_serialize
 
@@ -442,7 +442,7 @@ class Command(HasParam):
         XML-RPC and the executed an the nearest IPA server.
         """
         self.ensure_finalized()
-        with context_frame():
+        with context_frame(), timing.command():
             self.context.principal = getattr(context, 'principal', None)
             return self.__do_call(*args, **options)
 
@@ -458,21 +458,27 @@ class Command(HasParam):
                 # add message only on server side
                 self.add_message(
                     messages.VersionMissing(server_version=self.api_version))
-        params = self.args_options_2_params(*args, **options)
+        with timing.phase('args'):
+            params = self.args_options_2_params(*args, **options)
         self.debug(
             'raw: %s(%s)', self.name, ', '.join(self._repr_iter(**params))
         )
         if self.api.env.in_server:
-            params.update(self.get_default(**params))
-        params = self.normalize(**params)
-        params = self.convert(**params)
+            with timing.phase('default'):
+                params.update(self.get_default(**params))
+        with timing.phase('normalize'):
+            params = self.normalize(**params)
+        with timing.phase('convert'):
+            params = self.convert(**params)
         self.debug(
             '%s(%s)', self.name, ', '.join(self._repr_iter(**params))
         )
         if self.api.env.in_server:
-            self.validate(**params)
+            with timing.phase('validate'):
+                self.validate(**params)
         (args, options) = self.params_2_args_options(**params)
-        ret = self.run(*args, **options)
+        with timing.phase('execute'):
+            ret = self.run(*args, **options)
         if isinstance(ret, dict):
             for message in self.context.__messages:
                 messages.add_message(options['version'], ret, message)
@@ -483,7 +489,8 @@ class Command(HasParam):
         ):
             ret['summary'] = self.get_summary_default(ret)
         if self.use_output_validation and (self.output or ret is not None):
-            self.validate_output(ret, options['version'])
+            with timing.phase('validate_output'):
+                self.validate_output(ret, options['version'])
         return ret
 
     def add_message(self, message):
@@ -481,6 +481,16 @@ class CertificateInvalid(PublicMessage):
                "%(reason)s")
 
 
+class SearchResultPaged(PublicMessage):
+    """
+    **13030** Only one page of search results was returned
+    """
+    errno = 13030
+    type = "info"
+    format = _("More entries are available, continue the search with "
+               "--cursor=%(cursor)s")
+
+
 def iter_messages(variables, base):
     """Return a tuple with all subclasses
     """
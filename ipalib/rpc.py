@@ -410,6 +410,70 @@ def json_encode_binary(val, version, pretty_print=False):
         return json.dumps(result)
 
 
+def json_iterencode_binary(val, version, chunk_size=65536, stream_depth=3):
+    """Serialize a Python object structure to JSON incrementally
+
+    Dictionaries and lists nested up to ``stream_depth`` levels are written
+    item by item, deeper values (e.g. the entries of a search result) are
+    converted and serialized only when they are reached. Unlike
+    json_encode_binary(), the whole converted structure and its
+    serialization never exist in memory at once.
+
+    :param object val: Python object structure
+    :param str version: client version
+    :param int chunk_size: approximate size of the yielded chunks
+    :param int stream_depth: nesting level down to which containers are
+        written item by item
+    :return: iterator of UTF-8 encoded JSON chunks
+    """
+    primer = _JSONPrimer(version)
+    enc_dict = primer._enc_dict
+    enc_list = primer._enc_list
+    dumps = json.dumps
+
+    def iterencode(obj, depth):
+        func = primer[obj.__class__]
+        if depth < stream_depth and func == enc_dict and all(
+                isinstance(k, six.string_types) for k in obj):
+            yield u'{'
+            first = True
+            for k, v in six.iteritems(obj):
+                if first:
+                    first = False
+                else:
+                    yield u', '
+                yield dumps(k)
+                yield u': '
+                for part in iterencode(v, depth + 1):
+                    yield part
+            yield u'}'
+        elif depth < stream_depth and func == enc_list:
+            yield u'['
+            first = True
+            for v in obj:
+                if first:
+                    first = False
+                else:
+                    yield u', '
+                for part in iterencode(v, depth + 1):
+                    yield part
+            yield u']'
+        else:
+            yield dumps(primer.convert(obj))
+
+    buf = []
+    size = 0
+    for part in iterencode(val, 0):
+        buf.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            yield u''.join(buf).encode('utf-8')
+            buf = []
+            size = 0
+    if buf:
+        yield u''.join(buf).encode('utf-8')
+
+
 def _ipa_obj_hook(dct, _iteritems=six.iteritems, _list=list):
     """JSON object hook
 
@@ -0,0 +1,156 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Timing of command invocations.
+
+When timing is started for the current request with `start()`, the command
+pipeline records the wall time of each of its phases and backends count their
+operations and the time spent in them, using `phase()` and `operation()`.
+These functions do nothing when timing is not started, so the cost outside of
+the server is a single lookup in the per-request context.
+
+Only the phases of the outermost command are recorded, the phases of commands
+called by it are part of its 'execute' phase. Operations are counted for all
+commands.
+"""
+
+import contextlib
+import time
+from collections import OrderedDict
+
+from ipalib.request import context
+
+#: operations always reported, even when none was performed
+OPERATIONS = ('ldap', 'dogtag')
+
+
+class RequestTiming(object):
+    """
+    Phase durations and operation counters of a single request
+    """
+
+    def __init__(self):
+        self.start = time.time()
+        self.end = None
+        self.phases = OrderedDict()
+        self.operations = OrderedDict((name, [0, 0.0]) for name in OPERATIONS)
+        self.depth = 0
+        self._running = set()
+
+    def stop(self):
+        self.end = time.time()
+
+    @property
+    def total(self):
+        return (self.end or time.time()) - self.start
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if self.depth > 1:
+            yield
+            return
+
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.phases[name] = (
+                self.phases.get(name, 0.0) + time.time() - start)
+
+    @contextlib.contextmanager
+    def operation(self, name):
+        counter = self.operations.setdefault(name, [0, 0.0])
+        counter[0] += 1
+
+        # operations performed by another one of the same kind are counted,
+        # but their time is already included
+        if name in self._running:
+            yield
+            return
+
+        self._running.add(name)
+        start = time.time()
+        try:
+            yield
+        finally:
+            counter[1] += time.time() - start
+            self._running.discard(name)
+
+    def format(self):
+        """
+        Return the timing as a string of space-separated key=value items,
+        suitable for log lines and HTTP headers. Durations are in
+        milliseconds.
+        """
+        items = ['total=%.1f' % (self.total * 1000)]
+        items.extend('%s=%.1f' % (name, elapsed * 1000)
+                     for name, elapsed in self.phases.items())
+        for name, (count, elapsed) in self.operations.items():
+            items.append('%s_count=%d' % (name, count))
+            items.append('%s_time=%.1f' % (name, elapsed * 1000))
+        return ' '.join(items)
+
+
+def start():
+    """
+    Start timing of the current request and return the `RequestTiming`
+    """
+    timing = RequestTiming()
+    context.timing = timing
+    return timing
+
+
+def current():
+    """
+    Return the `RequestTiming` of the current request, or None if timing is
+    not started
+    """
+    return getattr(context, 'timing', None)
+
+
+@contextlib.contextmanager
+def command():
+    """
+    Mark the execution of a command, so that phases of nested commands are
+    not recorded
+    """
+    timing = current()
+    if timing is None:
+        yield
+        return
+
+    timing.depth += 1
+    try:
+        yield
+    finally:
+        timing.depth -= 1
+
+
+@contextlib.contextmanager
+def phase(name):
+    """
+    Record the duration of a phase of the request
+    """
+    timing = current()
+    if timing is None:
+        yield
+        return
+
+    with timing.phase(name):
+        yield
+
+
+@contextlib.contextmanager
+def operation(name):
+    """
+    Count an operation of a backend and the time spent in it
+    """
+    timing = current()
+    if timing is None:
+        yield
+        return
+
+    with timing.operation(name):
+        yield
@@ -159,6 +159,7 @@ class BasePathNamespace(object):
     GETCERT = "/usr/bin/getcert"
     GPG = "/usr/bin/gpg"
     GPG_AGENT = "/usr/bin/gpg-agent"
+    GZIP = "/usr/bin/gzip"
     IPA_GETCERT = "/usr/bin/ipa-getcert"
     KDESTROY = "/usr/bin/kdestroy"
     KINIT = "/usr/bin/kinit"
@@ -168,6 +169,7 @@ class BasePathNamespace(object):
     NET = "/usr/bin/net"
     BIN_NISDOMAINNAME = "/usr/bin/nisdomainname"
     NSUPDATE = "/usr/bin/nsupdate"
+    PIGZ = "/usr/bin/pigz"
     ODS_KSMUTIL = "/usr/bin/ods-ksmutil"
     ODS_SIGNER = "/usr/sbin/ods-signer"
     OPENSSL = "/usr/bin/openssl"
@@ -265,6 +267,7 @@ class BasePathNamespace(object):
     IPA_CLIENT_SYSRESTORE = "/var/lib/ipa-client/sysrestore"
     SYSRESTORE_INDEX = "/var/lib/ipa-client/sysrestore/sysrestore.index"
     IPA_BACKUP_DIR = "/var/lib/ipa/backup"
+    IPA_BACKUP_STORE_DIR = "/var/lib/ipa/backup/chunks"
     IPA_DNSSEC_DIR = "/var/lib/ipa/dnssec"
     IPA_KASP_DB_BACKUP = "/var/lib/ipa/ipa-kasp.db.backup"
     DNSSEC_TOKENS_DIR = "/var/lib/ipa/dnssec/tokens"
@@ -56,6 +56,15 @@ def get_ca_nickname(realm, format=CA_NICKNAME_FMT):
     return format % realm
 
 
+def _trust_flags_equal(flags1, flags2):
+    """Compare NSS trust flags strings, ignoring the order of the flags
+    within a field and the user certificate flag"""
+    def parse(flags):
+        return [frozenset(field) - frozenset('u')
+                for field in flags.split(',')]
+    return parse(flags1) == parse(flags2)
+
+
 def find_cert_from_txt(cert, start=0):
     """
     Given a cert blob (str) which may or may not contian leading and
@@ -527,6 +536,122 @@ class NSSDatabase(object):
     def delete_cert(self, nick):
         self.run_certutil(["-D", "-n", nick])
 
+    def get_certs(self):
+        """Return all certificates in the database
+
+        Only the certutil listing is run as a subprocess, the certificates
+        are read through NSS directly.
+
+        :return: Dict mapping nickname to a (DER cert, trust_flags) tuple
+        """
+        certs = {}
+        nicknames = self.list_certs()
+        if not nicknames:
+            return certs
+
+        cert = None
+        if nss.nss_is_initialized():
+            nss.nss_shutdown()
+        nss.nss_init(self.secdir)
+        try:
+            for nickname, trust_flags in nicknames:
+                try:
+                    cert = nss.find_cert_from_nickname(nickname)
+                except NSPRError as e:
+                    root_logger.debug("Failed to read %s from %s: %s",
+                                      nickname, self.secdir, e)
+                    continue
+                certs[nickname] = (cert.der_data, trust_flags)
+        finally:
+            del cert
+            nss.nss_shutdown()
+
+        return certs
+
+    def run_certutil_batch(self, commands):
+        """Run several certutil commands in a single certutil process
+
+        :param commands: List of (args, cert) tuples, where args is a list
+            of certutil arguments and cert is a DER-encoded certificate to
+            be passed to the command as input file, or None
+        """
+        if not commands:
+            return
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            lines = []
+            for i, (args, cert) in enumerate(commands):
+                args = list(args)
+                if cert is not None:
+                    filename = os.path.join(tmpdir, 'cert%d.der' % i)
+                    with open(filename, 'wb') as f:
+                        f.write(cert)
+                    args.extend(['-i', filename])
+                for arg in args:
+                    if '"' in arg or '\n' in arg:
+                        raise ValueError(
+                            "invalid certutil batch argument %r" % arg)
+                lines.append(' '.join('"%s"' % arg for arg in args))
+
+            batch_file = os.path.join(tmpdir, 'batch')
+            with open(batch_file, 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+
+            self.run_certutil(["-B", "-i", batch_file])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def update_certs(self, certs):
+        """Make sure the database contains the given certificates
+
+        Certificates which are already present with the same nickname and
+        trust flags are left untouched, the others are added or have their
+        trust flags modified in a single certutil batch. If the batch fails,
+        the commands are run one at a time and the certificates which fail
+        are logged and skipped.
+
+        :param certs: List of (DER cert, nickname, trust_flags) tuples
+        :return: List of nicknames of the added or modified certificates
+        """
+        current = self.get_certs()
+
+        commands = []
+        nicknames = []
+        for cert, nickname, trust_flags in certs:
+            if nickname in current:
+                current_cert, current_flags = current[nickname]
+                if current_cert == cert:
+                    if _trust_flags_equal(current_flags, trust_flags):
+                        continue
+                    commands.append(
+                        (["-M", "-n", nickname, "-t", trust_flags], None))
+                    nicknames.append(nickname)
+                    continue
+            commands.append(
+                (["-A", "-n", nickname, "-t", trust_flags], cert))
+            nicknames.append(nickname)
+
+        try:
+            self.run_certutil_batch(commands)
+        except (ValueError, ipautil.CalledProcessError) as e:
+            # fall back to one command at a time to find the culprit
+            root_logger.debug("certutil batch failed: %s", e)
+        else:
+            return nicknames
+
+        changed = []
+        for (args, cert), nickname in zip(commands, nicknames):
+            try:
+                self.run_certutil(args, stdin=cert)
+            except ipautil.CalledProcessError as e:
+                root_logger.error(
+                    "failed to update %s in %s: %s", nickname, self.secdir, e)
+            else:
+                changed.append(nickname)
+
+        return changed
+
     def verify_server_cert_validity(self, nickname, hostname):
         """Verify a certificate is valid for a SSL server with given hostname
 
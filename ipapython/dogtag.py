@@ -26,7 +26,7 @@ import six
 from six.moves.urllib.parse import urlencode
 # pylint: enable=import-error
 
-from ipalib import api, errors
+from ipalib import api, errors, timing
 from ipalib.errors import NetworkError
 from ipalib.text import _
 from ipapython import nsslib, ipautil
@@ -200,14 +200,15 @@ def _httplib_request(
         headers['content-type'] = 'application/x-www-form-urlencoded'
 
     try:
-        conn = connection_factory(host, port)
-        conn.request(method, uri, body=request_body, headers=headers)
-        res = conn.getresponse()
-
-        http_status = res.status
-        http_headers = res.msg
-        http_body = res.read()
-        conn.close()
+        with timing.operation('dogtag'):
+            conn = connection_factory(host, port)
+            conn.request(method, uri, body=request_body, headers=headers)
+            res = conn.getresponse()
+
+            http_status = res.status
+            http_headers = res.msg
+            http_body = res.read()
+            conn.close()
     except Exception as e:
         root_logger.debug("httplib request failed:", exc_info=True)
         raise NetworkError(uri=uri, error=str(e))
@@ -37,9 +37,12 @@ import ldap
 import ldap.sasl
 import ldap.filter
 from ldap.controls import SimplePagedResultsControl
+from ldap.controls.psearch import (PersistentSearchControl,
+                                   EntryChangeNotificationControl,
+                                   CHANGE_TYPES_INT)
 import six
 
-from ipalib import errors, _
+from ipalib import errors, timing, _
 from ipalib.constants import LDAP_GENERALIZED_TIME_FORMAT
 from ipapython.ipautil import format_netloc, CIDict
 from ipapython.ipa_log_manager import log_mgr
@@ -68,6 +71,12 @@ TRUNCATED_ADMIN_LIMIT = object()
 
 DIRMAN_DN = DN(('cn', 'directory manager'))
 
+PSEARCH_OID = '2.16.840.1.113730.3.4.3'
+
+# number of modify requests sent by update_entries() before waiting for
+# their responses
+UPDATE_BATCH_SIZE = 100
+
 
 class _ServerSchema(object):
     '''
@@ -681,6 +690,9 @@ class LDAPClient(object):
     time_limit = -1.0   # unlimited
     size_limit = 0      # unlimited
 
+    # supportedControl values of the root DSE, read on first use
+    _supported_controls = None
+
     def __init__(self, ldap_uri, start_tls=False, force_schema_updates=False,
                  no_schema=False, decode_attrs=True, cacert=None,
                  sasl_nocanon=False):
@@ -945,12 +957,19 @@ class LDAPClient(object):
         return ipa_result
 
     @contextlib.contextmanager
-    def error_handler(self, arg_desc=None):
+    def error_handler(self, arg_desc=None, timed=True):
         """Context manager that handles LDAPErrors
+
+        :param timed: count the call as an LDAP operation of the request,
+            False for waits for results of an operation counted already
         """
         try:
             try:
-                yield
+                if timed:
+                    with timing.operation('ldap'):
+                        yield
+                else:
+                    yield
             except ldap.TIMEOUT:
                 raise errors.DatabaseTimeout()
             except ldap.LDAPError as e:
@@ -1443,6 +1462,113 @@ class LDAPClient(object):
 
         return (res, truncated)
 
+    def find_entries_page(self, filter=None, attrs_list=None, base_dn=None,
+                          scope=ldap.SCOPE_SUBTREE, time_limit=None,
+                          page_size=1000, cookie=None):
+        """
+        Return one page of a simple paged results search as a tuple
+        ([entries], cookie, truncated).
+
+        The returned cookie must be passed to the next call on the same
+        connection, together with the same search parameters, to get the
+        next page. Empty cookie means that there are no more entries.
+
+        Keyword arguments:
+        attrs_list -- list of attributes to return, all if None (default None)
+        base_dn -- dn of the entry at which to start the search (default '')
+        scope -- search scope, see LDAP docs (default ldap2.SCOPE_SUBTREE)
+        time_limit -- time limit in seconds (default unlimited)
+        page_size -- number of entries in one page
+        cookie -- cookie returned by the previous call, None for the first
+            page
+        """
+        if base_dn is None:
+            base_dn = DN()
+        assert isinstance(base_dn, DN)
+        if not filter:
+            filter = '(objectClass=*)'
+        if cookie is None:
+            cookie = ''
+        res = []
+        truncated = False
+
+        if time_limit is None:
+            time_limit = self.time_limit
+        if time_limit == 0:
+            time_limit = -1.0
+        if not isinstance(time_limit, float):
+            time_limit = float(time_limit)
+
+        if attrs_list:
+            attrs_list = [a.lower() for a in set(attrs_list)]
+
+        sctrls = [SimplePagedResultsControl(0, page_size, cookie)]
+
+        with self.error_handler():
+            if six.PY2:
+                filter = self.encode(filter)
+                attrs_list = self.encode(attrs_list)
+
+            try:
+                id = self.conn.search_ext(
+                    str(base_dn), scope, filter, attrs_list,
+                    serverctrls=sctrls, timeout=time_limit
+                )
+                while True:
+                    result = self.conn.result3(id, 0)
+                    objtype, res_list, _res_id, res_ctrls = result
+                    if objtype == ldap.RES_SEARCH_RESULT:
+                        break
+                    res_list = self._convert_result(res_list)
+                    if res_list:
+                        res.append(res_list[0])
+
+                for ctrl in res_ctrls:
+                    if isinstance(ctrl, SimplePagedResultsControl):
+                        cookie = ctrl.cookie
+                        break
+                else:
+                    cookie = ''
+            except ldap.ADMINLIMIT_EXCEEDED:
+                truncated = TRUNCATED_ADMIN_LIMIT
+                cookie = ''
+            except ldap.SIZELIMIT_EXCEEDED:
+                truncated = TRUNCATED_SIZE_LIMIT
+                cookie = ''
+            except ldap.TIMELIMIT_EXCEEDED:
+                truncated = TRUNCATED_TIME_LIMIT
+                cookie = ''
+
+        return (res, cookie, truncated)
+
+    def abandon_paged_search(self, filter=None, attrs_list=None,
+                             base_dn=None, scope=ldap.SCOPE_SUBTREE,
+                             cookie=None):
+        """
+        Release server side resources of a paged search started by
+        find_entries_page() which will not be finished.
+        """
+        if not cookie:
+            return
+        if base_dn is None:
+            base_dn = DN()
+        if not filter:
+            filter = '(objectClass=*)'
+        if attrs_list:
+            attrs_list = [a.lower() for a in set(attrs_list)]
+
+        sctrls = [SimplePagedResultsControl(0, 0, cookie)]
+        try:
+            with self.error_handler():
+                if six.PY2:
+                    filter = self.encode(filter)
+                    attrs_list = self.encode(attrs_list)
+                self.conn.search_ext_s(
+                    str(base_dn), scope, filter, attrs_list,
+                    serverctrls=sctrls)
+        except errors.PublicError as e:
+            self.log.warning("Error cancelling paged search: %s", e)
+
     def find_entry_by_attr(self, attr, value, object_class, attrs_list=None,
                            base_dn=None):
         """
@@ -1548,6 +1674,48 @@ class LDAPClient(object):
 
         entry.reset_modlist()
 
+    def update_entries(self, entries, batch_size=UPDATE_BATCH_SIZE):
+        """Update attributes of several entries.
+
+        The modify requests of each batch of entries are sent without
+        waiting for the responses of the previous ones.
+
+        Returns a list of (entry, error) tuples in the order of entries,
+        where error is None if the update succeeded or the PublicError it
+        failed with. Entries without changes are not sent and get
+        EmptyModlist.
+        """
+        results = []
+        for i in range(0, len(entries), batch_size):
+            pending = []
+            for entry in entries[i:i + batch_size]:
+                modlist = entry.generate_modlist()
+                if not modlist:
+                    results.append((entry, errors.EmptyModlist()))
+                    continue
+                try:
+                    with self.error_handler():
+                        modlist = [(a, str(b), self.encode(c))
+                                   for a, b, c in modlist]
+                        msgid = self.conn.modify_ext(str(entry.dn), modlist)
+                except errors.PublicError as e:
+                    results.append((entry, e))
+                    continue
+                pending.append((len(results), msgid))
+                results.append((entry, None))
+
+            for index, msgid in pending:
+                entry = results[index][0]
+                try:
+                    with self.error_handler():
+                        self.conn.result3(msgid)
+                except errors.PublicError as e:
+                    results[index] = (entry, e)
+                else:
+                    entry.reset_modlist()
+
+        return results
+
     def delete_entry(self, entry_or_dn):
         """Delete an entry given either the DN or the entry itself"""
         if isinstance(entry_or_dn, DN):
@@ -1570,6 +1738,189 @@ class LDAPClient(object):
         else:
             return True
 
+    def supports_control(self, oid):
+        """
+        Test whether the server announces support of the given control.
+        """
+        if self._supported_controls is None:
+            try:
+                entry = self.get_entry(DN(), ['supportedControl'])
+            except errors.PublicError as e:
+                self.log.debug("Cannot read supported controls: %s", e)
+                return False
+            self._supported_controls = frozenset(
+                entry.get('supportedControl', []))
+        return oid in self._supported_controls
+
+    def wait_for_entry(self, dn, condition, attrs_list=None, timeout=None,
+                       progress=None, poll_interval=0.1,
+                       max_poll_interval=5.0, persistent=True):
+        """
+        Wait until an entry satisfies a condition.
+
+        Changes of the entry are watched with a persistent search if the
+        server supports it. Otherwise, or if the persistent search fails,
+        the entry is polled, starting at poll_interval seconds and backing
+        off exponentially up to max_poll_interval while it does not change.
+
+        Attributes which the server computes when the entry is read, such as
+        the status of replication agreements, change without a modification
+        and are not reported by the persistent search. The entry is
+        therefore read again whenever no change was reported for
+        max_poll_interval seconds. Pass persistent=False to poll entries
+        whose state consists of such attributes only.
+
+        :param dn: DN of the watched entry
+        :param condition: callable taking the entry, or None if the entry
+            does not exist, and returning True when the wait is over
+        :param attrs_list: attributes to read, all if None
+        :param timeout: maximal number of seconds to wait, unlimited if None
+        :param progress: callable called with the entry (or None) before
+            condition whenever it has been read or reported changed
+        :param persistent: use a persistent search if the server supports it
+        :return: the entry which satisfied the condition, or None
+        :raises errors.DatabaseTimeout: if timeout elapsed
+        """
+        assert isinstance(dn, DN)
+        if timeout is None:
+            deadline = None
+        else:
+            deadline = time.time() + timeout
+
+        entry = self._get_entry_or_none(dn, attrs_list)
+        if progress is not None:
+            progress(entry)
+        if condition(entry):
+            return entry
+
+        if persistent and self.supports_control(PSEARCH_OID):
+            try:
+                return self._wait_for_entry_psearch(
+                    dn, condition, attrs_list, deadline, progress,
+                    max_poll_interval)
+            except errors.DatabaseTimeout:
+                raise
+            except errors.PublicError as e:
+                self.log.debug(
+                    "Persistent search on %s failed, polling: %s", dn, e)
+
+        return self._wait_for_entry_poll(
+            dn, condition, attrs_list, deadline, progress, poll_interval,
+            max_poll_interval)
+
+    def _get_entry_or_none(self, dn, attrs_list):
+        try:
+            return self.get_entry(dn, attrs_list)
+        except errors.NotFound:
+            return None
+
+    def _wait_for_entry_psearch(self, dn, condition, attrs_list, deadline,
+                                progress, recheck_interval):
+        if dn:
+            # watch the parent, so that the entry can be (re)added
+            rdn = dn[0]
+            base_dn = dn[1:]
+            scope = ldap.SCOPE_ONELEVEL
+            filter = '(%s=%s)' % (
+                rdn.attr, ldap.filter.escape_filter_chars(rdn.value))
+        else:
+            base_dn = dn
+            scope = ldap.SCOPE_BASE
+            filter = '(objectClass=*)'
+        if attrs_list:
+            attrs_list = [a.lower() for a in set(attrs_list)]
+
+        # changesOnly=False returns the current state first, so that no
+        # change between the initial read and now is missed
+        sctrls = [PersistentSearchControl(criticality=True,
+                                          changesOnly=False,
+                                          returnECs=True)]
+        with self.error_handler():
+            if six.PY2:
+                filter = self.encode(filter)
+                attrs_list = self.encode(attrs_list)
+            msgid = self.conn.search_ext(
+                str(base_dn), scope, filter, attrs_list, serverctrls=sctrls)
+
+        try:
+            while True:
+                wait = recheck_interval
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise errors.DatabaseTimeout()
+                    wait = min(wait, remaining)
+                # waiting for changes is not an LDAP operation of its own
+                with self.error_handler(timed=False):
+                    try:
+                        result = self.conn.result4(
+                            msgid, 0, wait, add_ctrls=1)
+                    except ldap.TIMEOUT:
+                        result = None
+                if result is None:
+                    # no change reported, computed attributes may have
+                    # changed nevertheless
+                    entry = self._get_entry_or_none(dn, attrs_list)
+                    if progress is not None:
+                        progress(entry)
+                    if condition(entry):
+                        return entry
+                    continue
+
+                objtype, res_list = result[:2]
+                if objtype == ldap.RES_SEARCH_RESULT:
+                    raise errors.DatabaseError(
+                        desc='persistent search ended', info=str(dn))
+                for res_dn, res_attrs, res_ctrls in res_list:
+                    if res_dn is None or DN(res_dn) != dn:
+                        continue
+                    deleted = any(
+                        isinstance(ctrl, EntryChangeNotificationControl) and
+                        ctrl.changeType == CHANGE_TYPES_INT['delete']
+                        for ctrl in res_ctrls)
+                    if deleted:
+                        entry = None
+                    else:
+                        entry = self._convert_result([(res_dn, res_attrs)])[0]
+                    if progress is not None:
+                        progress(entry)
+                    if condition(entry):
+                        return entry
+        finally:
+            try:
+                self.conn.abandon(msgid)
+            except ldap.LDAPError:
+                pass
+
+    def _wait_for_entry_poll(self, dn, condition, attrs_list, deadline,
+                             progress, poll_interval, max_poll_interval):
+        interval = poll_interval
+        last_state = _missing
+        while True:
+            delay = interval
+            if deadline is not None:
+                delay = min(delay, deadline - time.time())
+                if delay <= 0:
+                    raise errors.DatabaseTimeout()
+            time.sleep(delay)
+
+            entry = self._get_entry_or_none(dn, attrs_list)
+            if entry is None:
+                state = None
+            else:
+                state = dict((k, list(v)) for k, v in entry._raw.items())
+            if state != last_state:
+                # the entry is changing, keep up with it
+                last_state = state
+                interval = poll_interval
+                if progress is not None:
+                    progress(entry)
+            else:
+                interval = min(interval * 2, max_poll_interval)
+
+            if condition(entry):
+                return entry
+
 
 def get_ldap_uri(host='', port=389, cacert=None, ldapi=False, realm=None,
                  protocol=None):
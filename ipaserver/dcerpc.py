@@ -23,6 +23,7 @@
 # package is installed to avoid issues with unavailable modules
 
 import re
+import threading
 import time
 
 from ipalib import api, _
@@ -189,6 +190,62 @@ class ExtendedDNControl(LDAPControl):
         return '0\x03\x02\x01\x01'
 
 
+class TrustTopology(object):
+    """
+    Trusted domains with indexes for SID lookups.
+
+    SIDs of the domains are indexed by their string form for exact matches
+    and in a trie keyed by their sub-authorities for prefix matches.
+    """
+    def __init__(self, domains, fingerprint):
+        self.domains = domains
+        self.fingerprint = fingerprint
+        self.by_sid = {}
+        self.sid_trie = {}
+        for name, (_flatname, sid) in domains.items():
+            self.by_sid.setdefault(str(sid), name)
+            node = self.sid_trie
+            for sub_auth in sid.sub_auths[:sid.num_auths]:
+                node = node.setdefault(sub_auth, {})
+            # None never collides with a sub-authority
+            node.setdefault(None, []).append(name)
+
+    def find_exact(self, sid):
+        """
+        Returns the name of the domain whose SID is sid, or None.
+        """
+        return self.by_sid.get(str(sid))
+
+    def find_prefix(self, sid):
+        """
+        Returns the name of a domain whose SID sub-authorities are a prefix
+        of those of sid or the other way around, or None.
+        """
+        node = self.sid_trie
+        for sub_auth in sid.sub_auths[:sid.num_auths]:
+            if None in node:
+                return node[None][0]
+            node = node.get(sub_auth)
+            if node is None:
+                return None
+
+        # sid is a prefix of the SIDs of all the domains below this node
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if None in node:
+                return node[None][0]
+            stack.extend(child for key, child in node.items()
+                         if key is not None)
+        return None
+
+
+# TrustTopology objects shared by the DomainValidator instances of the
+# process, keyed by the DN of the trusts container
+_trust_topology_lock = threading.Lock()
+_trust_topologies = {}
+
+
 class DomainValidator(object):
     ATTR_FLATNAME = 'ipantflatname'
     ATTR_SID = 'ipantsecurityidentifier'
@@ -204,6 +261,7 @@ class DomainValidator(object):
         self.dn = None
         self.sid = None
         self._domains = None
+        self._topology = None
         self._info = dict()
         self._creds = None
         self._admin_creds = None
@@ -225,14 +283,26 @@ class DomainValidator(object):
             return False
         return True
 
-    def get_trusted_domains(self):
+    def _trust_fingerprint(self, cn_trust):
         """
-        Returns case-insensitive dict of trusted domain tuples
-        (flatname, sid, trust_auth_outgoing), keyed by domain name.
+        Return a value which changes whenever a trusted domain entry is
+        added, modified or removed, without reading the entries themselves.
         """
-        cn_trust = DN(('cn', 'ad'), self.api.env.container_trusts,
-                      self.api.env.basedn)
+        filter = self.ldap.make_filter({'objectClass': 'ipaNTTrustedDomain'},
+                                       rules=self.ldap.MATCH_ALL)
+        try:
+            entries, _truncated = self.ldap.find_entries(
+                filter=filter,
+                base_dn=cn_trust,
+                attrs_list=['modifytimestamp', 'entryusn'])
+        except errors.NotFound:
+            return ()
+        return tuple(sorted(
+            (str(e.dn), str(e.single_value.get('modifytimestamp')),
+             str(e.single_value.get('entryusn')))
+            for e in entries))
 
+    def _load_trusted_domains(self, cn_trust):
         try:
             search_kw = {'objectClass': 'ipaNTTrustedDomain'}
             filter = self.ldap.make_filter(search_kw,
@@ -244,28 +314,66 @@ class DomainValidator(object):
                             self.ATTR_FLATNAME,
                             self.ATTR_TRUST_PARTNER]
                 )
+        except errors.NotFound:
+            entries = []
 
-            # We need to use case-insensitive dictionary since we use
-            # domain names as keys and those are generally case-insensitive
-            result = ipautil.CIDict()
+        # We need to use case-insensitive dictionary since we use
+        # domain names as keys and those are generally case-insensitive
+        result = ipautil.CIDict()
 
-            for e in entries:
-                try:
-                    t_partner = e.single_value.get(self.ATTR_TRUST_PARTNER)
-                    fname_norm = e.single_value.get(self.ATTR_FLATNAME).lower()
-                    trusted_sid = e.single_value.get(self.ATTR_TRUSTED_SID)
-                except KeyError as exc:
-                    # Some piece of trusted domain info in LDAP is missing
-                    # Skip the domain, but leave log entry for investigation
-                    api.log.warning("Trusted domain '%s' entry misses an "
-                                    "attribute: %s", e.dn, exc)
-                    continue
+        for e in entries:
+            try:
+                t_partner = e.single_value.get(self.ATTR_TRUST_PARTNER)
+                fname_norm = e.single_value.get(self.ATTR_FLATNAME).lower()
+                trusted_sid = e.single_value.get(self.ATTR_TRUSTED_SID)
+            except KeyError as exc:
+                # Some piece of trusted domain info in LDAP is missing
+                # Skip the domain, but leave log entry for investigation
+                api.log.warning("Trusted domain '%s' entry misses an "
+                                "attribute: %s", e.dn, exc)
+                continue
 
-                result[t_partner] = (fname_norm,
-                                     security.dom_sid(trusted_sid))
-            return result
-        except errors.NotFound as exc:
-            return []
+            result[t_partner] = (fname_norm,
+                                 security.dom_sid(trusted_sid))
+        return result
+
+    def get_trust_topology(self):
+        """
+        Returns the TrustTopology of the trusted domains.
+
+        The topology is shared by all the validators of the process and
+        reloaded only when the fingerprint of the trusted domain entries
+        changes. The fingerprint is checked once per validator, i.e. once
+        per request.
+        """
+        if self._topology is not None:
+            return self._topology
+
+        cn_trust = DN(('cn', 'ad'), self.api.env.container_trusts,
+                      self.api.env.basedn)
+        fingerprint = self._trust_fingerprint(cn_trust)
+        with _trust_topology_lock:
+            topology = _trust_topologies.get(cn_trust)
+
+        if topology is None or topology.fingerprint != fingerprint:
+            # the fingerprint is read before the entries, so a concurrent
+            # change makes it stale and the next check reloads them
+            topology = TrustTopology(self._load_trusted_domains(cn_trust),
+                                     fingerprint)
+            with _trust_topology_lock:
+                _trust_topologies[cn_trust] = topology
+
+        self._topology = topology
+        return topology
+
+    def get_trusted_domains(self):
+        """
+        Returns case-insensitive dict of trusted domain tuples
+        (flatname, sid), keyed by domain name.
+
+        The dict is shared between requests and must not be modified.
+        """
+        return self.get_trust_topology().domains
 
     def set_trusted_domains(self):
         # At this point we have SID_NT_AUTHORITY family SID and really need to
@@ -297,29 +405,25 @@ class DomainValidator(object):
         # At this point we have SID_NT_AUTHORITY family SID and really need to
         # check it against prefixes of domain SIDs we trust to
         self.set_trusted_domains()
+        topology = self.get_trust_topology()
 
-        # We have non-zero list of trusted domains and have to go through
-        # them one by one and check their sids as prefixes / exact match
-        # depending on the value of exact_match flag
+        # We have non-zero list of trusted domains and have to check their
+        # sids as prefixes / exact match depending on the value of
+        # exact_match flag
         if exact_match:
             # check exact match of sids
-            for domain in self._domains:
-                if sid == str(self._domains[domain][1]):
-                    return domain
-
-            raise errors.NotFound(reason=_("SID does not match exactly"
-                                           "with any trusted domain's SID"))
+            domain = topology.find_exact(sid)
+            if domain is None:
+                raise errors.NotFound(reason=_("SID does not match exactly"
+                                               "with any trusted domain's SID"))
+            return domain
         else:
             # check as prefixes
-            test_sid_subauths = test_sid.sub_auths
-            for domain in self._domains:
-                domsid = self._domains[domain][1]
-                sub_auths = domsid.sub_auths
-                num_auths = min(test_sid.num_auths, domsid.num_auths)
-                if test_sid_subauths[:num_auths] == sub_auths[:num_auths]:
-                    return domain
-            raise errors.NotFound(reason=_('SID does not match any '
-                                           'trusted domain'))
+            domain = topology.find_prefix(test_sid)
+            if domain is None:
+                raise errors.NotFound(reason=_('SID does not match any '
+                                               'trusted domain'))
+            return domain
 
     def is_trusted_sid_valid(self, sid):
         try:
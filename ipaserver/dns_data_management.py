@@ -19,8 +19,10 @@ from time import sleep, time
 
 from ipalib import errors
 from ipalib.dns import record_name_format
+from ipapython.dn import DN
 from ipapython.dnsutil import DNSName, resolve_rrsets
 from ipapython.ipa_log_manager import root_logger
+from ipaserver.servroles import ENABLED
 
 if six.PY3:
     unicode=str
@@ -52,6 +54,9 @@ IPA_DEFAULT_NTP_SRV_REC = (
     (DNSName("_ntp._udp"), 123),
 )
 
+# record types generated by IPASystemRecords
+_IPA_SYSTEM_RECORD_TYPES = ('A', 'AAAA', 'SRV', 'TXT')
+
 
 class IPADomainIsNotManagedByIPAError(Exception):
     pass
@@ -77,10 +82,11 @@ class IPASystemRecords(object):
         """
         self.__init_data()
 
-    def __get_server_attrs(self, server_result):
-        weight = int(server_result.get('ipaserviceweight', [u'100'])[0])
-        location = server_result.get('ipalocation_location', [None])[0]
-        roles = set(server_result.get('enabled_role_servrole', ()))
+    def __get_server_attrs(self, entry, roles):
+        weight = int(entry.get('ipaserviceweight', [u'100'])[0])
+        location = None
+        if entry.get('ipalocation'):
+            location = DNSName(entry['ipalocation'][0]['idnsname'])
 
         return weight, location, roles
 
@@ -88,12 +94,31 @@ class IPASystemRecords(object):
         return location + DNSName('_locations') + self.domain_abs
 
     def __init_data(self):
+        """
+        Read servers with one search of the masters container and their
+        enabled roles from a single topology snapshot, instead of calling
+        server_find which looks up the roles of every server separately
+        """
         self.servers_data = {}
 
-        servers_result = self.api_instance.Command.server_find(
-            no_members=False)['result']
-        for s in servers_result:
-            weight, location, roles = self.__get_server_attrs(s)
+        ldap = self.api_instance.Backend.ldap2
+        masters_dn = DN(self.api_instance.env.container_masters,
+                        self.api_instance.env.basedn)
+        try:
+            entries = ldap.get_entries(
+                masters_dn, ldap.SCOPE_ONELEVEL,
+                attrs_list=['cn', 'ipalocation', 'ipaserviceweight'])
+        except errors.EmptyResult:
+            entries = []
+
+        enabled_roles = defaultdict(set)
+        for r in self.api_instance.Backend.serverroles.server_role_search(
+                status=ENABLED):
+            enabled_roles[r[u'server_server']].add(r[u'role_servrole'])
+
+        for s in entries:
+            weight, location, roles = self.__get_server_attrs(
+                s, enabled_roles[s['cn'][0]])
             self.servers_data[s['cn'][0]] = {
                 'weight': weight,
                 'location': location,
@@ -263,44 +288,155 @@ class IPASystemRecords(object):
                 update_dict[option_name].append(unicode(rdata.to_text()))
         return update_dict
 
-    def __update_dns_records(
-            self, record_name, nodes, set_cname_template=True
-    ):
-        update_dict = self.__prepare_records_update_dict(nodes)
-        cname_template = {
-            'addattr': [u'objectclass=idnsTemplateObject'],
-            'setattr': [
-                u'idnsTemplateAttribute;cnamerecord=%s'
-                u'.\{substitutionvariable_ipalocation\}._locations' %
-                record_name.relativize(self.domain_abs)
-            ]
-        }
-        try:
-            if set_cname_template:
-                # only srv records should have configured cname templates
-                update_dict.update(cname_template)
-            self.api_instance.Command.dnsrecord_mod(
-                self.domain_abs, record_name,
-                **update_dict
-            )
-        except errors.NotFound:
-            # because internal API magic, addattr and setattr doesn't work with
-            # dnsrecord-add well, use dnsrecord-mod instead later
-            update_dict.pop('addattr', None)
-            update_dict.pop('setattr', None)
-
-            self.api_instance.Command.dnsrecord_add(
-                self.domain_abs, record_name, **update_dict)
-
-            if set_cname_template:
-                try:
-                    self.api_instance.Command.dnsrecord_mod(
-                        self.domain_abs,
-                        record_name, **cname_template)
-                except errors.EmptyModlist:
-                    pass
-        except errors.EmptyModlist:
-            pass
+    @staticmethod
+    def __normalize_record_values(attr, values):
+        """
+        Return set of record values in canonical text form, so that values
+        read from LDAP can be compared with generated ones
+        """
+        rdtype = rdatatype.from_text(attr[:-len('record')].upper())
+        normalized = set()
+        for value in values:
+            try:
+                value = rdata.from_text(
+                    rdataclass.IN, rdtype, value).to_text()
+            except DNSException:
+                pass
+            normalized.add(unicode(value))
+        return normalized
+
+    def __get_cname_template(self, record_name):
+        return (
+            u'%s.\{substitutionvariable_ipalocation\}._locations' %
+            record_name.relativize(self.domain_abs)
+        )
+
+    def __get_record_dn(self, zone_dn, record_name):
+        relative_name = record_name.relativize(self.domain_abs)
+        if relative_name.is_empty():
+            return zone_dn
+        return DN(('idnsname', relative_name.ToASCII()), zone_dn)
+
+    def __get_existing_records(self, zone_dn, record_names):
+        """
+        Read all given record entries of the IPA zone in a single search,
+        the zone apex is read from the zone entry
+        :return: dict {record DN: LDAPEntry}
+        """
+        ldap = self.api_instance.Backend.ldap2
+        relative_names = set()
+        apex = False
+        for record_name in record_names:
+            relative_name = record_name.relativize(self.domain_abs)
+            if relative_name.is_empty():
+                apex = True
+            else:
+                relative_names.add(relative_name.ToASCII())
+
+        attrs_list = ['objectclass', 'idnsname', 'idnstemplateattribute']
+        attrs_list.extend(
+            record_name_format % t.lower() for t in _IPA_SYSTEM_RECORD_TYPES)
+
+        existing = {}
+        if apex:
+            # records of the zone apex are stored in the zone entry, which
+            # is not returned by the one-level search
+            try:
+                entry = ldap.get_entry(zone_dn, attrs_list)
+            except errors.NotFound:
+                pass
+            else:
+                existing[entry.dn] = entry
+
+        if relative_names:
+            try:
+                entries = ldap.get_entries(
+                    zone_dn, ldap.SCOPE_ONELEVEL,
+                    filter=ldap.make_filter_from_attr(
+                        'idnsname', sorted(relative_names)),
+                    attrs_list=attrs_list,
+                    paged_search=True)
+            except errors.EmptyResult:
+                entries = []
+            existing.update((entry.dn, entry) for entry in entries)
+
+        return existing
+
+    def __record_entry_changes(self, entry, update_dict, set_cname_template,
+                               record_name):
+        """
+        Apply desired state of a record to an existing LDAP entry
+        :return: True if the entry has to be written to LDAP
+        """
+        changed = False
+        for attr, values in update_dict.items():
+            current = self.__normalize_record_values(
+                attr, entry.get(attr, []))
+            if current != self.__normalize_record_values(attr, values):
+                entry[attr] = values
+                changed = True
+
+        if set_cname_template:
+            objectclasses = [o.lower() for o in entry.get('objectclass', [])]
+            if 'idnstemplateobject' not in objectclasses:
+                entry['objectclass'] = (
+                    list(entry.get('objectclass', [])) +
+                    [u'idnsTemplateObject'])
+                changed = True
+            template = self.__get_cname_template(record_name)
+            attr = 'idnsTemplateAttribute;cnamerecord'
+            if entry.get(attr, []) != [template]:
+                entry[attr] = [template]
+                changed = True
+
+        return changed
+
+    def __update_dns_records(self, zone_obj, names_requiring_cname_templates,
+                             dry_run=False):
+        """
+        Compare records in zone_obj with records stored in LDAP and write
+        only entries which differ. Existing records are read with one search
+        and changed entries are written directly to LDAP instead of calling
+        dnsrecord_mod/dnsrecord_add for every record name.
+        :return: [(record_name, node), ...], [(record_name, node, error), ...]
+        """
+        ldap = self.api_instance.Backend.ldap2
+        success = []
+        fail = []
+
+        zone_dn = self.api_instance.Object.dnszone.get_dn(self.domain_abs)
+        existing = self.__get_existing_records(zone_dn, zone_obj.keys())
+
+        for record_name, node in zone_obj.items():
+            set_cname_template = (
+                record_name in names_requiring_cname_templates)
+            update_dict = self.__prepare_records_update_dict(node)
+            dn = self.__get_record_dn(zone_dn, record_name)
+            try:
+                entry = existing.get(dn)
+                if entry is None:
+                    entry = ldap.make_entry(
+                        dn,
+                        objectclass=[u'top', u'idnsrecord'],
+                        idnsname=[record_name.relativize(self.domain_abs)],
+                    )
+                    self.__record_entry_changes(
+                        entry, update_dict, set_cname_template, record_name)
+                    if not dry_run:
+                        ldap.add_entry(entry)
+                elif self.__record_entry_changes(
+                        entry, update_dict, set_cname_template, record_name):
+                    if not dry_run:
+                        ldap.update_entry(entry)
+                elif dry_run:
+                    # entry is up to date
+                    continue
+            except errors.PublicError as e:
+                fail.append((record_name, node, e))
+            else:
+                success.append((record_name, node))
+
+        return success, fail
 
     def get_base_records(
             self, servers=None, roles=None, include_master_role=True,
@@ -356,15 +492,16 @@ class IPASystemRecords(object):
                 include_master_role=include_master_role)
         return zone_obj
 
-    def update_base_records(self):
+    def update_base_records(self, dry_run=False):
         """
         Update base DNS records for IPA services
+        :param dry_run: do not modify LDAP, only report records which would
+        be changed
         :return: [(record_name, node), ...], [(record_name, node, error), ...]
         where the first list contains successfully updated records, and the
-        second list contains failed updates with particular exceptions
+        second list contains failed updates with particular exceptions. With
+        dry_run the first list contains only records which differ from LDAP.
         """
-        fail = []
-        success = []
         names_requiring_cname_templates = set(
             rec[0].derelativize(self.domain_abs) for rec in (
                 IPA_DEFAULT_MASTER_SRV_REC +
@@ -374,42 +511,29 @@ class IPASystemRecords(object):
         )
 
         base_zone = self.get_base_records()
-        for record_name, node in base_zone.items():
-            set_cname_template = record_name in names_requiring_cname_templates
-            try:
-                self.__update_dns_records(
-                    record_name, node, set_cname_template)
-            except errors.PublicError as e:
-                fail.append((record_name, node, e))
-            else:
-                success.append((record_name, node))
-        return success, fail
+        return self.__update_dns_records(
+            base_zone, names_requiring_cname_templates, dry_run=dry_run)
 
-    def update_locations_records(self):
+    def update_locations_records(self, dry_run=False):
         """
         Update locations DNS records for IPA services
+        :param dry_run: do not modify LDAP, only report records which would
+        be changed
         :return: [(record_name, node), ...], [(record_name, node, error), ...]
         where the first list contains successfully updated records, and the
-        second list contains failed updates with particular exceptions
+        second list contains failed updates with particular exceptions. With
+        dry_run the first list contains only records which differ from LDAP.
         """
-        fail = []
-        success = []
-
-        location_zone = self.get_locations_records()
-        for record_name, nodes in location_zone.items():
-            try:
-                self.__update_dns_records(
-                    record_name, nodes,
-                    set_cname_template=False)
-            except errors.PublicError as e:
-                fail.append((record_name, nodes, e))
-            else:
-                success.append((record_name, nodes))
-        return success, fail
+        location_zone = self.get_locations_records(
+            servers=self.servers_data.keys())
+        return self.__update_dns_records(
+            location_zone, set(), dry_run=dry_run)
 
-    def update_dns_records(self):
+    def update_dns_records(self, dry_run=False):
         """
         Update all IPA DNS records
+        :param dry_run: do not modify LDAP, only report records which would
+        be changed
         :return: (sucessfully_updated_base_records, failed_base_records,
         sucessfully_updated_locations_records, failed_locations_records)
         For format see update_base_records or update_locations_method
@@ -422,8 +546,8 @@ class IPASystemRecords(object):
             raise IPADomainIsNotManagedByIPAError()
 
         return (
-            self.update_base_records(),
-            self.update_locations_records()
+            self.update_base_records(dry_run=dry_run),
+            self.update_locations_records(dry_run=dry_run)
         )
 
     def remove_location_records(self, location):
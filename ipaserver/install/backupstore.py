@@ -0,0 +1,220 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Content-addressed chunk store used by incremental backups.
+
+Files are split into chunks at content-defined boundaries, so that an
+insertion or removal in a file (e.g. an entry in an LDIF export or a file
+in a tar archive) only changes the chunks around it. Each chunk is stored
+once, compressed, under its SHA-256 digest. A backup consists of a manifest
+listing the chunks of each file.
+"""
+
+import errno
+import hashlib
+import json
+import os
+import zlib
+
+MANIFEST_NAME = 'manifest'
+MANIFEST_VERSION = 1
+
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+# once a chunk has MIN_CHUNK_SIZE bytes, it ends after the first line whose
+# checksum has these bits clear
+BOUNDARY_MASK = 0x3f
+
+
+def split_chunks(fileobj):
+    """
+    Split the content of a binary file object into chunks.
+
+    Boundaries are placed after lines, so they depend only on the content
+    preceding them since the previous boundary and get re-synchronized
+    shortly after a modified region.
+    """
+    chunk = []
+    size = 0
+    while True:
+        line = fileobj.readline(MAX_CHUNK_SIZE - size)
+        if not line:
+            break
+        chunk.append(line)
+        size += len(line)
+        if (size >= MAX_CHUNK_SIZE or
+                (size >= MIN_CHUNK_SIZE and
+                 not zlib.crc32(line) & BOUNDARY_MASK)):
+            yield b''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield b''.join(chunk)
+
+
+class ChunkStore(object):
+    """
+    Directory of compressed chunks named by the SHA-256 digest of their
+    content.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def _chunk_path(self, digest):
+        return os.path.join(self.path, digest[:2], digest)
+
+    def put(self, data):
+        """
+        Store a chunk unless it is already present and return its digest.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._chunk_path(digest)
+        if os.path.exists(path):
+            return digest
+
+        dirname = os.path.dirname(path)
+        try:
+            os.makedirs(dirname, 0o700)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(zlib.compress(data))
+        os.rename(tmp, path)
+        return digest
+
+    def get(self, digest):
+        """
+        Return the content of a chunk, verifying its digest.
+        """
+        with open(self._chunk_path(digest), 'rb') as f:
+            data = zlib.decompress(f.read())
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError("chunk %s is corrupted" % digest)
+        return data
+
+    def store(self, fileobj):
+        """
+        Store the content of a binary file object and return the list of
+        digests of its chunks.
+        """
+        return [self.put(chunk) for chunk in split_chunks(fileobj)]
+
+    def retrieve(self, digests, fileobj):
+        """
+        Write the content described by a list of digests into a binary
+        file object.
+        """
+        for digest in digests:
+            fileobj.write(self.get(digest))
+
+    def prune(self, referenced):
+        """
+        Remove chunks whose digest is not in referenced.
+
+        Returns the number of removed chunks.
+        """
+        removed = 0
+        if not os.path.isdir(self.path):
+            return removed
+        for dirname, _dirs, files in os.walk(self.path):
+            for name in files:
+                if name in referenced:
+                    continue
+                os.unlink(os.path.join(dirname, name))
+                removed += 1
+        return removed
+
+
+def create_manifest(store, manifest_file, sources):
+    """
+    Store files in the chunk store and write a manifest describing them.
+
+    :param store: ChunkStore
+    :param manifest_file: path of the manifest file to write
+    :param sources: list of (directory, name) tuples; name is stored with
+        its path relative to directory and, if it is a directory, its
+        content recursively
+    """
+    entries = []
+
+    def add_file(path, name):
+        with open(path, 'rb') as f:
+            chunks = store.store(f)
+        entries.append({
+            'name': name,
+            'type': 'file',
+            'chunks': chunks,
+        })
+
+    for dirname, name in sources:
+        path = os.path.join(dirname, name)
+        if not os.path.isdir(path):
+            add_file(path, name)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            relroot = os.path.normpath(
+                os.path.join(name, os.path.relpath(root, path)))
+            entries.append({
+                'name': relroot,
+                'type': 'dir',
+            })
+            for filename in sorted(files):
+                add_file(os.path.join(root, filename),
+                         os.path.join(relroot, filename))
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'store': os.path.relpath(store.path, os.path.dirname(manifest_file)),
+        'entries': entries,
+    }
+    with open(manifest_file, 'w') as f:
+        json.dump(manifest, f)
+
+
+def read_manifest(filename):
+    with open(filename) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError("unsupported manifest version %s" %
+                         manifest.get('version'))
+    return manifest
+
+
+def extract_manifest(filename, dest):
+    """
+    Rebuild the files described by a manifest in the directory dest.
+    """
+    manifest = read_manifest(filename)
+    store = ChunkStore(os.path.join(os.path.dirname(filename),
+                                    manifest['store']))
+    for entry in manifest['entries']:
+        path = os.path.normpath(os.path.join(dest, entry['name']))
+        if not path.startswith(os.path.join(dest, '')):
+            raise ValueError("invalid manifest entry %s" % entry['name'])
+        if entry['type'] == 'dir':
+            if not os.path.isdir(path):
+                os.makedirs(path)
+        else:
+            with open(path, 'wb') as f:
+                store.retrieve(entry['chunks'], f)
+
+
+def referenced_chunks(backup_dir):
+    """
+    Return the set of digests referenced by the manifests of all backups
+    in backup_dir.
+    """
+    referenced = set()
+    for name in os.listdir(backup_dir):
+        filename = os.path.join(backup_dir, name, MANIFEST_NAME)
+        if not os.path.exists(filename):
+            continue
+        for entry in read_manifest(filename)['entries']:
+            referenced.update(entry.get('chunks', ()))
+    return referenced
@@ -28,6 +28,7 @@ from ipapython.admintool import ScriptError
 from ipaplatform import services
 from ipaplatform.paths import paths
 from ipaserver.install import installutils, certs
+from ipaserver.install.service import restart_manager
 from ipaserver.install.replication import replica_conn_check
 from ipalib import api, errors, x509
 from ipapython.dn import DN
@@ -346,7 +347,9 @@ def install_step_1(standalone, replica_config, options):
 
     if standalone or replica_config is not None:
         # We need to restart apache as we drop a new config file in there
-        services.knownservices.httpd.restart(capture_output=True)
+        restart_manager.request(
+            'httpd',
+            lambda: services.knownservices.httpd.restart(capture_output=True))
 
     if standalone:
         # Install CA DNS records
@@ -119,8 +119,8 @@ class CustodiaInstance(SimpleServiceInstance):
         cli.fetch_key('dm/DMHash')
 
     def __get_keys(self, ca_host, cacerts_file, cacerts_pwd, data):
-        # Fecth all needed certs one by one, then combine them in a single
-        # p12 file
+        # Fetch all needed certs in a single request, then combine them in a
+        # single p12 file
 
         prefix = data['prefix']
         certlist = data['list']
@@ -138,8 +138,12 @@ class CustodiaInstance(SimpleServiceInstance):
                 f.write(cacerts_pwd)
                 f.flush()
 
+            values = cli.fetch_keys(
+                [os.path.join(prefix, nickname) for nickname in certlist],
+                False)
+
             for nickname in certlist:
-                value = cli.fetch_key(os.path.join(prefix, nickname), False)
+                value = values[os.path.join(prefix, nickname)]
                 v = json_decode(value)
                 pk12pwfile = os.path.join(tmpnssdir, 'pk12pwfile')
                 with open(pk12pwfile, 'w+') as f:
@@ -43,6 +43,7 @@ from ipaserver.install import bindinstance
 from ipaserver.install import dnskeysyncinstance
 from ipaserver.install import odsexporterinstance
 from ipaserver.install import opendnssecinstance
+from ipaserver.install.service import restart_manager
 
 if six.PY3:
     unicode = str
@@ -338,7 +339,9 @@ def install(standalone, replica, options, api=api):
 
     bind.create_instance()
     print("Restarting the web server to pick up resolv.conf changes")
-    services.knownservices.httpd.restart(capture_output=True)
+    restart_manager.request(
+        'httpd',
+        lambda: services.knownservices.httpd.restart(capture_output=True))
 
     # on dnssec master this must be installed last
     dnskeysyncd = dnskeysyncinstance.DNSKeySyncInstance(fstore)
@@ -181,7 +181,10 @@ class HTTPInstance(service.Service):
             self.step("create KDC proxy user", create_kdcproxy_user)
             self.step("create KDC proxy config", self.create_kdcproxy_conf)
             self.step("enable KDC proxy", self.enable_kdcproxy)
-        self.step("restarting httpd", self.__start)
+        if service.restart_manager.is_deferred(self.service_name):
+            self.step("scheduling httpd restart", self.__start)
+        else:
+            self.step("restarting httpd", self.__start)
         self.step("configuring httpd to start on boot", self.__enable)
         self.step("enabling oddjobd", self.enable_and_start_oddjobd)
 
@@ -189,7 +192,7 @@ class HTTPInstance(service.Service):
 
     def __start(self):
         self.backup_state("running", self.is_running())
-        self.restart()
+        self.request_restart()
 
     def __enable(self):
         self.backup_state("enabled", self.is_enabled())
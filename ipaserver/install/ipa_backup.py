@@ -19,7 +19,9 @@
 
 import os
 import shutil
+import subprocess
 import tempfile
+import threading
 import time
 import pwd
 
@@ -35,7 +37,7 @@ from ipapython.ipautil import run, write_tmp_file
 from ipapython import admintool
 from ipapython.dn import DN
 from ipaserver.install.replication import wait_for_task
-from ipaserver.install import installutils
+from ipaserver.install import backupstore, installutils
 from ipapython import ipaldap
 from ipaplatform.constants import constants
 from ipaplatform.tasks import tasks
@@ -65,14 +67,10 @@ EOF
 """
 
 
-def encrypt_file(filename, keyring, remove_original=True):
-    source = filename
-    dest = filename + '.gpg'
-
+def gpg_command(keyring):
     args = [paths.GPG,
             '--batch',
-            '--default-recipient-self',
-            '-o', dest]
+            '--default-recipient-self']
 
     if keyring is not None:
         args.append('--no-default-keyring')
@@ -81,6 +79,27 @@ def encrypt_file(filename, keyring, remove_original=True):
         args.append('--secret-keyring')
         args.append(keyring + '.sec')
 
+    return args
+
+
+def compress_command():
+    '''
+    Return the command compressing its standard input to its standard
+    output, using all CPUs if pigz is available.
+    '''
+    if os.path.exists(paths.PIGZ):
+        return [paths.PIGZ, '-c']
+    else:
+        return [paths.GZIP, '-c']
+
+
+def encrypt_file(filename, keyring, remove_original=True):
+    source = filename
+    dest = filename + '.gpg'
+
+    args = gpg_command(keyring)
+    args.extend(['-o', dest])
+
     args.append('-e')
     args.append(source)
 
@@ -210,6 +229,9 @@ class Backup(admintool.AdminTool):
         self.files = list(self.files)
         self.dirs = list(self.dirs)
         self.logs = list(self.logs)
+        # (directory, name) of data exported by 389-ds, archived as ./name
+        # directly from where it was written
+        self.exported = []
 
     @classmethod
     def add_options(cls, parser):
@@ -225,6 +247,10 @@ class Backup(admintool.AdminTool):
             default=False, help="Include log files in backup")
         parser.add_option("--online", dest="online", action="store_true",
             default=False, help="Perform the LDAP backups online, for data only.")
+        parser.add_option("--incremental", dest="incremental",
+            action="store_true", default=False,
+            help="Store only data changed since the previous incremental "
+                 "backups")
 
 
     def setup_logging(self, log_file_mode='a'):
@@ -255,6 +281,10 @@ class Backup(admintool.AdminTool):
             self.option_parser.error("You cannot specify --data "
                 "with --logs")
 
+        if options.incremental and options.gpg:
+            self.option_parser.error("You cannot specify --incremental "
+                "with --gpg")
+
 
     def run(self):
         options = self.options
@@ -300,17 +330,20 @@ class Backup(admintool.AdminTool):
             instance = installutils.realm_to_serverid(api.env.realm)
             if os.path.exists(paths.VAR_LIB_SLAPD_INSTANCE_DIR_TEMPLATE %
                               instance):
+                backends = []
                 if os.path.exists(paths.SLAPD_INSTANCE_DB_DIR_TEMPLATE %
                                   (instance, 'ipaca')):
-                    self.db2ldif(instance, 'ipaca', online=options.online)
-                self.db2ldif(instance, 'userRoot', online=options.online)
+                    backends.append('ipaca')
+                backends.append('userRoot')
+                self.export_ldifs(instance, backends, online=options.online)
                 self.db2bak(instance, online=options.online)
             if not options.data_only:
                 # create backup of auth configuration
                 auth_backup_path = os.path.join(paths.VAR_LIB_IPA, 'auth_backup')
                 tasks.backup_auth_configuration(auth_backup_path)
                 self.file_backup(options)
-            self.finalize_backup(options.data_only, options.gpg, options.gpg_keyring)
+            self.finalize_backup(options.data_only, options.gpg,
+                                 options.gpg_keyring, options.incremental)
 
             if options.data_only:
                 if not options.online:
@@ -325,6 +358,7 @@ class Backup(admintool.AdminTool):
                 os.chdir(cwd)
             except Exception as e:
                 self.log.error('Cannot change directory to %s: %s' % (cwd, e))
+            self.remove_exported()
             shutil.rmtree(self.top_dir)
 
 
@@ -371,18 +405,126 @@ class Backup(admintool.AdminTool):
         return self._conn
 
 
+    def run_pipeline(self, commands, filename):
+        '''
+        Run commands with the standard output of each one connected to the
+        standard input of the next one, writing the output of the last one
+        to filename.
+        '''
+        self.log.debug('Starting external process')
+        self.log.debug('args=%s', ' | '.join(' '.join(c) for c in commands))
+
+        processes = []
+        try:
+            with open(filename, 'wb') as out:
+                stdin = None
+                try:
+                    for i, args in enumerate(commands):
+                        if i == len(commands) - 1:
+                            stdout = out
+                        else:
+                            stdout = subprocess.PIPE
+                        stderr = tempfile.TemporaryFile()
+                        try:
+                            p = subprocess.Popen(
+                                args, stdin=stdin, stdout=stdout,
+                                stderr=stderr, close_fds=True)
+                        except Exception:
+                            stderr.close()
+                            raise
+                        processes.append((args, p, stderr))
+                        if stdin is not None:
+                            # the process has its own copy now
+                            stdin.close()
+                        stdin = p.stdout
+                except Exception:
+                    # nobody is going to read the output of the started
+                    # processes, do not let them block on a full pipe
+                    if stdin is not None:
+                        stdin.close()
+                    for _args, p, _stderr in processes:
+                        if p.poll() is None:
+                            p.kill()
+                    raise
+                finally:
+                    for _args, p, _stderr in processes:
+                        p.wait()
+
+            for args, p, stderr in processes:
+                if p.returncode != 0:
+                    stderr.seek(0)
+                    error = stderr.read().decode('utf-8', 'replace')
+                    raise admintool.ScriptError(
+                        '%s returned non-zero code %d: %s' %
+                        (os.path.basename(args[0]), p.returncode, error))
+        finally:
+            for _args, _p, stderr in processes:
+                stderr.close()
+
+
+    def export_ldifs(self, instance, backends, online=True):
+        '''
+        Create LDIF backups of the backends in this instance.
+
+        Online exports are separate tasks, so they are run concurrently.
+        '''
+        if not online:
+            for backend in backends:
+                self.db2ldif(instance, backend, online=False)
+            return
+
+        failures = []
+
+        # the connection is created on first use, do it before the threads
+        # share it
+        self.get_connection()
+
+        def export(backend):
+            try:
+                self.db2ldif(instance, backend, online=True)
+            except Exception as e:
+                failures.append(e)
+
+        threads = [threading.Thread(target=export, args=(backend,))
+                   for backend in backends]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if failures:
+            raise failures[0]
+
+
+    def remove_exported(self):
+        '''
+        Remove the data exported by 389-ds once it is archived.
+        '''
+        for dirname, name in self.exported:
+            path = os.path.join(dirname, name)
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.unlink(path)
+            except OSError as e:
+                self.log.error('Cannot remove %s: %s', path, e)
+        del self.exported[:]
+
+
     def db2ldif(self, instance, backend, online=True):
         '''
         Create a LDIF backup of the data in this instance.
 
         If executed online create a task and wait for it to complete.
 
-        For SELinux reasons this writes out to the 389-ds backup location
-        and we move it.
+        For SELinux reasons this writes out to the 389-ds backup location,
+        the LDIF is archived from there.
         '''
         self.log.info('Backing up %s in %s to LDIF' % (backend, instance))
 
         cn = time.strftime('export_%Y_%m_%d_%H_%M_%S')
+        cn = '%s_%s' % (cn, backend)
         dn = DN(('cn', cn), ('cn', 'export'), ('cn', 'tasks'), ('cn', 'config'))
 
         ldifname = '%s-%s.ldif' % (instance, backend)
@@ -422,8 +564,7 @@ class Backup(admintool.AdminTool):
             if result.returncode != 0:
                 self.log.critical('db2ldif failed: %s', result.error_log)
 
-        # Move the LDIF backup to our location
-        shutil.move(ldiffile, os.path.join(self.dir, ldifname))
+        self.exported.append((os.path.dirname(ldiffile), ldifname))
 
 
     def db2bak(self, instance, online=True):
@@ -465,7 +606,7 @@ class Backup(admintool.AdminTool):
             if result.returncode != 0:
                 self.log.critical('db2bak failed: %s', result.error_log)
 
-        shutil.move(bakdir, self.dir)
+        self.exported.append(os.path.split(bakdir))
 
 
     def file_backup(self, options):
@@ -481,7 +622,7 @@ class Backup(admintool.AdminTool):
                 '--xattrs',
                 '--selinux',
                 '-cf',
-                tarfile
+                '-'
                ]
 
         args.extend(verify_directories(self.dirs))
@@ -490,45 +631,22 @@ class Backup(admintool.AdminTool):
         if options.logs:
             args.extend(verify_directories(self.logs))
 
-        result = run(args, raiseonerr=False)
-        if result.returncode != 0:
-            raise admintool.ScriptError('tar returned non-zero code %d: %s' %
-                                        (result.returncode, result.error_log))
-
-        # Backup the necessary directory structure. This is a separate
-        # call since we are using the '--no-recursion' flag to store
-        # the directory structure only, no files.
+        # Backup the necessary directory structure. '--no-recursion'
+        # applies to the names following it, so only the directories
+        # themselves are stored, no files.
         missing_directories = verify_directories(self.required_dirs)
 
         if missing_directories:
-            args = ['tar',
-                    '--exclude=/var/lib/ipa/backup',
-                    '--xattrs',
-                    '--selinux',
-                    '--no-recursion',
-                    '-rf',  # -r appends to an existing archive
-                    tarfile,
-                   ]
+            args.append('--no-recursion')
             args.extend(missing_directories)
 
-            result = run(args, raiseonerr=False)
-            if result.returncode != 0:
-                raise admintool.ScriptError(
-                    'tar returned non-zero code %d '
-                    'when adding directory structure: %s' %
-                    (result.returncode, result.error_log))
-
-        # Compress the archive. This is done separately, since 'tar' cannot
-        # append to a compressed archive.
-        result = run(['gzip', tarfile], raiseonerr=False)
-        if result.returncode != 0:
-            raise admintool.ScriptError(
-                'gzip returned non-zero code %d '
-                'when compressing the backup: %s' %
-                (result.returncode, result.error_log))
-
-        # Rename the archive back to files.tar to preserve compatibility
-        os.rename(os.path.join(self.dir, 'files.tar.gz'), tarfile)
+        if options.incremental:
+            # uncompressed, so that unchanged files are deduplicated
+            self.run_pipeline([args], tarfile)
+        else:
+            # The archive is compressed as it is written. It keeps the name
+            # files.tar to preserve compatibility.
+            self.run_pipeline([args, compress_command()], tarfile)
 
 
     def create_header(self, data_only):
@@ -566,7 +684,8 @@ class Backup(admintool.AdminTool):
             config.write(fd)
 
 
-    def finalize_backup(self, data_only=False, encrypt=False, keyring=None):
+    def finalize_backup(self, data_only=False, encrypt=False, keyring=None,
+                        incremental=False):
         '''
         Create the final location of the backup files and move the files
         we've backed up there, optionally encrypting them.
@@ -577,6 +696,10 @@ class Backup(admintool.AdminTool):
 
         These, along with the header, are moved into a new subdirectory
         in /var/lib/ipa/backup.
+
+        In incremental mode the files are stored in a chunk store shared
+        by all incremental backups instead, and the subdirectory contains
+        a manifest describing them.
         '''
 
         if data_only:
@@ -589,24 +712,53 @@ class Backup(admintool.AdminTool):
         os.mkdir(backup_dir)
         os.chmod(backup_dir, 0o700)
 
-        os.chdir(self.dir)
+        if incremental:
+            self.store_backup(backup_dir)
+            shutil.move(self.header, backup_dir)
+            self.log.info('Backed up to %s', backup_dir)
+            return
+
+        # The exported data is read from where 389-ds wrote it, the archive
+        # is compressed and optionally encrypted as it is written.
         args = ['tar',
                 '--xattrs',
                 '--selinux',
-                '-czf',
-                filename,
+                '-cf',
+                '-',
+                '-C',
+                self.dir,
                 '.'
                ]
-        result = run(args, raiseonerr=False)
-        if result.returncode != 0:
-            raise admintool.ScriptError(
-                'tar returned non-zero code %s: %s' %
-                (result.returncode, result.error_log))
+        for dirname, name in self.exported:
+            args.extend(['-C', dirname, os.path.join('.', name)])
+        commands = [args, compress_command()]
 
         if encrypt:
             self.log.info('Encrypting %s' % filename)
-            filename = encrypt_file(filename, keyring)
+            commands.append(gpg_command(keyring) + ['-e'])
+            filename = filename + '.gpg'
+
+        self.run_pipeline(commands, filename)
 
         shutil.move(self.header, backup_dir)
 
         self.log.info('Backed up to %s', backup_dir)
+
+
+    def store_backup(self, backup_dir):
+        '''
+        Store the backup files in the chunk store and write the manifest
+        of the backup, then remove chunks no longer used by any backup.
+        '''
+        store = backupstore.ChunkStore(paths.IPA_BACKUP_STORE_DIR)
+        manifest = os.path.join(backup_dir, backupstore.MANIFEST_NAME)
+        sources = [(self.dir, name) for name in sorted(os.listdir(self.dir))]
+        sources.extend(self.exported)
+
+        self.log.info('Storing backup in %s', store.path)
+        backupstore.create_manifest(store, manifest, sources)
+
+        referenced = backupstore.referenced_chunks(paths.IPA_BACKUP_DIR)
+        removed = store.prune(referenced)
+        self.log.debug('Removed %d unused chunks from %s',
+                       removed, store.path)
@@ -17,9 +17,11 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import io
 import os
 import shutil
 import tempfile
+import threading
 import time
 import pwd
 import ldif
@@ -40,7 +42,7 @@ from ipaserver.install.dsinstance import create_ds_user
 from ipaserver.install.cainstance import create_ca_user
 from ipaserver.install.replication import (wait_for_task, ReplicationManager,
                                            get_cs_replication_manager)
-from ipaserver.install import installutils
+from ipaserver.install import backupstore, installutils
 from ipaserver.install import dsinstance, httpinstance, cainstance, krbinstance
 from ipapython import ipaldap
 import ipapython.errors
@@ -124,6 +126,66 @@ class RemoveRUVParser(ldif.LDIFParser):
         self.writer.unparse(dn, entry)
 
 
+RUV_UNIQUEID = b'ffffffff-ffffffff-ffffffff-ffffffff'
+
+
+def remove_ruv(in_file, out_file, logger, report_interval=30):
+    """
+    Copy LDIF from in_file to out_file, leaving out RUV tombstone entries.
+
+    Entries are only split at empty lines and copied unchanged; just the
+    few entries mentioning the RUV unique ID are parsed, by
+    RemoveRUVParser. Progress is logged every report_interval seconds.
+    """
+    try:
+        total = os.fstat(in_file.fileno()).st_size
+    except (AttributeError, io.UnsupportedOperation, OSError):
+        total = None
+
+    start = last_report = time.time()
+    done = 0
+    entry = []
+
+    def flush():
+        data = b''.join(entry)
+        del entry[:]
+        if RUV_UNIQUEID not in data.lower():
+            out_file.write(data)
+            return
+        parser = RemoveRUVParser(io.BytesIO(data), ldif.LDIFWriter(out_file),
+                                 logger)
+        parser.parse()
+
+    for line in in_file:
+        done += len(line)
+        entry.append(line)
+        if line.strip():
+            continue
+
+        flush()
+
+        now = time.time()
+        if now - last_report >= report_interval:
+            last_report = now
+            report_progress(logger, 'Filtered', done, total, now - start)
+
+    if entry:
+        flush()
+
+    report_progress(logger, 'Filtered', done, total, time.time() - start)
+
+
+def report_progress(logger, action, done, total, elapsed):
+    mib = 1024.0 * 1024.0
+    rate = done / mib / elapsed if elapsed > 0 else 0.0
+    if total:
+        logger.info("%s %.1f of %.1f MiB (%d%%, %.1f MiB/s)",
+                    action, done / mib, total / mib, done * 100 // total,
+                    rate)
+    else:
+        logger.info("%s %.1f MiB (%.1f MiB/s)", action, done / mib, rate)
+
+
 class Restore(admintool.AdminTool):
     command_name = 'ipa-restore'
     log_file_name = paths.IPARESTORE_LOG
@@ -391,8 +453,7 @@ class Restore(admintool.AdminTool):
 
             # Always restore the data from ldif
             # We need to restore both userRoot and ipaca.
-            for instance, backend in databases:
-                self.ldif2db(instance, backend, online=options.online)
+            self.import_ldifs(databases, online=options.online)
 
             if restore_type != 'FULL':
                 if not options.online:
@@ -513,17 +574,57 @@ class Restore(admintool.AdminTool):
                     repl.disable_agreement(host)
 
 
-    def ldif2db(self, instance, backend, online=True):
+    def import_ldifs(self, databases, online=True):
+        '''
+        Restore LDIF backups of several backends.
+
+        Each backend is filtered and imported in its own thread. Online
+        imports are separate tasks and run concurrently. Offline ldif2db
+        runs share the database environment, so they are serialized, but
+        still overlap with the filtering of the other backends.
+        '''
+        if len(databases) < 2:
+            for instance, backend in databases:
+                self.ldif2db(instance, backend, online=online)
+            return
+
+        if online:
+            # connect once before the threads use the connection
+            self.get_connection()
+            import_lock = None
+        else:
+            import_lock = threading.Lock()
+
+        failures = []
+
+        def restore(instance, backend):
+            try:
+                self.ldif2db(instance, backend, online=online,
+                             import_lock=import_lock)
+            except Exception as e:
+                failures.append(e)
+
+        threads = [threading.Thread(target=restore, args=database)
+                   for database in databases]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if failures:
+            raise failures[0]
+
+
+    def ldif2db(self, instance, backend, online=True, import_lock=None):
         '''
         Restore a LDIF backup of the data in this instance.
 
         If executed online create a task and wait for it to complete.
+
+        If import_lock is given, it is held during the import itself.
         '''
         self.log.info('Restoring from %s in %s' % (backend, instance))
 
-        cn = time.strftime('import_%Y_%m_%d_%H_%M_%S')
-        dn = DN(('cn', cn), ('cn', 'import'), ('cn', 'tasks'), ('cn', 'config'))
-
         ldifdir = paths.SLAPD_INSTANCE_LDIF_DIR_TEMPLATE % instance
         ldifname = '%s-%s.ldif' % (instance, backend)
         ldiffile = os.path.join(ldifdir, ldifname)
@@ -537,12 +638,25 @@ class Restore(admintool.AdminTool):
 
         ipautil.backup_file(ldiffile)
         with open(ldiffile, 'wb') as out_file:
-            ldif_writer = ldif.LDIFWriter(out_file)
             with open(srcldiffile, 'rb') as in_file:
-                ldif_parser = RemoveRUVParser(in_file, ldif_writer, self.log)
-                ldif_parser.parse()
+                remove_ruv(in_file, out_file, self.log)
+
+        if import_lock is not None:
+            with import_lock:
+                self.__import_ldif(instance, backend, ldiffile, online)
+        else:
+            self.__import_ldif(instance, backend, ldiffile, online)
+
+
+    def __import_ldif(self, instance, backend, ldiffile, online):
+        start = time.time()
+        size = os.path.getsize(ldiffile)
 
         if online:
+            cn = time.strftime('import_%Y_%m_%d_%H_%M_%S')
+            cn = '%s_%s' % (cn, backend)
+            dn = DN(('cn', cn), ('cn', 'import'), ('cn', 'tasks'),
+                    ('cn', 'config'))
             conn = self.get_connection()
             ent = conn.make_entry(
                 dn,
@@ -576,6 +690,10 @@ class Restore(admintool.AdminTool):
             result = run(args, raiseonerr=False)
             if result.returncode != 0:
                 self.log.critical("ldif2db failed: %s" % result.error_log)
+                return
+
+        report_progress(self.log, 'Imported %s:' % backend, size, size,
+                        time.time() - start)
 
 
     def bak2db(self, instance, backend, online=True):
@@ -642,10 +760,12 @@ class Restore(admintool.AdminTool):
         '''
         cwd = os.getcwd()
         os.chdir(self.dir)
+        # files.tar is uncompressed in incremental backups, let tar
+        # detect the compression
         args = ['tar',
                 '--xattrs',
                 '--selinux',
-                '-xzf',
+                '-xf',
                 os.path.join(self.dir, 'files.tar'),
                 paths.IPA_DEFAULT_CONF[1:],
                ]
@@ -689,7 +809,7 @@ class Restore(admintool.AdminTool):
         args = ['tar',
                 '--xattrs',
                 '--selinux',
-                '-xzf',
+                '-xf',
                 os.path.join(self.dir, 'files.tar')
                ]
         if nologs:
@@ -724,8 +844,24 @@ class Restore(admintool.AdminTool):
         '''
         Extract the contents of the tarball backup into a temporary location,
         decrypting if necessary.
+
+        Incremental backups are rebuilt from their manifest instead.
         '''
 
+        manifest = os.path.join(self.backup_dir, backupstore.MANIFEST_NAME)
+        if os.path.exists(manifest):
+            self.log.info('Rebuilding backup from %s', manifest)
+            try:
+                backupstore.extract_manifest(manifest, self.dir)
+            except (IOError, OSError, ValueError) as e:
+                raise admintool.ScriptError(
+                    'Unable to rebuild backup from %s: %s' % (manifest, e))
+
+            pent = pwd.getpwnam(constants.DS_USER)
+            os.chown(self.top_dir, pent.pw_uid, pent.pw_gid)
+            recursive_chown(self.dir, pent.pw_uid, pent.pw_gid)
+            return
+
         encrypt = False
         filename = None
         if self.backup_type == 'FULL':
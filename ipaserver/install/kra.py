@@ -122,7 +122,9 @@ def install(api, replica_config, options):
         kra.enable_client_auth_to_db(paths.KRA_CS_CFG_PATH)
 
         # Restart apache for new proxy config file
-        services.knownservices.httpd.restart(capture_output=True)
+        _service.restart_manager.request(
+            'httpd',
+            lambda: services.knownservices.httpd.restart(capture_output=True))
 
 
 def uninstall(standalone):
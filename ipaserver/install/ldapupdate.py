@@ -23,6 +23,7 @@
 # save undo files?
 
 import base64
+import hashlib
 import sys
 import uuid
 import platform
@@ -34,7 +35,7 @@ import fnmatch
 import ldap
 import six
 
-from ipaserver.install import installutils
+from ipaserver.install import installutils, sysupgrade
 from ipapython import ipautil, ipaldap
 from ipalib import errors
 from ipalib import api, create_api
@@ -48,6 +49,12 @@ if six.PY3:
 
 UPDATES_DIR=paths.UPDATES_DIR
 UPDATE_SEARCH_TIME_LIMIT = 30  # seconds
+# attributes read from the entries to update
+UPDATE_ENTRY_ATTRS = ["*", "aci", "attributeTypes", "objectClasses"]
+# maximum number of entries read by a single prefetch search
+UPDATE_PREFETCH_BATCH_SIZE = 100
+# sysupgrade state module recording applied update files
+UPDATE_STATE_MODULE = 'ldapupdate'
 
 
 def connect(ldapi=False, realm=None, fqdn=None, dm_password=None):
@@ -77,6 +84,12 @@ def connect(ldapi=False, realm=None, fqdn=None, dm_password=None):
     return conn
 
 
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return value.encode('utf-8')
+
+
 class BadSyntax(installutils.ScriptError):
     def __init__(self, value):
         self.value = value
@@ -251,10 +264,14 @@ class LDAPUpdate(object):
 
         '''
         log_mgr.get_logger(self, True)
+        # count the errors, they are logged but not fatal to the update
+        self.error = self._count_error
+        self.error_count = 0
         self.sub_dict = sub_dict
         self.dm_password = dm_password
         self.conn = None
         self.modified = False
+        self._entry_cache = {}
         self.online = online
         self.ldapi = ldapi
         self.pw_name = pwd.getpwuid(os.geteuid()).pw_name
@@ -627,11 +644,111 @@ class LDAPUpdate(object):
            The return type is ipaldap.LDAPEntry
         """
         assert isinstance(dn, DN)
+        try:
+            entry = self._entry_cache.pop(dn)
+        except KeyError:
+            pass
+        else:
+            if entry is None:
+                raise errors.NotFound(reason=u'%s: entry not found' % dn)
+            return [entry]
+
         searchfilter="objectclass=*"
-        sattrs = ["*", "aci", "attributeTypes", "objectClasses"]
         scope = ldap.SCOPE_BASE
 
-        return self.conn.get_entries(dn, scope, searchfilter, sattrs)
+        return self.conn.get_entries(dn, scope, searchfilter,
+                                     UPDATE_ENTRY_ATTRS)
+
+    def _prefetch_entries(self, dns):
+        """Read entries in batched one-level searches, one per container.
+
+        Returns a dictionary of the entries found keyed by DN. Entries
+        which cannot be found this way (e.g. LDAP subentries or entries
+        with a multi-valued RDN) are missing from the result.
+        """
+        by_parent = {}
+        for dn in dns:
+            if len(dn) < 2 or len(dn[0]) != 1:
+                continue
+            by_parent.setdefault(dn[1:], []).append(dn)
+
+        entries = {}
+        for parent, children in by_parent.items():
+            wanted = set(children)
+            for i in range(0, len(children), UPDATE_PREFETCH_BATCH_SIZE):
+                batch = children[i:i + UPDATE_PREFETCH_BATCH_SIZE]
+                searchfilter = self.conn.combine_filters(
+                    [self.conn.make_filter_from_attr(dn[0].attr, dn[0].value)
+                     for dn in batch],
+                    self.conn.MATCH_ANY)
+                try:
+                    result = self.conn.get_entries(
+                        parent, ldap.SCOPE_ONELEVEL, searchfilter,
+                        UPDATE_ENTRY_ATTRS)
+                except errors.NotFound:
+                    continue
+                except errors.DatabaseError as e:
+                    self.debug("Prefetch of entries in %s failed: %s",
+                               parent, e)
+                    continue
+                for entry in result:
+                    if entry.dn in wanted:
+                        entries[entry.dn] = entry
+
+        return entries
+
+    def _read_entries(self, dns):
+        """Read the entries with the given DNs.
+
+        Returns a dictionary keyed by DN, the value is None for entries
+        which do not exist.
+        """
+        entries = self._prefetch_entries(dns)
+        for dn in dns:
+            if dn in entries:
+                continue
+            try:
+                entries[dn] = self.conn.get_entries(
+                    dn, ldap.SCOPE_BASE, "objectclass=*",
+                    UPDATE_ENTRY_ATTRS)[0]
+            except (errors.NotFound, errors.DatabaseError):
+                entries[dn] = None
+        return entries
+
+    def _entries_state(self, all_updates, entries):
+        """Compute a digest of the attributes touched by the updates
+           in the given entries.
+        """
+        digest = hashlib.sha256()
+        for update in all_updates:
+            dn = update['dn']
+            digest.update(_to_bytes(u'dn: %s\n' % dn))
+            entry = entries.get(dn)
+            if entry is None:
+                continue
+            attrs = set(
+                item['attr'].lower()
+                for item in update.get('default', []) + update.get('updates',
+                                                                   []))
+            for attr in sorted(attrs):
+                for value in sorted(entry.raw.get(attr, [])):
+                    digest.update(_to_bytes(u'%s:%d:' % (attr, len(value))))
+                    digest.update(value)
+        return digest.hexdigest()
+
+    def _file_digest(self, data):
+        """Compute a digest of an update file content together with the
+           values substituted in it.
+        """
+        digest = hashlib.sha256()
+        for line in data:
+            digest.update(_to_bytes(line))
+        text = ''.join(data)
+        for key in sorted(self.sub_dict):
+            if '$%s' % key in text or '${%s}' % key in text:
+                digest.update(_to_bytes(
+                    u'%s=%s\n' % (key, self.sub_dict[key])))
+        return digest.hexdigest()
 
     def _apply_update_disposition(self, updates, entry):
         """
@@ -832,6 +949,7 @@ class LDAPUpdate(object):
         """
 
         dn = updates['dn']
+        self._entry_cache.pop(dn, None)
         try:
             self.debug("Deleting entry %s", dn)
             self.conn.delete_entry(dn)
@@ -860,7 +978,9 @@ class LDAPUpdate(object):
         if updates:
             self._run_updates(updates)
         # restart may be required even if no updates were returned
-        # from plugin, plugin may change LDAP data directly
+        # from plugin, plugin may change LDAP data directly. The restart is
+        # done right away, the updates which follow may rely on the
+        # configuration loaded by the directory server at startup.
         if restart_ds:
             self.close_connection()
             self.restart_ds()
@@ -875,6 +995,10 @@ class LDAPUpdate(object):
         else:
             raise RuntimeError("Offline updates are not supported.")
 
+    def _count_error(self, msg, *args, **kwargs):
+        self.error_count += 1
+        self.log.error(msg, *args, **kwargs)
+
     def _run_updates(self, all_updates):
         for update in all_updates:
             if 'deleteentry' in update:
@@ -884,9 +1008,64 @@ class LDAPUpdate(object):
             else:
                 self._update_record(update)
 
-    def update(self, files, ordered=True):
+    def _update_file(self, filename, data, all_updates):
+        """Apply the updates parsed from an update file unless neither the
+           file nor the entries it targets changed since it was last applied.
+
+           A digest of the file and of the resulting state of its target
+           entries is recorded in the sysupgrade state file, provided the
+           updates were applied without errors.
+        """
+        if any('plugin' in update for update in all_updates):
+            # plugins may change anything, always run them
+            self._run_updates(all_updates)
+            return
+
+        dns = []
+        for update in all_updates:
+            if update['dn'] not in dns:
+                dns.append(update['dn'])
+
+        file_digest = self._file_digest(data)
+        entries = self._read_entries(dns)
+        state = '%s:%s' % (file_digest,
+                           self._entries_state(all_updates, entries))
+        if sysupgrade.get_upgrade_state(UPDATE_STATE_MODULE,
+                                        filename) == state:
+            self.debug("Update file '%s' is already applied, skipping",
+                       filename)
+            return
+
+        modified = self.modified
+        self.modified = False
+        error_count = self.error_count
+        self._entry_cache = entries
+        try:
+            self._run_updates(all_updates)
+        finally:
+            self._entry_cache = {}
+        if self.modified:
+            entries = self._read_entries(dns)
+            state = '%s:%s' % (file_digest,
+                               self._entries_state(all_updates, entries))
+        self.modified = self.modified or modified
+
+        if self.error_count != error_count:
+            # a failed update may leave the target entries as they were,
+            # apply the file again next time
+            self.debug("Update file '%s' was not applied cleanly",
+                       filename)
+            sysupgrade.remove_upgrade_state(UPDATE_STATE_MODULE, filename)
+            return
+
+        sysupgrade.set_upgrade_state(UPDATE_STATE_MODULE, filename, state)
+
+    def update(self, files, ordered=True, skip_unchanged=False):
         """Execute the update. files is a list of the update files to use.
         :param ordered: Update files are executed in alphabetical order
+        :param skip_unchanged: Skip update files which did not change since
+            they were last applied, provided their target entries did not
+            change either
 
         returns True if anything was changed, otherwise False
         """
@@ -908,7 +1087,10 @@ class LDAPUpdate(object):
                     raise RuntimeError(e)
 
                 self.parse_update_file(f, data, all_updates)
-                self._run_updates(all_updates)
+                if skip_unchanged and f != '-':
+                    self._update_file(f, data, all_updates)
+                else:
+                    self._run_updates(all_updates)
                 all_updates = []
         finally:
             self.close_connection()
@@ -360,6 +360,10 @@ class update_managed_permissions(Updater):
         else:
             self.log.debug('Anonymous ACI not found')
 
+        # ACIs to update, collected for all permissions and applied with
+        # a single modification of each entry
+        acis = {}
+
         current_obj = ()  # initially distinct from any obj value, even None
         for name, template, obj in self.get_templates():
             if current_obj != obj:
@@ -374,7 +378,10 @@ class update_managed_permissions(Updater):
                                     obj,
                                     unicode(name),
                                     template,
-                                    anonymous_read_aci)
+                                    anonymous_read_aci,
+                                    acis)
+
+        self.update_acis(ldap, acis)
 
         if anonymous_read_aci:
             self.remove_anonymous_read_aci(ldap, anonymous_read_aci)
@@ -392,8 +399,13 @@ class update_managed_permissions(Updater):
 
         return False, ()
 
-    def update_permission(self, ldap, obj, name, template, anonymous_read_aci):
-        """Update the given permission and the corresponding ACI"""
+    def update_permission(self, ldap, obj, name, template, anonymous_read_aci,
+                          acis):
+        """Update the given permission and the corresponding ACI
+
+        The ACI is not written directly but recorded in ``acis``,
+        see update_acis().
+        """
         assert name.startswith('System:')
 
         dn = self.api.Object[permission].get_dn(name)
@@ -477,7 +489,10 @@ class update_managed_permissions(Updater):
 
         if update_aci:
             self.log.debug('Updating ACI for managed permission: %s', name)
-            permission_plugin.update_aci(entry)
+            location = entry.single_value.get('ipapermlocation',
+                                              self.api.env.basedn)
+            acis.setdefault(location, {})[u'permission:%s' % name] = (
+                permission_plugin.make_aci(entry))
 
         if remove_legacy:
             self.log.debug("Removing legacy permission '%s'", legacy_name)
@@ -498,6 +513,37 @@ class update_managed_permissions(Updater):
                 else:
                     self.log.debug("Ignoring V2 permission '%s'", name)
 
+    def update_acis(self, ldap, acis):
+        """Replace ACIs of managed permissions, one entry at a time
+
+        :param acis: dict mapping the DN of each ACI location to a dict
+            mapping ACI names to the new ACI strings
+        """
+        for location, new_acis in sorted(acis.items()):
+            entry = ldap.get_entry(location, ['aci'])
+
+            acistrings = []
+            for acistring in entry.get('aci', []):
+                try:
+                    name = ACI(acistring).name
+                except SyntaxError as e:
+                    self.log.warning('Unparseable ACI %s: %s (at %s)',
+                                     acistring, e, location)
+                else:
+                    if name in new_acis:
+                        continue
+                acistrings.append(acistring)
+            acistrings.extend(acistring for _name, acistring
+                              in sorted(new_acis.items()))
+
+            self.log.debug('Updating %d managed permission ACIs in %s',
+                           len(new_acis), location)
+            entry['aci'] = acistrings
+            try:
+                ldap.update_entry(entry)
+            except errors.EmptyModlist:
+                self.log.debug('No changes to ACIs in %s', location)
+
     def get_upgrade_attr_lists(self, current_acistring, default_acistrings):
         """Compute included and excluded attributes for a new permission
 
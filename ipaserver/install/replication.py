@@ -54,6 +54,18 @@ REPL_MANAGERS_CN = DN(('cn', 'replication managers'))
 IPA_REPLICA = 1
 WINSYNC = 2
 
+REPL_INIT_ATTRS = ['cn', 'nsds5BeginReplicaRefresh',
+                   'nsds5replicaUpdateInProgress',
+                   'nsds5ReplicaLastInitStatus',
+                   'nsds5ReplicaLastInitStart',
+                   'nsds5ReplicaLastInitEnd']
+REPL_UPDATE_ATTRS = ['cn', 'nsds5replicaUpdateInProgress',
+                     'nsds5ReplicaLastUpdateStatus',
+                     'nsds5ReplicaLastUpdateStart',
+                     'nsds5ReplicaLastUpdateEnd']
+
+_missing = object()
+
 # List of attributes that need to be excluded from replication initialization.
 TOTAL_EXCLUDES = ('entryusn',
                  'krblastsuccessfulauth',
@@ -135,59 +147,72 @@ def enable_replication_version_checking(realm, dirman_passwd):
         conn.unbind()
 
 
-def wait_for_task(conn, dn):
+def wait_for_task(conn, dn, timeout=None, progress=None):
     """Check task status
 
     Task is complete when the nsTaskExitCode attr is set.
 
+    :param timeout: maximal number of seconds to wait, unlimited if None
+    :param progress: callable called with the task entry whenever it changes
     :return: the task's return code
     """
     assert isinstance(dn, DN)
     attrlist = [
         'nsTaskLog', 'nsTaskStatus', 'nsTaskExitCode', 'nsTaskCurrentItem',
         'nsTaskTotalItems']
-    while True:
-        entry = conn.get_entry(dn, attrlist)
-        if entry.single_value.get('nsTaskExitCode'):
-            exit_code = int(entry.single_value['nsTaskExitCode'])
-            break
-        time.sleep(1)
-    return exit_code
+
+    def log_progress(entry):
+        if entry is not None:
+            root_logger.debug(
+                "Task %s: %s/%s %s", dn,
+                entry.single_value.get('nsTaskCurrentItem'),
+                entry.single_value.get('nsTaskTotalItems'),
+                entry.single_value.get('nsTaskStatus', ''))
+        if progress is not None:
+            progress(entry)
+
+    def task_done(entry):
+        if entry is None:
+            raise errors.NotFound(reason="Task %s not found" % dn)
+        return bool(entry.single_value.get('nsTaskExitCode'))
+
+    entry = conn.wait_for_entry(dn, task_done, attrlist, timeout=timeout,
+                                progress=log_progress)
+    return int(entry.single_value['nsTaskExitCode'])
 
 
 def wait_for_entry(connection, dn, timeout=7200, attr='', quiet=True):
     """Wait for entry and/or attr to show up"""
 
-    filter = "(objectclass=*)"
     attrlist = []
     if attr:
-        filter = "(%s=*)" % attr
         attrlist.append(attr)
-    timeout += int(time.time())
 
     if not quiet:
         sys.stdout.write("Waiting for %s %s:%s " % (connection, dn, attr))
         sys.stdout.flush()
-    entry = None
-    while not entry and int(time.time()) < timeout:
-        try:
-            [entry] = connection.get_entries(
-                dn, ldap.SCOPE_BASE, filter, attrlist)
-        except errors.NotFound:
-            pass  # no entry yet
-        except Exception as e:  # badness
-            root_logger.error("Error reading entry %s: %s", dn, e)
-            break
-        if not entry:
-            if not quiet:
-                sys.stdout.write(".")
-                sys.stdout.flush()
-            time.sleep(1)
 
-    if not entry and int(time.time()) > timeout:
+    def show_progress(entry):
+        if not quiet:
+            sys.stdout.write(".")
+            sys.stdout.flush()
+
+    def entry_present(entry):
+        return entry is not None and (not attr or attr in entry)
+
+    entry = None
+    try:
+        entry = connection.wait_for_entry(
+            dn, entry_present, attrlist, timeout=timeout,
+            progress=show_progress)
+    except errors.DatabaseTimeout:
         root_logger.error(
             "wait_for_entry timeout for %s for %s", connection, dn)
-    elif entry and not quiet:
+        return
+    except Exception as e:  # badness
+        root_logger.error("Error reading entry %s: %s", dn, e)
+
+    if entry and not quiet:
         root_logger.error("The waited for entry is: %s", entry)
     elif not entry:
         root_logger.error(
@@ -893,15 +918,11 @@ class ReplicationManager(object):
         except Exception as e:
             root_logger.debug("Failed to remove referral value: %s" % str(e))
 
-    def check_repl_init(self, conn, agmtdn, start):
+    def check_repl_init(self, conn, agmtdn, start, entry=_missing):
         done = False
         hasError = 0
-        attrlist = ['cn', 'nsds5BeginReplicaRefresh',
-                    'nsds5replicaUpdateInProgress',
-                    'nsds5ReplicaLastInitStatus',
-                    'nsds5ReplicaLastInitStart',
-                    'nsds5ReplicaLastInitEnd']
-        entry = conn.get_entry(agmtdn, attrlist)
+        if entry is _missing:
+            entry = conn.get_entry(agmtdn, REPL_INIT_ATTRS)
         if not entry:
             print("Error reading status from agreement", agmtdn)
             hasError = 1
@@ -936,14 +957,12 @@ class ReplicationManager(object):
 
         return done, hasError
 
-    def check_repl_update(self, conn, agmtdn):
+    def check_repl_update(self, conn, agmtdn, entry=_missing):
         done = False
         hasError = 0
         error_message = ''
-        attrlist = ['cn', 'nsds5replicaUpdateInProgress',
-                    'nsds5ReplicaLastUpdateStatus', 'nsds5ReplicaLastUpdateStart',
-                    'nsds5ReplicaLastUpdateEnd']
-        entry = conn.get_entry(agmtdn, attrlist)
+        if entry is _missing:
+            entry = conn.get_entry(agmtdn, REPL_UPDATE_ATTRS)
         if not entry:
             print("Error reading status from agreement", agmtdn)
             hasError = 1
@@ -973,28 +992,51 @@ class ReplicationManager(object):
 
         return done, hasError, error_message
 
-    def wait_for_repl_init(self, conn, agmtdn):
-        done = False
-        haserror = 0
+    def wait_for_repl_init(self, conn, agmtdn, timeout=None):
         start = datetime.datetime.now()
-        while not done and not haserror:
-            time.sleep(1)  # give it a few seconds to get going
-            done, haserror = self.check_repl_init(conn, agmtdn, start)
+        state = {}
+
+        def init_done(entry):
+            done, state['haserror'] = self.check_repl_init(
+                conn, agmtdn, start, entry)
+            return done or state['haserror']
+
+        # the status of the agreement is computed when it is read, poll it
+        # every second to keep the elapsed time up to date
+        try:
+            conn.wait_for_entry(agmtdn, init_done, REPL_INIT_ATTRS,
+                                timeout=timeout, poll_interval=1,
+                                max_poll_interval=1, persistent=False)
+        except errors.DatabaseTimeout:
+            print("\nError: timeout: replication initialization did not "
+                  "finish")
+            state['haserror'] = 1
         print("")
-        return haserror
+        return state['haserror']
 
     def wait_for_repl_update(self, conn, agmtdn, maxtries=600):
-        done = False
-        haserror = 0
-        error_message = ''
-        while not done and not haserror and maxtries > 0:
-            time.sleep(1)  # give it a few seconds to get going
-            done, haserror, error_message = self.check_repl_update(conn, agmtdn)
-            maxtries -= 1
-        if maxtries == 0: # too many tries
+        """
+        Wait for an incremental update of the agreement to finish.
+
+        maxtries is the maximal number of seconds to wait.
+        """
+        state = {'haserror': 0, 'error_message': ''}
+        time.sleep(1)  # give it a second to get going
+
+        def update_done(entry):
+            done, state['haserror'], state['error_message'] = (
+                self.check_repl_update(conn, agmtdn, entry))
+            return done or state['haserror']
+
+        # the status of the agreement is computed when it is read
+        try:
+            conn.wait_for_entry(agmtdn, update_done, REPL_UPDATE_ATTRS,
+                                timeout=maxtries, poll_interval=1,
+                                max_poll_interval=1, persistent=False)
+        except errors.DatabaseTimeout:
             print("Error: timeout: could not determine agreement status: please check your directory server logs for possible errors")
-            haserror = 1
-        return haserror, error_message
+            state['haserror'] = 1
+        return state['haserror'], state['error_message']
 
     def start_replication(self, conn, hostname=None, master=None):
         print("Starting replication, please wait until this has completed.")
@@ -817,43 +817,50 @@ def install(installer):
     custodia = custodiainstance.CustodiaInstance(host_name, realm_name)
     custodia.create_instance()
 
-    # Create a HTTP instance
-    http = httpinstance.HTTPInstance(fstore)
-    if options.http_cert_files:
-        http.create_instance(
-            realm_name, host_name, domain_name,
-            pkcs12_info=http_pkcs12_info, subject_base=options.subject_base,
-            auto_redirect=not options.no_ui_redirect,
-            ca_is_configured=setup_ca)
-    else:
-        http.create_instance(
-            realm_name, host_name, domain_name,
-            subject_base=options.subject_base,
-            auto_redirect=not options.no_ui_redirect,
-            ca_is_configured=setup_ca)
-    tasks.restore_context(paths.CACHE_IPA_SESSIONS)
-
-    ca.set_subject_base_in_config(options.subject_base)
-
-    # Apply any LDAP updates. Needs to be done after the configuration file
-    # is created. DS is restarted in the process.
-    service.print_msg("Applying LDAP updates")
-    ds.apply_updates()
-
-    # Restart krb after configurations have been changed
-    service.print_msg("Restarting the KDC")
-    krb.restart()
-
-    if options.setup_dns:
-        dns.install(False, False, options)
-    else:
-        # Create a BIND instance
-        bind = bindinstance.BindInstance(fstore)
-        bind.setup(host_name, ip_addresses, realm_name,
-                   domain_name, (), 'first', (),
-                   zonemgr=options.zonemgr,
-                   no_dnssec_validation=options.no_dnssec_validation)
-        bind.create_file_with_system_records()
+    # httpd is restarted once at the end of this phase rather than by the
+    # HTTP instance and the DNS setup, which both change its configuration.
+    # Nothing in the phase talks to httpd. Other services, including the
+    # directory server restarted by the LDAP updates, are restarted
+    # immediately.
+    with service.restart_manager.deferred('httpd'):
+        # Create a HTTP instance
+        http = httpinstance.HTTPInstance(fstore)
+        if options.http_cert_files:
+            http.create_instance(
+                realm_name, host_name, domain_name,
+                pkcs12_info=http_pkcs12_info,
+                subject_base=options.subject_base,
+                auto_redirect=not options.no_ui_redirect,
+                ca_is_configured=setup_ca)
+        else:
+            http.create_instance(
+                realm_name, host_name, domain_name,
+                subject_base=options.subject_base,
+                auto_redirect=not options.no_ui_redirect,
+                ca_is_configured=setup_ca)
+        tasks.restore_context(paths.CACHE_IPA_SESSIONS)
+
+        ca.set_subject_base_in_config(options.subject_base)
+
+        # Apply any LDAP updates. Needs to be done after the configuration
+        # file is created. DS is restarted in the process.
+        service.print_msg("Applying LDAP updates")
+        ds.apply_updates()
+
+        # Restart krb after configurations have been changed
+        service.print_msg("Restarting the KDC")
+        krb.restart()
+
+        if options.setup_dns:
+            dns.install(False, False, options)
+        else:
+            # Create a BIND instance
+            bind = bindinstance.BindInstance(fstore)
+            bind.setup(host_name, ip_addresses, realm_name,
+                       domain_name, (), 'first', (),
+                       zonemgr=options.zonemgr,
+                       no_dnssec_validation=options.no_dnssec_validation)
+            bind.create_file_with_system_records()
 
     # Set the admin user kerberos password
     ds.change_admin_password(admin_password)
@@ -1428,51 +1428,58 @@ def install(installer):
     print("Restarting directory server to enable password extension plugin")
     ds.restart()
 
-    install_http(
-        config,
-        auto_redirect=not options.no_ui_redirect,
-        promote=promote,
-        pkcs12_info=http_pkcs12_info,
-        ca_is_configured=ca_enabled,
-        ca_file=cafile)
-
-    otpd = otpdinstance.OtpdInstance()
-    otpd.create_instance('OTPD', config.host_name,
-                         ipautil.realm_to_suffix(config.realm_name))
-
-    custodia = custodiainstance.CustodiaInstance(config.host_name,
-                                                 config.realm_name)
-    if promote:
-        custodia.create_replica(config.master_host_name)
-    else:
-        custodia.create_instance()
+    # httpd is restarted once the CA is configured rather than by each
+    # service which changes its configuration. The KRA installation needs
+    # the proxy to the CA set up by the restart. Other services are
+    # restarted immediately.
+    with service.restart_manager.deferred('httpd'):
+        install_http(
+            config,
+            auto_redirect=not options.no_ui_redirect,
+            promote=promote,
+            pkcs12_info=http_pkcs12_info,
+            ca_is_configured=ca_enabled,
+            ca_file=cafile)
+
+        otpd = otpdinstance.OtpdInstance()
+        otpd.create_instance('OTPD', config.host_name,
+                             ipautil.realm_to_suffix(config.realm_name))
+
+        custodia = custodiainstance.CustodiaInstance(config.host_name,
+                                                     config.realm_name)
+        if promote:
+            custodia.create_replica(config.master_host_name)
+        else:
+            custodia.create_instance()
 
-    if ca_enabled:
-        options.realm_name = config.realm_name
-        options.domain_name = config.domain_name
-        options.host_name = config.host_name
-        options.dm_password = config.dirman_password
-        ca.install(False, config, options)
+        if ca_enabled:
+            options.realm_name = config.realm_name
+            options.domain_name = config.domain_name
+            options.host_name = config.host_name
+            options.dm_password = config.dirman_password
+            ca.install(False, config, options)
 
     # Apply any LDAP updates. Needs to be done after the replica is synced-up
     service.print_msg("Applying LDAP updates")
     ds.apply_updates()
 
-    if kra_enabled:
-        kra.install(api, config, options)
+    # second phase, httpd is restarted once after the KRA and DNS setup
+    with service.restart_manager.deferred('httpd'):
+        if kra_enabled:
+            kra.install(api, config, options)
 
-    service.print_msg("Restarting the KDC")
-    krb.restart()
+        service.print_msg("Restarting the KDC")
+        krb.restart()
 
-    if promote:
-        custodia.import_dm_password(config.master_host_name)
-        promote_sssd(config.host_name)
-        promote_openldap_conf(config.host_name, config.master_host_name)
+        if promote:
+            custodia.import_dm_password(config.master_host_name)
+            promote_sssd(config.host_name)
+            promote_openldap_conf(config.host_name, config.master_host_name)
 
-    if options.setup_dns:
-        dns.install(False, True, options, api)
-    else:
-        api.Command.dns_update_system_records()
+        if options.setup_dns:
+            dns.install(False, True, options, api)
+        else:
+            api.Command.dns_update_system_records()
     api.Backend.ldap2.disconnect()
 
     if not promote:
@@ -43,6 +43,7 @@ from ipaserver.install import otpdinstance
 from ipaserver.install import schemaupdate
 from ipaserver.install import custodiainstance
 from ipaserver.install import sysupgrade
+from ipaserver.install import upgradesteps
 from ipaserver.install import dnskeysyncinstance
 from ipaserver.install import krainstance
 from ipaserver.install import dogtaginstance
@@ -1683,25 +1684,7 @@ def upgrade_configuration():
 
     add_ca_dns_records()
 
-    # Any of the following functions returns True iff the named.conf file
-    # has been altered
-    named_conf_changes = (
-                          named_remove_deprecated_options(),
-                          named_set_minimum_connections(),
-                          named_update_gssapi_configuration(),
-                          named_update_pid_file(),
-                          named_enable_dnssec(),
-                          named_validate_dnssec(),
-                          named_bindkey_file_option(),
-                          named_managed_keys_dir_option(),
-                          named_root_key_include(),
-                          named_update_global_forwarder_policy(),
-                          mask_named_regular(),
-                          fix_dyndb_ldap_workdir_permissions(),
-                          named_add_server_id(),
-                         )
-
-    if any(named_conf_changes):
+    def restart_named():
         # configuration has changed, restart the name server
         root_logger.info('Changes to named.conf have been made, restart named')
         bind = bindinstance.BindInstance(fstore)
@@ -1711,25 +1694,7 @@ def upgrade_configuration():
         except ipautil.CalledProcessError as e:
             root_logger.error("Failed to restart %s: %s", bind.service_name, e)
 
-    if bind_started:
-        bind.stop()
-
-    custodia = custodiainstance.CustodiaInstance(api.env.host, api.env.realm)
-    custodia.upgrade_instance()
-
-    ca_restart = any([
-        ca_restart,
-        ca_upgrade_schema(ca),
-        upgrade_ca_audit_cert_validity(ca),
-        certificate_renewal_update(ca, ds, http),
-        ca_enable_pkix(ca),
-        ca_configure_profiles_acl(ca),
-        ca_configure_lightweight_ca_acls(ca),
-        ca_ensure_lightweight_cas_container(ca),
-        ca_add_default_ocsp_uri(ca),
-    ])
-
-    if ca_restart:
+    def restart_ca():
         root_logger.info(
             'pki-tomcat configuration changed, restart pki-tomcat')
         try:
@@ -1737,6 +1702,70 @@ def upgrade_configuration():
         except ipautil.CalledProcessError as e:
             root_logger.error("Failed to restart %s: %s", ca.service_name, e)
 
+    custodia = custodiainstance.CustodiaInstance(api.env.host, api.env.realm)
+
+    steps = upgradesteps.UpgradeScheduler(
+        restart_callbacks={
+            'named': restart_named,
+            'pki-tomcatd': restart_ca,
+        },
+        ldap2=api.Backend.ldap2)
+
+    # Any of the following functions returns True iff the named.conf file
+    # has been altered
+    for step in (named_remove_deprecated_options,
+                 named_set_minimum_connections,
+                 named_update_gssapi_configuration,
+                 named_update_pid_file,
+                 named_enable_dnssec,
+                 named_validate_dnssec,
+                 named_bindkey_file_option,
+                 named_managed_keys_dir_option,
+                 named_root_key_include,
+                 named_update_global_forwarder_policy,
+                 mask_named_regular,
+                 fix_dyndb_ldap_workdir_permissions,
+                 named_add_server_id):
+        steps.add(step.__name__, step, writes=['named'], restarts=['named'])
+
+    steps.add('custodia_upgrade_instance', custodia.upgrade_instance,
+              writes=['custodia'])
+
+    # Any of the following functions returns True iff pki-tomcat has to be
+    # restarted
+    if ca_restart:
+        steps.request_restart('pki-tomcatd')
+    steps.add('ca_upgrade_schema', lambda: ca_upgrade_schema(ca),
+              writes=['ca-schema'], restarts=['pki-tomcatd'])
+    steps.add('upgrade_ca_audit_cert_validity',
+              lambda: upgrade_ca_audit_cert_validity(ca),
+              writes=['CS.cfg'], restarts=['pki-tomcatd'])
+    steps.add('certificate_renewal_update',
+              lambda: certificate_renewal_update(ca, ds, http),
+              reads=['CS.cfg'], writes=['certmonger'],
+              restarts=['pki-tomcatd'])
+    steps.add('ca_enable_pkix', lambda: ca_enable_pkix(ca),
+              writes=['CS.cfg'], restarts=['pki-tomcatd'])
+    steps.add('ca_configure_profiles_acl',
+              lambda: ca_configure_profiles_acl(ca),
+              reads=['ca-schema'], writes=['ca-acls'],
+              restarts=['pki-tomcatd'])
+    steps.add('ca_configure_lightweight_ca_acls',
+              lambda: ca_configure_lightweight_ca_acls(ca),
+              reads=['ca-schema'], writes=['ca-acls'],
+              restarts=['pki-tomcatd'])
+    steps.add('ca_ensure_lightweight_cas_container',
+              lambda: ca_ensure_lightweight_cas_container(ca),
+              reads=['ca-schema'], writes=['ca-lightweight-cas'],
+              restarts=['pki-tomcatd'])
+    steps.add('ca_add_default_ocsp_uri', lambda: ca_add_default_ocsp_uri(ca),
+              writes=['CS.cfg'], restarts=['pki-tomcatd'])
+
+    steps.run()
+
+    if bind_started:
+        bind.stop()
+
     ca_enable_ldap_profile_subsystem(ca)
 
     # This step MUST be done after ca_enable_ldap_profile_subsystem and
@@ -24,6 +24,8 @@ import socket
 import datetime
 import traceback
 import tempfile
+from collections import OrderedDict
+from contextlib import contextmanager
 
 import six
 
@@ -59,6 +61,85 @@ SERVICE_LIST = {
     'DNSKeySync': ('ipa-dnskeysyncd', 110),
 }
 
+
+class RestartManager(object):
+    """
+    Defer restarts of services to a barrier.
+
+    Within a ``deferred(*names)`` block, restarts of the named services
+    requested with ``request()`` are recorded rather than performed, and
+    repeated requests for the same service are coalesced. The pending
+    restarts are performed in the order they were first requested when the
+    outermost block exits, which is the barrier. Restarts of other services,
+    and all restarts outside of a block, are performed immediately.
+    """
+    def __init__(self):
+        self.deferring = False
+        self.names = set()
+        self.pending = OrderedDict()
+
+    def is_deferred(self, name):
+        """
+        Return True if a restart of service name would be deferred
+        """
+        return self.deferring and name in self.names
+
+    def request(self, name, restart):
+        """
+        Restart service name by calling restart, now or at the barrier.
+        """
+        if not self.is_deferred(name):
+            restart()
+            return
+        if name in self.pending:
+            root_logger.debug("Restart of %s is already pending", name)
+        else:
+            root_logger.debug("Deferring restart of %s", name)
+        self.pending[name] = restart
+
+    def barrier(self):
+        """
+        Perform the pending restarts.
+        """
+        while self.pending:
+            name, restart = self.pending.popitem(last=False)
+            root_logger.debug("Performing deferred restart of %s", name)
+            restart()
+
+    @contextmanager
+    def deferred(self, *names):
+        """
+        Defer restarts of the named services until the block exits
+        """
+        if self.deferring:
+            # the outermost block performs the restarts
+            outer_names = self.names
+            self.names = outer_names | set(names)
+            try:
+                yield self
+            finally:
+                self.names = outer_names
+            return
+
+        self.deferring = True
+        self.names = set(names)
+        try:
+            yield self
+        except BaseException:
+            if self.pending:
+                root_logger.debug("Dropping deferred restarts of %s",
+                                  ', '.join(self.pending))
+                self.pending.clear()
+            raise
+        finally:
+            self.deferring = False
+            self.names = set()
+        self.barrier()
+
+
+restart_manager = RestartManager()
+
+
 def print_msg(message, output_fd=sys.stdout):
     root_logger.debug(message)
     output_fd.write(message)
@@ -322,6 +403,16 @@ class Service(object):
     def restart(self, instance_name="", capture_output=True, wait=True):
         self.service.restart(instance_name, capture_output=capture_output, wait=wait)
 
+    def request_restart(self, instance_name=""):
+        """
+        Restart the service, deferring the restart to the barrier of the
+        current phase if restarts are being deferred.
+        """
+        name = self.service_name
+        if instance_name:
+            name = '%s@%s' % (name, instance_name)
+        restart_manager.request(name, lambda: self.restart(instance_name))
+
     def is_running(self, instance_name="", wait=True):
         return self.service.is_running(instance_name, wait)
 
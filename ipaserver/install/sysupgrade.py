@@ -19,6 +19,7 @@
 
 import os
 import os.path
+import threading
 
 from ipalib.install import sysrestore
 from ipaplatform.paths import paths
@@ -27,6 +28,8 @@ from ipapython.ipa_log_manager import root_logger
 STATEFILE_FILE = 'sysupgrade.state'
 
 _sstore = None
+# upgrade steps may run concurrently
+_sstore_lock = threading.RLock()
 
 def _load_sstore():
     global _sstore
@@ -34,16 +37,19 @@ def _load_sstore():
         _sstore = sysrestore.StateFile(paths.STATEFILE_DIR, STATEFILE_FILE)
 
 def get_upgrade_state(module, state):
-    _load_sstore()
-    return _sstore.get_state(module, state)
+    with _sstore_lock:
+        _load_sstore()
+        return _sstore.get_state(module, state)
 
 def set_upgrade_state(module, state, value):
-    _load_sstore()
-    _sstore.backup_state(module, state, value)
+    with _sstore_lock:
+        _load_sstore()
+        _sstore.backup_state(module, state, value)
 
 def remove_upgrade_state(module, state):
-    _load_sstore()
-    _sstore.delete_state(module, state)
+    with _sstore_lock:
+        _load_sstore()
+        _sstore.delete_state(module, state)
 
 def remove_upgrade_file():
     try:
@@ -216,7 +216,8 @@ class IPAUpgrade(service.Service):
             ld = ldapupdate.LDAPUpdate(dm_password='', ldapi=True)
             if len(self.files) == 0:
                 self.files = ld.get_all_files(ldapupdate.UPDATES_DIR)
-            self.modified = (ld.update(self.files) or self.modified)
+            self.modified = (ld.update(self.files, skip_unchanged=True) or
+                             self.modified)
         except ldapupdate.BadSyntax as e:
             root_logger.error('Bad syntax in upgrade %s', e)
             raise
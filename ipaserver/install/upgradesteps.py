@@ -0,0 +1,174 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Scheduler of configuration upgrade steps.
+
+Each step declares the resources (configuration files, LDAP subtrees,
+services, ...) it reads and writes and the services which have to be
+restarted when it reports a change. Steps are run in the order they were
+added, except that a step may run concurrently with the steps before it
+as long as they do not conflict: a step waits for every earlier step which
+writes a resource it reads or writes, or reads a resource it writes.
+
+Restarts requested by the steps are coalesced and performed once per
+service after all the steps have finished.
+"""
+
+import threading
+import time
+
+from six.moves import queue
+
+from ipapython.ipa_log_manager import root_logger
+
+MAX_WORKERS = 4
+
+
+class UpgradeStep(object):
+    """
+    Upgrade step
+
+    :param name: name of the step used in log messages
+    :param func: callable run without arguments; a true return value
+        means the step changed something which requires the services in
+        restarts to be restarted
+    :param reads: names of resources read by the step
+    :param writes: names of resources modified by the step
+    :param restarts: names of services to restart when the step returns
+        a true value
+    """
+    def __init__(self, name, func, reads=(), writes=(), restarts=()):
+        self.name = name
+        self.func = func
+        self.reads = frozenset(reads)
+        self.writes = frozenset(writes)
+        self.restarts = tuple(restarts)
+
+    def conflicts(self, other):
+        return bool(self.writes & (other.reads | other.writes) or
+                    self.reads & other.writes)
+
+
+class UpgradeScheduler(object):
+    """
+    Run upgrade steps concurrently according to their dependencies.
+
+    :param restart_callbacks: dictionary mapping a service name to a
+        callable restarting the service
+    :param ldap2: if set, an ldap2 backend to connect in worker threads,
+        as its connection is not shared between threads
+    :param max_workers: maximum number of steps running at the same time
+    """
+    def __init__(self, restart_callbacks=None, ldap2=None,
+                 max_workers=MAX_WORKERS):
+        self.restart_callbacks = dict(restart_callbacks or {})
+        self.ldap2 = ldap2
+        self.max_workers = max_workers
+        self.steps = []
+        self.results = {}
+        self.timings = []
+        self.pending_restarts = []
+
+    def add(self, name, func, reads=(), writes=(), restarts=()):
+        self.steps.append(
+            UpgradeStep(name, func, reads=reads, writes=writes,
+                        restarts=restarts))
+
+    def request_restart(self, service):
+        if service not in self.pending_restarts:
+            self.pending_restarts.append(service)
+
+    def _dependencies(self):
+        dependencies = []
+        for i, step in enumerate(self.steps):
+            dependencies.append(set(
+                j for j, earlier in enumerate(self.steps[:i])
+                if earlier.conflicts(step)))
+        return dependencies
+
+    def _run_step(self, index, done):
+        step = self.steps[index]
+        connected = False
+        start = time.time()
+        try:
+            if self.ldap2 is not None and not self.ldap2.isconnected():
+                self.ldap2.connect()
+                connected = True
+            result = step.func()
+        except BaseException as e:
+            done.put((index, None, e, time.time() - start))
+        else:
+            done.put((index, result, None, time.time() - start))
+        finally:
+            if connected:
+                self.ldap2.disconnect()
+
+    def run(self):
+        """
+        Run all the added steps, then restart the services they asked for.
+
+        Returns a dictionary mapping step names to their return values.
+        If a step raises an exception, no further steps are started and
+        the exception is re-raised once the running steps have finished;
+        no service is restarted in that case.
+        """
+        dependencies = self._dependencies()
+        waiting = list(range(len(self.steps)))
+        finished = set()
+        running = 0
+        error = None
+        done = queue.Queue()
+
+        while waiting or running:
+            if error is None:
+                for index in list(waiting):
+                    if running >= self.max_workers:
+                        break
+                    if not dependencies[index] <= finished:
+                        continue
+                    waiting.remove(index)
+                    root_logger.debug("Starting upgrade step %s",
+                                      self.steps[index].name)
+                    t = threading.Thread(target=self._run_step,
+                                         args=(index, done))
+                    t.daemon = True
+                    t.start()
+                    running += 1
+            elif not running:
+                break
+
+            index, result, e, elapsed = done.get()
+            running -= 1
+            finished.add(index)
+            step = self.steps[index]
+            self.timings.append((step.name, elapsed))
+            root_logger.debug("Upgrade step %s finished in %.3f seconds",
+                              step.name, elapsed)
+            if e is not None:
+                root_logger.error("Upgrade step %s failed: %s", step.name, e)
+                if error is None:
+                    error = e
+                continue
+            self.results[step.name] = result
+            if result:
+                for service in step.restarts:
+                    self.request_restart(service)
+
+        if error is not None:
+            raise error
+
+        self.restart_services()
+        return self.results
+
+    def restart_services(self):
+        while self.pending_restarts:
+            service = self.pending_restarts.pop(0)
+            root_logger.debug("Restarting %s after upgrade steps", service)
+            start = time.time()
+            self.restart_callbacks[service]()
+            elapsed = time.time() - start
+            self.timings.append(('restart %s' % service, elapsed))
+            root_logger.debug("Restart of %s finished in %.3f seconds",
+                              service, elapsed)
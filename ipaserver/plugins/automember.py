@@ -16,6 +16,8 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import collections
+import re
 import uuid
 import time
 
@@ -136,6 +138,12 @@ EXAMPLES:
 """) + _("""
  Rebuild membership for specified hosts:
     ipa automember-rebuild --hosts=web1.example.com --hosts=web2.example.com
+""") + _("""
+ Show the memberships a rebuild would add, without adding them:
+    ipa automember-rebuild --type=hostgroup --dry-run
+""") + _("""
+ Add the missing memberships of all users without a rebuild task:
+    ipa automember-rebuild --type=group --no-task
 """)
 
 register = Registry()
@@ -676,6 +684,177 @@ class automember_task(Object):
     )
 
 
+class AutomemberRules(object):
+    """
+    Automember definition of a grouping type with its regex rules compiled
+    for evaluation in IPA.
+
+    Entries are evaluated the way the 389-ds Auto Membership plugin does:
+    an entry is added to the target group of every rule with a matching
+    inclusive condition, unless a rule with the same target group has a
+    matching exclusive condition, and to the default groups if no rule
+    matched. Conditions are indexed by attribute, so that each entry is
+    only tested against the conditions on attributes it has.
+    """
+    def __init__(self, ldap, grouping):
+        self.ldap = ldap
+        self.definition_dn = DN(('cn', grouping),
+                                api.env.container_automember, api.env.basedn)
+        try:
+            definition = ldap.get_entry(self.definition_dn)
+        except errors.NotFound:
+            raise errors.NotFound(
+                reason=_('Auto Membership is not configured'))
+
+        self.disabled = 'automemberdisabled' in definition
+        self.scope = DN(definition.single_value['automemberscope'])
+        self.filter = definition.single_value['automemberfilter']
+        if not self.filter.startswith('('):
+            self.filter = '(%s)' % self.filter
+        grouping_attr = definition.single_value['automembergroupingattr']
+        self.member_attr, _sep, self.member_value = grouping_attr.partition(
+            ':')
+        self.default_groups = [
+            DN(group) for group in definition.get('automemberdefaultgroup', [])]
+
+        self.inclusive = {}
+        self.exclusive = {}
+        try:
+            rules = ldap.get_entries(
+                self.definition_dn, ldap.SCOPE_ONELEVEL,
+                '(objectclass=automemberregexrule)',
+                ['cn', 'automembertargetgroup', INCLUDE_RE, EXCLUDE_RE])
+        except errors.NotFound:
+            rules = []
+        for rule in rules:
+            target = DN(rule.single_value['automembertargetgroup'])
+            for attr, index in ((INCLUDE_RE, self.inclusive),
+                                (EXCLUDE_RE, self.exclusive)):
+                for condition in rule.get(attr, []):
+                    self._add_condition(index, condition,
+                                        rule.single_value['cn'], target)
+
+    def _add_condition(self, index, condition, rule, target):
+        key, sep, regex = condition.partition('=')
+        try:
+            if not sep:
+                raise re.error('missing attribute name')
+            compiled = re.compile(regex)
+        except re.error as e:
+            # 389-ds ignores invalid conditions as well
+            api.log.warning("Ignoring invalid automember condition %s of "
+                            "rule %s: %s", condition, rule, e)
+            return
+        index.setdefault(key.strip().lower(), []).append(
+            (compiled, condition, rule, target))
+
+    @property
+    def attrs_list(self):
+        attrs = set(self.inclusive) | set(self.exclusive)
+        if self.member_value != 'dn':
+            attrs.add(self.member_value)
+        return sorted(attrs)
+
+    def _matches(self, index, entry):
+        for attr, conditions in index.items():
+            values = [value.decode('utf-8', 'replace')
+                      for value in entry.raw.get(attr, [])]
+            if not values:
+                continue
+            for regex, condition, rule, target in conditions:
+                if any(regex.search(value) for value in values):
+                    yield target, rule, condition
+
+    def evaluate(self, entry):
+        """
+        Return an ordered dictionary mapping the DNs of the groups entry
+        belongs to according to the rules to a (rule, condition) tuple
+        describing the match, (None, None) for default groups.
+        """
+        excluded = set(
+            target for target, _rule, _condition
+            in self._matches(self.exclusive, entry))
+        groups = collections.OrderedDict()
+        for target, rule, condition in self._matches(self.inclusive, entry):
+            if target not in excluded and target not in groups:
+                groups[target] = (rule, condition)
+        if not groups:
+            for group in self.default_groups:
+                groups[group] = (None, None)
+        return groups
+
+    def member_value_of(self, entry):
+        if self.member_value == 'dn':
+            return entry.dn
+        return entry.single_value.get(self.member_value)
+
+    def diff(self, search_filter, attrs_list=()):
+        """
+        Evaluate the entries in the scope of the definition matching
+        search_filter and return the memberships which are missing.
+
+        Returns a tuple (changes, groups): changes is a list of
+        (entry, group DN, rule, condition) tuples and groups maps the DN
+        of each affected group to its entry.
+        """
+        if self.disabled:
+            return [], {}
+
+        filter = self.ldap.combine_filters([self.filter, search_filter],
+                                           rules=self.ldap.MATCH_ALL)
+        try:
+            entries, _truncated = self.ldap.find_entries(
+                filter=filter, base_dn=self.scope,
+                attrs_list=list(attrs_list) + self.attrs_list,
+                size_limit=0, paged_search=True)
+        except errors.NotFound:
+            entries = []
+
+        changes = []
+        groups = {}
+        members = {}
+        for entry in entries:
+            value = self.member_value_of(entry)
+            if value is None:
+                continue
+            for group_dn, (rule, condition) in self.evaluate(entry).items():
+                if group_dn not in groups:
+                    try:
+                        groups[group_dn] = self.ldap.get_entry(
+                            group_dn, [self.member_attr])
+                    except errors.NotFound:
+                        api.log.warning("Automember target group %s does "
+                                        "not exist", group_dn)
+                        groups[group_dn] = None
+                        continue
+                    members[group_dn] = set(
+                        groups[group_dn].get(self.member_attr, []))
+                if groups[group_dn] is None or value in members[group_dn]:
+                    continue
+                members[group_dn].add(value)
+                changes.append((entry, group_dn, rule, condition))
+
+        return changes, dict(
+            (dn, group) for dn, group in groups.items() if group is not None)
+
+    def apply(self, changes, groups):
+        """
+        Add the memberships returned by diff() with one modification of
+        each group.
+        """
+        added = collections.OrderedDict()
+        for entry, group_dn, _rule, _condition in changes:
+            added.setdefault(group_dn, []).append(self.member_value_of(entry))
+        for group_dn, values in added.items():
+            group = groups[group_dn]
+            group[self.member_attr] = (
+                list(group.get(self.member_attr, [])) + values)
+            try:
+                self.ldap.update_entry(group)
+            except errors.EmptyModlist:
+                pass
+
+
 @register()
 class automember_rebuild(Method):
     __doc__ = _('Rebuild auto membership.')
@@ -683,8 +862,6 @@ class automember_rebuild(Method):
     obj_name = 'automember_task'
     attr_name = 'rebuild'
 
-    # TODO: Add a --dry-run option:
-    # https://fedorahosted.org/freeipa/ticket/3936
     takes_options = (
         group_type[0].clone(
             required=False,
@@ -706,8 +883,26 @@ class automember_rebuild(Method):
             label=_('No wait'),
             doc=_("Don't wait for rebuilding membership"),
         ),
+        Flag(
+            'dry_run?',
+            default=False,
+            label=_('Dry run'),
+            doc=_("Only show the memberships the rules would add"),
+        ),
+        Flag(
+            'no_task?',
+            default=False,
+            label=_('No task'),
+            doc=_("Add the missing memberships directly instead of running "
+                  "a rebuild membership task"),
+        ),
     )
     has_output = output.standard_entry
+    has_output_params = (
+        Str('changes',
+            label=_('Membership changes'),
+        ),
+    )
 
     def validate(self, **kw):
         """
@@ -778,6 +973,10 @@ class automember_rebuild(Method):
         else:
             search_filter = '(%s=*)' % obj.primary_key.name
 
+        if options.get('dry_run') or options.get('no_task'):
+            return self._rebuild_in_process(
+                ldap, gtype, obj, search_filter, **options)
+
         task_dn = DN(('cn', cn), REBUILD_TASK_CONTAINER)
 
         entry = ldap.make_entry(
@@ -820,3 +1019,33 @@ class automember_rebuild(Method):
             result=result,
             summary=unicode(summary),
             value=pkey_to_value(None, options))
+
+    def _rebuild_in_process(self, ldap, gtype, obj, search_filter, **options):
+        rules = AutomemberRules(ldap, gtype)
+        pkey = obj.primary_key.name
+        changes, groups = rules.diff(search_filter, [pkey])
+
+        result = []
+        for entry, group_dn, rule, condition in changes:
+            if rule is None:
+                reason = _('default group')
+            else:
+                reason = _('rule %(rule)s: %(condition)s') % dict(
+                    rule=rule, condition=condition)
+            result.append(u'%s -> %s (%s)' % (
+                entry.single_value[pkey], group_dn[0].value, reason))
+
+        if options.get('dry_run'):
+            summary = ngettext('%(count)d membership would be added',
+                               '%(count)d memberships would be added',
+                               len(changes))
+        else:
+            rules.apply(changes, groups)
+            summary = ngettext('%(count)d membership added',
+                               '%(count)d memberships added',
+                               len(changes))
+
+        return dict(
+            result=dict(changes=result),
+            summary=unicode(summary % dict(count=len(changes))),
+            value=pkey_to_value(None, options))
@@ -35,7 +35,8 @@ from ipalib import output
 from ipalib.text import _
 from ipalib.util import json_serialize, validate_hostname
 from ipalib.capabilities import client_has_capability
-from ipalib.messages import add_message, SearchResultTruncated
+from ipalib.messages import (add_message, SearchResultTruncated,
+                             SearchResultPaged)
 from ipapython.dn import DN
 from ipapython.version import API_VERSION
 
@@ -290,26 +291,21 @@ def wait_for_value(ldap, dn, attr, value):
 
     The updated entry is returned.
     """
-    # Loop a few times to give the postop-plugin a chance to complete
-    # Don't sleep for more than 6 seconds.
-    x = 0
-    while x < 20:
-        # sleep first because the first search, even on a quiet system,
-        # almost always fails.
-        time.sleep(.3)
-        x = x + 1
+    def has_value(entry_attrs):
+        if entry_attrs is None or attr not in entry_attrs:
+            return False
+        if isinstance(entry_attrs[attr], (list, tuple)):
+            values = [y.lower() for y in entry_attrs[attr]]
+            return value.lower() in values
+        else:
+            return value.lower() == entry_attrs[attr].lower()
 
-        # FIXME: put a try/except around here? I think it is probably better
-        # to just let the exception filter up to the caller.
+    # Give the postop-plugin a chance to complete, but don't wait for more
+    # than 6 seconds.
+    try:
+        entry_attrs = ldap.wait_for_entry(dn, has_value, ['*'], timeout=6)
+    except errors.DatabaseTimeout:
         entry_attrs = ldap.get_entry(dn, ['*'])
-        if attr in entry_attrs:
-            if isinstance(entry_attrs[attr], (list, tuple)):
-                values = [y.lower() for y in entry_attrs[attr]]
-                if value.lower() in values:
-                    break
-            else:
-                if value.lower() == entry_attrs[attr].lower():
-                    break
 
     return entry_attrs
 
@@ -1855,6 +1851,28 @@ class LDAPSearch(BaseLDAPCommand, crud.Search):
     # Set the following attribute to False to turn sorting off
     sort_result_entries = True
 
+    # Set the following attribute to False to disallow retrieving the results
+    # in pages using the page_size and cursor options
+    paged_results = True
+
+    paged_results_options = (
+        Int('page_size?',
+            label=_('Page Size'),
+            doc=_('Return results in pages of this size and a cursor to '
+                  'continue the search with'),
+            flags=['no_display'],
+            minvalue=1,
+            autofill=False,
+        ),
+        Str('cursor?',
+            label=_('Cursor'),
+            doc=_('Continue a paged search from the cursor returned with '
+                  'the previous page'),
+            flags=['no_display'],
+            autofill=False,
+        ),
+    )
+
     takes_options = (
         Int('timelimit?',
             label=_('Time Limit'),
@@ -1921,6 +1939,9 @@ class LDAPSearch(BaseLDAPCommand, crud.Search):
         for attr in self.member_attributes:
             for option in self.get_member_options(attr):
                 yield option
+        if self.paged_results:
+            for option in self.paged_results_options:
+                yield option
 
     def get_attr_filter(self, ldap, **options):
         """
@@ -2027,12 +2048,24 @@ class LDAPSearch(BaseLDAPCommand, crud.Search):
                 self, ldap, filter, attrs_list, base_dn, scope, *args, **options)
             assert isinstance(base_dn, DN)
 
+        cursor = None
         try:
-            (entries, truncated) = self._exc_wrapper(args, options, ldap.find_entries)(
-                filter, attrs_list, base_dn, scope,
-                time_limit=options.get('timelimit', None),
-                size_limit=options.get('sizelimit', None)
-            )
+            if self.paged_results and (options.get('page_size') or
+                                       options.get('cursor')):
+                (entries, cursor, truncated) = self._exc_wrapper(
+                    args, options, ldap.find_entries_paged)(
+                    filter, attrs_list, base_dn, scope,
+                    time_limit=options.get('timelimit', None),
+                    page_size=options.get('page_size'),
+                    cursor=options.get('cursor')
+                )
+            else:
+                (entries, truncated) = self._exc_wrapper(
+                    args, options, ldap.find_entries)(
+                    filter, attrs_list, base_dn, scope,
+                    time_limit=options.get('timelimit', None),
+                    size_limit=options.get('sizelimit', None)
+                )
         except errors.EmptyResult:
             (entries, truncated) = ([], False)
         except errors.NotFound:
@@ -2069,6 +2102,10 @@ class LDAPSearch(BaseLDAPCommand, crud.Search):
             add_message(options['version'], result, SearchResultTruncated(
                 reason=exc))
 
+        if cursor is not None:
+            add_message(options['version'], result, SearchResultPaged(
+                cursor=cursor))
+
         return result
 
     def pre_callback(self, ldap, filters, attrs_list, base_dn, scope, *args, **options):
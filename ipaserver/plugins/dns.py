@@ -338,6 +338,10 @@ _IN = dns.rdataclass.IN
 # NS record type
 _NS = dns.rdatatype.from_text('NS')
 
+# parsed parts of record values used by dnsrecord_find --structured
+_STRUCTURED_RECORD_CACHE_SIZE = 100000
+_structured_record_cache = {}
+
 _output_permissions = (
     output.summary,
     output.Output('result', bool, _('True means the operation was successful')),
@@ -3201,6 +3205,41 @@ class dnsrecord(LDAPObject):
                 del entry_attrs[attr]
         return entry_attrs
 
+    def _parse_structured_record(self, param, dnsvalue, raw=False):
+        """
+        Split record value into its parts. The parsed parts are cached by
+        record value, as the same values (e.g. SRV targets or PTR host names)
+        repeat a lot in large zones.
+        """
+        key = (param.rrtype, dnsvalue, raw)
+        try:
+            dnsentry = _structured_record_cache[key]
+        except KeyError:
+            parts_params = param.get_parts()
+            dnsentry = {
+                    u'dnstype' : unicode(param.rrtype),
+                    u'dnsdata' : dnsvalue
+            }
+            values = param._get_part_values(dnsvalue)
+            if values is None:
+                dnsentry = None
+            else:
+                for val_id, val in enumerate(values):
+                    if val is not None:
+                        #decode IDN
+                        if isinstance(parts_params[val_id], DNSNameParam):
+                            dnsentry[parts_params[val_id].name] = \
+                            _dns_name_to_string(val, raw)
+                        else:
+                            dnsentry[parts_params[val_id].name] = val
+            if len(_structured_record_cache) >= _STRUCTURED_RECORD_CACHE_SIZE:
+                _structured_record_cache.clear()
+            _structured_record_cache[key] = dnsentry
+
+        if dnsentry is None:
+            return None
+        return dict(dnsentry)
+
     def postprocess_record(self, record, **options):
         if options.get('structured', False):
             for attr in record.keys():
@@ -3213,25 +3252,12 @@ class dnsrecord(LDAPObject):
 
                 if not isinstance(param, DNSRecord):
                     continue
-                parts_params = param.get_parts()
 
                 for dnsvalue in record[attr]:
-                    dnsentry = {
-                            u'dnstype' : unicode(param.rrtype),
-                            u'dnsdata' : dnsvalue
-                    }
-                    values = param._get_part_values(dnsvalue)
-                    if values is None:
+                    dnsentry = self._parse_structured_record(
+                        param, dnsvalue, options.get('raw', False))
+                    if dnsentry is None:
                         continue
-                    for val_id, val in enumerate(values):
-                        if val is not None:
-                            #decode IDN
-                            if isinstance(parts_params[val_id], DNSNameParam):
-                                dnsentry[parts_params[val_id].name] = \
-                                _dns_name_to_string(val,
-                                                    options.get('raw', False))
-                            else:
-                                dnsentry[parts_params[val_id].name] = val
                     record.setdefault('dnsrecords', []).append(dnsentry)
                 del record[attr]
 
@@ -4494,7 +4520,11 @@ class dns_system_records(Object):
         Str(
             'location_records*',
             label=_('IPA location records')
-        )
+        ),
+        Str(
+            'changed_records*',
+            label=_('Records to be updated')
+        ),
     )
 
 
@@ -4553,6 +4583,17 @@ class dns_update_system_records(Method):
                 system_records.get_base_records().items())
             result['result']['location_records'] = output_to_list(
                 system_records.get_locations_records().items())
+            try:
+                (
+                    (changed_base, _failed_base),
+                    (changed_loc, _failed_loc),
+                ) = system_records.update_dns_records(dry_run=True)
+            except IPADomainIsNotManagedByIPAError:
+                pass
+            else:
+                if changed_base or changed_loc:
+                    result['result']['changed_records'] = output_to_list(
+                        changed_base + changed_loc)
         else:
             try:
                 (
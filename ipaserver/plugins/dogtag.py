@@ -255,6 +255,7 @@ from ipapython import ipautil
 
 if api.env.in_server:
     import pki
+    import pki.account
     from pki.client import PKIConnection
     import pki.crypto as cryptoutil
     from pki.kra import KRAClient
@@ -1198,8 +1199,10 @@ from ipalib import Registry, errors, SkipPluginModule
 if api.env.ra_plugin != 'dogtag':
     # In this case, abort loading this plugin module...
     raise SkipPluginModule(reason='dogtag not selected as RA plugin')
+import contextlib
 import os
 import random
+import threading
 from ipaserver.plugins import rabase
 from ipalib.constants import TYPE_ERROR
 from ipalib.util import cachedproperty
@@ -1977,9 +1980,16 @@ class kra(Backend):
     KRA backend plugin (for Vault)
     """
 
+    # Idle authenticated KRA clients are dropped after this many seconds so
+    # that we never hand out a client whose Dogtag session already expired.
+    session_idle_timeout = 300
+    session_pool_size = 4
+
     def __init__(self, api, kra_port=443):
 
         self.kra_port = kra_port
+        self._session_pool = []
+        self._session_lock = threading.Lock()
 
         super(kra, self).__init__(api)
 
@@ -2030,6 +2040,69 @@ class kra(Backend):
 
         return KRAClient(connection, crypto)
 
+    def _login(self):
+        kra_client = self.get_client()
+        kra_account = pki.account.AccountClient(kra_client.connection)
+        kra_account.login()
+        return kra_client, kra_account
+
+    def _logout(self, kra_account):
+        try:
+            kra_account.logout()
+        except Exception as e:
+            self.debug("Failed to log out of KRA: %s", e)
+
+    def _acquire_session(self):
+        now = time.time()
+        expired = []
+        session = None
+        with self._session_lock:
+            while self._session_pool:
+                kra_client, kra_account, last_used = self._session_pool.pop()
+                if now - last_used < self.session_idle_timeout:
+                    session = (kra_client, kra_account)
+                    break
+                expired.append(kra_account)
+
+        for kra_account in expired:
+            self._logout(kra_account)
+
+        if session is None:
+            session = self._login()
+
+        return session
+
+    def _release_session(self, kra_client, kra_account):
+        with self._session_lock:
+            if len(self._session_pool) < self.session_pool_size:
+                self._session_pool.append(
+                    (kra_client, kra_account, time.time()))
+                return
+
+        self._logout(kra_account)
+
+    @contextlib.contextmanager
+    def session(self):
+        """
+        Context manager yielding an authenticated KRA client.
+
+        Logged in clients are kept in a small per-process pool and reused
+        by subsequent requests, which saves the KRA enablement check, host
+        selection and the login/logout round-trips on every vault
+        operation. A client is discarded instead of being returned to the
+        pool when the suite raises an exception.
+
+        Raises a generic exception if KRA is not enabled.
+        """
+        kra_client, kra_account = self._acquire_session()
+        try:
+            yield kra_client
+        except BaseException:
+            self._logout(kra_account)
+            raise
+        else:
+            self._release_session(kra_client, kra_account)
+
 
 @register()
 class ra_certprofile(RestClient):
@@ -20,7 +20,7 @@
 
 from __future__ import absolute_import
 
-import dns.resolver
+import netaddr
 
 import six
 
@@ -41,10 +41,11 @@ from .service import (
     validate_realm, normalize_principal, validate_certificate,
     set_certificate_attrs, ticket_flags_params, update_krbticketflags,
     set_kerberos_attrs, rename_ipaallowedtoperform_from_ldap,
-    rename_ipaallowedtoperform_to_ldap, revoke_certs)
+    rename_ipaallowedtoperform_to_ldap, revoke_certs,
+    check_required_principal)
+from .netgroup import get_managed_netgroups
 from .dns import (dns_container_exists,
-        add_records_for_host_validation, add_records_for_host,
-        get_reverse_zone)
+        add_records_for_host_validation, add_records_for_host)
 from ipalib import _, ngettext
 from ipalib import x509
 from ipalib import output
@@ -136,27 +137,6 @@ EXAMPLES:
 register = Registry()
 
 
-def remove_ptr_rec(ipaddr, fqdn):
-    """
-    Remove PTR record of IP address (ipaddr)
-    :return: True if PTR record was removed, False if record was not found
-    """
-    api.log.debug('deleting PTR record of ipaddr %s', ipaddr)
-    try:
-        revzone, revname = get_reverse_zone(ipaddr)
-
-        # assume that target in PTR record is absolute name (otherwise it is
-        # non-standard configuration)
-        delkw = {'ptrrecord': u"%s" % fqdn.make_absolute()}
-
-        api.Command['dnsrecord_del'](revzone, revname, **delkw)
-    except (errors.NotFound, errors.AttrValueNotFound):
-        api.log.debug('PTR record of ipaddr %s not found', ipaddr)
-        return False
-
-    return True
-
-
 def update_sshfp_record(zone, record, entry_attrs):
     if 'ipasshpubkey' not in entry_attrs:
         return
@@ -590,20 +570,35 @@ class host(LDAPObject):
         return dn
 
     def get_managed_hosts(self, dn):
-        host_filter = 'managedBy=%s' % dn
-        host_attrs = ['fqdn']
+        return self.get_managed_hosts_by_dn([dn])[dn]
+
+    def get_managed_hosts_by_dn(self, dns):
+        """
+        Return a dictionary mapping each DN of dns to the list of DNs of
+        the hosts it manages, using a single search.
+        """
         ldap = self.api.Backend.ldap2
-        managed_hosts = []
+        managed_hosts = {DN(dn): [] for dn in dns}
+        if not managed_hosts:
+            return managed_hosts
 
+        host_filter = ldap.make_filter_from_attr(
+            'managedby', [unicode(dn) for dn in managed_hosts],
+            rules=ldap.MATCH_ANY)
         try:
             (hosts, _truncated) = ldap.find_entries(
                 base_dn=DN(self.container_dn, api.env.basedn),
-                filter=host_filter, attrs_list=host_attrs)
-
-            for host in hosts:
-                managed_hosts.append(host.dn)
+                filter=host_filter, attrs_list=['managedby'],
+                size_limit=0, paged_search=True)
         except errors.NotFound:
-            return []
+            return managed_hosts
+
+        for host in hosts:
+            for manager in host.get('managedby', []):
+                try:
+                    managed_hosts[DN(manager)].append(host.dn)
+                except KeyError:
+                    pass
 
         return managed_hosts
 
@@ -612,18 +607,13 @@ class host(LDAPObject):
         We don't want to show managed netgroups so remove them from the
         memberofindirect list.
         """
-        ng_container = DN(api.env.container_netgroup, api.env.basedn)
-        for member in list(entry_attrs.get('memberofindirect', [])):
-            memberdn = DN(member)
-            if not memberdn.endswith(ng_container):
-                continue
+        if not entry_attrs.get('memberofindirect'):
+            return
 
-            filter = ldap.make_filter({'objectclass': 'mepmanagedentry'})
-            try:
-                ldap.get_entries(memberdn, ldap.SCOPE_BASE, filter, [''])
-            except errors.NotFound:
-                pass
-            else:
+        managed = get_managed_netgroups(
+            ldap, entry_attrs['memberofindirect'])
+        for member in list(entry_attrs['memberofindirect']):
+            if DN(member) in managed:
                 entry_attrs['memberofindirect'].remove(member)
 
 
@@ -747,6 +737,290 @@ class host_add(LDAPCreate):
         return dn
 
 
+HOST_REMOVAL_BATCH_SIZE = 100
+
+
+class HostRemovalPlan(object):
+    """
+    Cleanup of the entries which depend on hosts being deleted.
+
+    The services, certificates and DNS records of the hosts are gathered
+    up front with one search each for every batch of hosts. The cleanup of
+    a host is then run as an ordered list of steps: revocation of the
+    certificates of the host and its services, deletion of the services and
+    removal of the A, AAAA, SSHFP and PTR records of the host.
+    """
+    def __init__(self, api, ldap, updatedns=False):
+        self.api = api
+        self.ldap = ldap
+        self.updatedns = updatedns
+        if updatedns:
+            try:
+                self.updatedns = dns_container_exists(ldap)
+            except errors.NotFound:
+                self.updatedns = False
+        self.ca_enabled = None
+        self._ca_names = None
+        self.gathered = set()
+        self.services = {}
+        self.certs = {}
+        self.records = {}
+        self.ptr_records = {}
+
+    def __contains__(self, fqdn):
+        return fqdn in self.gathered
+
+    def gather(self, fqdns):
+        """
+        Find the entries which depend on the hosts fqdns.
+        """
+        fqdns = [fqdn for fqdn in fqdns if fqdn not in self.gathered]
+        if self.ca_enabled is None:
+            self.ca_enabled = self.api.Command.ca_is_enabled()['result']
+        for i in range(0, len(fqdns), HOST_REMOVAL_BATCH_SIZE):
+            batch = fqdns[i:i + HOST_REMOVAL_BATCH_SIZE]
+            self._gather_services(batch)
+            if self.ca_enabled:
+                self._gather_certs(batch)
+            if self.updatedns:
+                self._gather_records(batch)
+            self.gathered.update(batch)
+
+    def _find_entries(self, filter, attrs_list, base_dn):
+        try:
+            entries, _truncated = self.ldap.find_entries(
+                filter=filter, attrs_list=attrs_list, base_dn=base_dn,
+                size_limit=0, paged_search=True)
+        except errors.NotFound:
+            entries = []
+        return entries
+
+    def _principals_filter(self, fqdns):
+        return self.ldap.make_filter_from_attr(
+            'krbprincipalname', [u'/%s@' % fqdn for fqdn in fqdns],
+            rules=self.ldap.MATCH_ANY, exact=False)
+
+    def _gather_services(self, fqdns):
+        filter = self.ldap.combine_filters(
+            [self.ldap.make_filter_from_attr('objectclass', 'ipaservice'),
+             self._principals_filter(fqdns)],
+            rules=self.ldap.MATCH_ALL)
+        entries = self._find_entries(
+            filter, ['krbprincipalname'],
+            DN(self.api.env.container_service, self.api.env.basedn))
+        for entry in entries:
+            principal = kerberos.Principal(entry['krbprincipalname'][0])
+            hostname = principal.hostname.lower()
+            if hostname in fqdns:
+                self.services.setdefault(hostname, []).append(
+                    (entry.dn, principal))
+
+    def _gather_certs(self, fqdns):
+        filter = self.ldap.combine_filters(
+            [self.ldap.combine_filters(
+                [self.ldap.make_filter_from_attr('fqdn', fqdns),
+                 self._principals_filter(fqdns)],
+                rules=self.ldap.MATCH_ANY),
+             '(usercertificate=*)'],
+            rules=self.ldap.MATCH_ALL)
+        entries = self._find_entries(
+            filter, ['fqdn', 'krbprincipalname', 'usercertificate'],
+            self.api.env.basedn)
+
+        keys = {}
+        for entry in entries:
+            if 'fqdn' in entry:
+                hostname = entry.single_value['fqdn'].lower()
+            else:
+                principal = kerberos.Principal(entry['krbprincipalname'][0])
+                hostname = principal.hostname.lower()
+            if hostname not in fqdns:
+                continue
+            for attr in ('usercertificate', 'usercertificate;binary'):
+                for cert in entry.get(attr, []):
+                    try:
+                        cert_obj = x509.load_certificate(cert, x509.DER)
+                    except ValueError:
+                        continue
+                    key = (DN(cert_obj.issuer), cert_obj.serial_number)
+                    keys.setdefault(key, set()).add(hostname)
+        if not keys:
+            return
+
+        # Query the status of the certificates in the CA with one search
+        # per issuer. Certificates unknown to the CA or issued by a CA which
+        # is not managed by IPA cannot be revoked through IPA.
+        if self._ca_names is None:
+            ca_objs = self.api.Command.ca_find(
+                timelimit=0, sizelimit=0)['result']
+            self._ca_names = {DN(ca['ipacasubjectdn'][0]): ca['cn'][0]
+                              for ca in ca_objs}
+        issuers = {}
+        for issuer, serial_number in keys:
+            if issuer in self._ca_names:
+                issuers.setdefault(issuer, []).append(serial_number)
+        for issuer, serial_numbers in issuers.items():
+            ra_objs = self.api.Backend.ra.find({
+                'issuer': unicode(issuer),
+                'min_serial_number': min(serial_numbers),
+                'max_serial_number': max(serial_numbers),
+            })
+            for ra_obj in ra_objs:
+                key = (DN(ra_obj['issuer']), ra_obj['serial_number'])
+                for hostname in keys.get(key, ()):
+                    self.certs.setdefault(hostname, []).append({
+                        'serial_number': ra_obj['serial_number'],
+                        'cacn': self._ca_names[issuer],
+                        'revoked': ra_obj['status'] in (
+                            u'REVOKED', u'REVOKED_EXPIRED'),
+                    })
+
+    def _gather_records(self, fqdns):
+        names = {}
+        idnsnames = set()
+        for fqdn in fqdns:
+            name = DNSName(fqdn).make_absolute()
+            names[name] = fqdn
+            # the host record may be in any of the zones above it, find
+            # all the possible relative names in one search
+            labels = name.ToASCII().rstrip(u'.').split(u'.')
+            for i in range(1, len(labels) + 1):
+                idnsnames.add(u'.'.join(labels[:i]))
+            idnsnames.add(name.ToASCII())
+
+        filter = self.ldap.combine_filters(
+            [self.ldap.make_filter_from_attr('objectclass', 'idnsrecord'),
+             self.ldap.combine_filters(
+                 [self.ldap.make_filter_from_attr('idnsname',
+                                                  sorted(idnsnames)),
+                  self.ldap.make_filter_from_attr(
+                      'ptrrecord', [n.ToASCII() for n in names])],
+                 rules=self.ldap.MATCH_ANY)],
+            rules=self.ldap.MATCH_ALL)
+        entries = self._find_entries(
+            filter,
+            ['idnsname', 'arecord', 'aaaarecord', 'sshfprecord', 'ptrrecord'],
+            DN(self.api.env.container_dns, self.api.env.basedn))
+
+        for entry in entries:
+            if entry.dn[1].attr.lower() == 'idnsname':
+                zone = DNSName(entry.dn[1].value).make_absolute()
+                relative_name = DNSName(entry.dn[0].value)
+                name = relative_name.derelativize(zone)
+            else:
+                # zone apex
+                zone = DNSName(entry.dn[0].value).make_absolute()
+                relative_name = DNSName.empty
+                name = zone
+
+            fqdn = names.get(name)
+            if fqdn is not None:
+                # prefer the most specific zone, as the resolver would
+                current = self.records.get(fqdn)
+                if current is None or len(zone) > len(current[0]):
+                    self.records[fqdn] = (zone, relative_name, entry)
+
+            for value in entry.get('ptrrecord', []):
+                fqdn = names.get(DNSName(value))
+                if fqdn is not None:
+                    self.ptr_records.setdefault(fqdn, []).append(
+                        (zone, relative_name, name, value))
+
+    def steps(self, fqdn):
+        """
+        Return the ordered list of (description, callable) steps of the
+        cleanup of the host fqdn.
+        """
+        steps = []
+        if self.certs.get(fqdn):
+            steps.append((u'revoke certificates',
+                          lambda: revoke_certs(self.certs[fqdn])))
+        if self.services.get(fqdn):
+            steps.append((u'delete services',
+                          lambda: self._delete_services(fqdn)))
+        if self.updatedns:
+            steps.append((u'remove DNS records',
+                          lambda: self._remove_records(fqdn)))
+        return steps
+
+    def run(self, fqdn):
+        """
+        Run the cleanup of the host fqdn.
+
+        Returns the list of messages to report to the client. If a step
+        fails, the error is logged with the name of the step and re-raised.
+        """
+        result = []
+        for description, step in self.steps(fqdn):
+            try:
+                result.extend(step() or [])
+            except errors.ExecutionError as e:
+                self.api.log.error("Failed to %s of host %s: %s",
+                                   description, fqdn, e)
+                raise
+        return result
+
+    def _delete_services(self, fqdn):
+        # refuse to delete the principals required by an IPA master, as
+        # service_del does, before any service of the host is deleted
+        for _dn, principal in self.services[fqdn]:
+            check_required_principal(self.ldap, principal)
+
+        for dn, _principal in self.services[fqdn]:
+            try:
+                self.ldap.delete_entry(dn)
+            except errors.NotFound:
+                pass
+
+    def _remove_records(self, fqdn):
+        rec_removed = False
+        try:
+            zone, relative_name, record = self.records[fqdn]
+        except KeyError:
+            pass
+        else:
+            # remove PTR records first
+            addresses = set()
+            for attr in ('arecord', 'aaaarecord'):
+                for val in record.get(attr, []):
+                    addresses.add(DNSName(
+                        unicode(netaddr.IPAddress(str(val)).reverse_dns)))
+            for revzone, revname, name, value in self.ptr_records.get(
+                    fqdn, []):
+                if name not in addresses:
+                    continue
+                try:
+                    self.api.Command['dnsrecord_del'](
+                        revzone, revname, ptrrecord=value)
+                except (errors.NotFound, errors.AttrValueNotFound):
+                    self.api.log.debug('PTR record %s of host %s not found',
+                                       name, fqdn)
+                else:
+                    rec_removed = True
+            try:
+                # remove all A, AAAA, SSHFP records of the host
+                self.api.Command['dnsrecord_mod'](
+                    zone,
+                    relative_name,
+                    arecord=[],
+                    aaaarecord=[],
+                    sshfprecord=[]
+                    )
+            except errors.EmptyModlist:
+                pass
+            else:
+                rec_removed = True
+
+        if not rec_removed:
+            return [
+                messages.FailedToRemoveHostDNSRecords(
+                    host=fqdn,
+                    reason=_("No A, AAAA, SSHFP or PTR records found.")
+                )
+            ]
+        return []
+
+
 @register()
 class host_del(LDAPDelete):
     __doc__ = _('Delete a host.')
@@ -762,6 +1036,22 @@ class host_del(LDAPDelete):
         ),
     )
 
+    def execute(self, *keys, **options):
+        if isinstance(keys[-1], (list, tuple)):
+            pkeys = keys[-1]
+        else:
+            pkeys = [keys[-1]]
+        plan = HostRemovalPlan(self.api, self.obj.backend,
+                               updatedns=options.get('updatedns', False))
+        plan.gather([pkey for pkey in pkeys
+                     if pkey is not None and
+                     hostname_validator(None, pkey) is None])
+        setattr(context, 'host_removal_plan', plan)
+        try:
+            return super(host_del, self).execute(*keys, **options)
+        finally:
+            delattr(context, 'host_removal_plan')
+
     def pre_callback(self, ldap, dn, *keys, **options):
         assert isinstance(dn, DN)
         # If we aren't given a fqdn, find it
@@ -771,75 +1061,17 @@ class host_del(LDAPDelete):
         else:
             fqdn = keys[-1]
         host_is_master(ldap, fqdn)
-        # Remove all service records for this host
-        truncated = True
-        while truncated:
-            try:
-                ret = api.Command['service_find'](fqdn)
-                truncated = ret['truncated']
-                services = ret['result']
-            except errors.NotFound:
-                break
-            else:
-                for entry_attrs in services:
-                    principal = kerberos.Principal(
-                        entry_attrs['krbprincipalname'][0])
-                    hostname = principal.hostname
-                    if hostname.lower() == fqdn:
-                        api.Command['service_del'](principal)
-        updatedns = options.get('updatedns', False)
-        if updatedns:
-            try:
-                updatedns = dns_container_exists(ldap)
-            except errors.NotFound:
-                updatedns = False
 
-        if updatedns:
-            # Remove A, AAAA, SSHFP and PTR records of the host
-            fqdn_dnsname = DNSName(fqdn).make_absolute()
-            zone = DNSName(dns.resolver.zone_for_name(fqdn_dnsname))
-            relative_hostname = fqdn_dnsname.relativize(zone)
-
-            # Get all resources for this host
-            rec_removed = False
-            try:
-                record = api.Command['dnsrecord_show'](
-                    zone, relative_hostname)['result']
-            except errors.NotFound:
-                pass
-            else:
-                # remove PTR records first
-                for attr in ('arecord', 'aaaarecord'):
-                    for val in record.get(attr, []):
-                        rec_removed = (
-                            remove_ptr_rec(val, fqdn_dnsname) or
-                            rec_removed
-                        )
-                try:
-                    # remove all A, AAAA, SSHFP records of the host
-                    api.Command['dnsrecord_mod'](
-                        zone,
-                        record['idnsname'][0],
-                        arecord=[],
-                        aaaarecord=[],
-                        sshfprecord=[]
-                        )
-                except errors.EmptyModlist:
-                    pass
-                else:
-                    rec_removed = True
-
-            if not rec_removed:
-                self.add_message(
-                    messages.FailedToRemoveHostDNSRecords(
-                        host=fqdn,
-                        reason=_("No A, AAAA, SSHFP or PTR records found.")
-                    )
-                )
-
-        if self.api.Command.ca_is_enabled()['result']:
-            certs = self.api.Command.cert_find(host=keys)['result']
-            revoke_certs(certs)
+        # Revoke certificates and remove services and DNS records of the
+        # host, using the plan prepared by execute() for all the hosts
+        plan = getattr(context, 'host_removal_plan', None)
+        if plan is None:
+            plan = HostRemovalPlan(self.api, ldap,
+                                   updatedns=options.get('updatedns', False))
+        if fqdn not in plan:
+            plan.gather([fqdn])
+        for message in plan.run(fqdn):
+            self.add_message(message)
 
         return dn
 
@@ -1057,6 +1289,17 @@ class host_find(LDAPSearch):
     def post_callback(self, ldap, entries, truncated, *args, **options):
         if options.get('pkey_only', False):
             return truncated
+
+        # look up the managed netgroups and managed hosts of all the
+        # entries at once rather than for each entry
+        get_managed_netgroups(
+            ldap,
+            [member for entry_attrs in entries
+             for member in entry_attrs.get('memberofindirect', [])])
+        if options.get('all', False):
+            managing = self.obj.get_managed_hosts_by_dn(
+                [entry_attrs.dn for entry_attrs in entries])
+
         for entry_attrs in entries:
             hostname = entry_attrs['fqdn']
             if isinstance(hostname, (tuple, list)):
@@ -1078,7 +1321,7 @@ class host_find(LDAPSearch):
             self.obj.suppress_netgroup_memberof(ldap, entry_attrs)
 
             if options.get('all', False):
-                entry_attrs['managing'] = self.obj.get_managed_hosts(entry_attrs.dn)
+                entry_attrs['managing'] = managing[entry_attrs.dn]
 
             convert_sshpubkey_post(entry_attrs)
             convert_ipaassignedidview_post(entry_attrs, options)
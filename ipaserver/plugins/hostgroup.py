@@ -26,7 +26,8 @@ from .baseldap import (LDAPObject, LDAPCreate, LDAPRetrieve,
                                      LDAPAddMember, LDAPRemoveMember,
                                      entry_from_entry, wait_for_value)
 from ipalib import Str, api, _, ngettext, errors
-from .netgroup import NETGROUP_PATTERN, NETGROUP_PATTERN_ERRMSG
+from .netgroup import (NETGROUP_PATTERN, NETGROUP_PATTERN_ERRMSG,
+                       get_managed_netgroups)
 from ipapython.dn import DN
 
 if six.PY3:
@@ -176,17 +177,14 @@ class hostgroup(LDAPObject):
         memberOf list.
         """
         hgdn = DN(dn)
-        for member in list(entry_attrs.get('memberof', [])):
-            ngdn = DN(member)
-            if ngdn['cn'] != hgdn['cn']:
-                continue
-
-            filter = ldap.make_filter({'objectclass': 'mepmanagedentry'})
-            try:
-                ldap.get_entries(ngdn, ldap.SCOPE_BASE, filter, [''])
-            except errors.NotFound:
-                pass
-            else:
+        candidates = [DN(member) for member in entry_attrs.get('memberof', [])
+                      if DN(member)['cn'] == hgdn['cn']]
+        if not candidates:
+            return
+
+        managed = get_managed_netgroups(ldap, candidates)
+        for member in list(entry_attrs['memberof']):
+            if DN(member) in managed:
                 entry_attrs['memberof'].remove(member)
 
 
@@ -268,6 +266,12 @@ class hostgroup_find(LDAPSearch):
     def post_callback(self, ldap, entries, truncated, *args, **options):
         if options.get('pkey_only', False):
             return truncated
+        # check the netgroups of all the entries at once
+        get_managed_netgroups(
+            ldap,
+            [DN(member) for entry in entries
+             for member in entry.get('memberof', [])
+             if DN(member)['cn'] == entry.dn['cn']])
         for entry in entries:
             self.obj.suppress_netgroup_memberof(ldap, entry.dn, entry)
         return truncated
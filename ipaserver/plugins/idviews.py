@@ -26,7 +26,6 @@ from .baseldap import (LDAPQuery, LDAPObject, LDAPCreate,
                                      LDAPAddAttributeViaOption,
                                      LDAPRemoveAttributeViaOption,
                                      LDAPRetrieve, global_output_params)
-from .hostgroup import get_complete_hostgroup_member_list
 from .service import validate_certificate
 from ipalib import api, Str, Int, Bytes, Flag, _, ngettext, errors, output
 from ipalib.constants import (
@@ -304,38 +303,38 @@ class baseidview_apply(LDAPQuery):
                 del options[key]
 
         # Generate a list of all hosts to apply the view to
-        hosts_to_apply = list(options.get('host', []))
-
-        for hostgroup in options.get('hostgroup', ()):
-            try:
-                hosts_to_apply += get_complete_hostgroup_member_list(hostgroup)
-            except errors.NotFound:
-                failed['hostgroup'].append((hostgroup, unicode(_("not found"))))
-            except errors.PublicError as e:
-                failed['hostgroup'].append((hostgroup, "%s : %s" % (
-                                            e.__class__.__name__, str(e))))
-
-        for host in hosts_to_apply:
-            try:
-                host_dn = api.Object['host'].get_dn_if_exists(host)
-
-                host_entry = ldap.get_entry(host_dn,
-                                            attrs_list=['ipaassignedidview'])
-                host_entry['ipaassignedidview'] = view_dn
-
-                ldap.update_entry(host_entry)
-
+        hosts_to_apply, failed_hosts, failed_hostgroups = self._resolve_hosts(
+            ldap, options.get('host', ()), options.get('hostgroup', ()))
+        failed['host'].extend(failed_hosts)
+        failed['hostgroup'].extend(failed_hostgroups)
+
+        # Skip hosts which already have the view without writing them and
+        # send the modifications of the other ones in batches
+        applied = set()
+        to_update = []
+        for host, entry in hosts_to_apply:
+            if (entry.dn in applied or
+                    entry.single_value.get('ipaassignedidview') == view_dn):
+                failed['host'].append((host,
+                                       unicode(_("ID View already applied"))))
+                continue
+            applied.add(entry.dn)
+            entry['ipaassignedidview'] = view_dn
+            to_update.append((host, entry))
+
+        results = ldap.update_entries([entry for _host, entry in to_update])
+        for (host, _entry), (_updated, error) in zip(to_update, results):
+            if error is None:
                 # If no exception was raised, view assigment went well
                 completed = completed + 1
                 succeeded['host'].append(host)
-            except errors.EmptyModlist:
-                # If view was already applied, complain about it
+            elif isinstance(error, errors.EmptyModlist):
                 failed['host'].append((host,
                                        unicode(_("ID View already applied"))))
-            except errors.NotFound:
+            elif isinstance(error, errors.NotFound):
                 failed['host'].append((host, unicode(_("not found"))))
-            except errors.PublicError as e:
-                failed['host'].append((host, str(e)))
+            else:
+                failed['host'].append((host, str(error)))
 
         # Wrap dictionary containing failures in another dictionary under key
         # 'memberhost', since that is output parameter in global_output_params
@@ -357,6 +356,96 @@ class baseidview_apply(LDAPQuery):
             failed=failed,
         )
 
+    def _resolve_hosts(self, ldap, hosts, hostgroups):
+        """
+        Find the entries of the given hosts and of the current members of
+        the given hostgroups with one search.
+
+        Returns a tuple (hosts_to_apply, failed_hosts, failed_hostgroups)
+        where hosts_to_apply is a list of (host name, host entry) tuples.
+        """
+        host_obj = self.api.Object['host']
+        hostgroup_obj = self.api.Object['hostgroup']
+        failed_hosts = []
+        failed_hostgroups = []
+
+        hostgroup_dns = {}
+        if hostgroups:
+            try:
+                entries, _truncated = ldap.find_entries(
+                    filter=ldap.make_filter_from_attr(
+                        'cn', list(hostgroups), rules=ldap.MATCH_ANY),
+                    attrs_list=['cn'],
+                    base_dn=DN(hostgroup_obj.container_dn,
+                               self.api.env.basedn),
+                    scope=ldap.SCOPE_ONELEVEL,
+                    size_limit=0)
+            except errors.NotFound:
+                entries = []
+            for entry in entries:
+                hostgroup_dns[entry.single_value['cn'].lower()] = entry.dn
+        for hostgroup in hostgroups:
+            if hostgroup.lower() not in hostgroup_dns:
+                failed_hostgroups.append((hostgroup, unicode(_("not found"))))
+
+        filters = []
+        if hosts:
+            filters.append(ldap.make_filter_from_attr(
+                'fqdn', list(hosts), rules=ldap.MATCH_ANY))
+            filters.append(ldap.make_filter_from_attr(
+                'serverhostname', list(hosts), rules=ldap.MATCH_ANY))
+        if hostgroup_dns:
+            filters.append(ldap.make_filter_from_attr(
+                'memberof', list(hostgroup_dns.values()),
+                rules=ldap.MATCH_ANY))
+        entries = []
+        if filters:
+            try:
+                entries, _truncated = ldap.find_entries(
+                    filter=ldap.combine_filters(
+                        [ldap.make_filter_from_attr('objectclass', 'ipahost'),
+                         ldap.combine_filters(filters, ldap.MATCH_ANY)],
+                        ldap.MATCH_ALL),
+                    attrs_list=['fqdn', 'serverhostname', 'memberof',
+                                'ipaassignedidview'],
+                    base_dn=DN(host_obj.container_dn, self.api.env.basedn),
+                    size_limit=0,
+                    paged_search=True)
+            except errors.NotFound:
+                pass
+
+        by_fqdn = {}
+        by_hostname = {}
+        by_hostgroup = {}
+        for entry in entries:
+            by_fqdn[entry.single_value['fqdn'].lower()] = entry
+            for hostname in entry.get('serverhostname', []):
+                by_hostname.setdefault(hostname.lower(), []).append(entry)
+            for memberof in entry.get('memberof', []):
+                by_hostgroup.setdefault(memberof, []).append(entry)
+
+        hosts_to_apply = []
+        for host in hosts:
+            entry = by_fqdn.get(host.lower())
+            if entry is None:
+                matches = by_hostname.get(host.lower(), [])
+                if not matches:
+                    failed_hosts.append((host, unicode(_("not found"))))
+                    continue
+                if len(matches) > 1:
+                    failed_hosts.append((host, str(
+                        errors.SingleMatchExpected(found=len(matches)))))
+                    continue
+                entry = matches[0]
+            hosts_to_apply.append((host, entry))
+
+        for hostgroup in hostgroups:
+            hostgroup_dn = hostgroup_dns.get(hostgroup.lower())
+            for entry in by_hostgroup.get(hostgroup_dn, []):
+                hosts_to_apply.append((entry.single_value['fqdn'], entry))
+
+        return hosts_to_apply, failed_hosts, failed_hostgroups
+
 
 @register()
 class idview_apply(baseidview_apply):
@@ -27,7 +27,13 @@ Backend plugin for LDAP.
 # binding encodes them into the appropriate representation. This applies to
 # everything except the CrudBackend methods, where dn is part of the entry dict.
 
+import base64
+import binascii
+import collections
+import hashlib
 import os
+import threading
+import time
 
 import ldap as _ldap
 
@@ -61,12 +67,35 @@ register = Registry()
 _missing = object()
 
 
+class _PagedSearch(object):
+    """
+    State of a paged search which is continued across requests
+    """
+    def __init__(self, client, owner, base_dn, scope, filter, attrs_list):
+        self.cursor_id = binascii.hexlify(os.urandom(16)).decode('ascii')
+        self.client = client
+        self.owner = owner
+        self.base_dn = base_dn
+        self.scope = scope
+        self.filter = filter
+        self.attrs_list = attrs_list
+        self.cookie = None
+        self.offset = 0
+        self.last_used = time.time()
+
+
 @register()
 class ldap2(CrudBackend, LDAPClient):
     """
     LDAP Backend Take 2.
     """
 
+    # paged searches continued with a cursor
+    paged_search_page_size = 1000
+    paged_search_limit = 32
+    paged_search_owner_limit = 4
+    paged_search_timeout = 300
+
     def __init__(self, api, ldap_uri=None):
         if ldap_uri is None:
             ldap_uri = api.env.ldap_uri
@@ -80,6 +109,9 @@ class ldap2(CrudBackend, LDAPClient):
         self.__time_limit = float(LDAPClient.time_limit)
         self.__size_limit = int(LDAPClient.size_limit)
 
+        self._paged_searches = collections.OrderedDict()
+        self._paged_searches_lock = threading.Lock()
+
     @property
     def time_limit(self):
         if self.__time_limit is None:
@@ -126,6 +158,25 @@ class ldap2(CrudBackend, LDAPClient):
     def __str__(self):
         return self.ldap_uri
 
+    def _new_client(self, cacert):
+        client = LDAPClient(self.ldap_uri,
+                            force_schema_updates=self._force_schema_updates,
+                            cacert=cacert)
+        conn = client._conn
+
+        with client.error_handler():
+            minssf = conn.get_option(_ldap.OPT_X_SASL_SSF_MIN)
+            maxssf = conn.get_option(_ldap.OPT_X_SASL_SSF_MAX)
+            # Always connect with at least an SSF of 56, confidentiality
+            # This also protects us from a broken ldap.conf
+            if minssf < 56:
+                minssf = 56
+                conn.set_option(_ldap.OPT_X_SASL_SSF_MIN, minssf)
+                if maxssf < minssf:
+                    conn.set_option(_ldap.OPT_X_SASL_SSF_MAX, minssf)
+
+        return client
+
     def create_connection(
             self, ccache=None, bind_dn=None, bind_pw='', cacert=None,
             autobind=AUTOBIND_AUTO, serverctrls=None, clientctrls=None,
@@ -162,22 +213,9 @@ class ldap2(CrudBackend, LDAPClient):
         if size_limit is not _missing:
             self.size_limit = size_limit
 
-        client = LDAPClient(self.ldap_uri,
-                            force_schema_updates=self._force_schema_updates,
-                            cacert=cacert)
+        client = self._new_client(cacert)
         conn = client._conn
 
-        with client.error_handler():
-            minssf = conn.get_option(_ldap.OPT_X_SASL_SSF_MIN)
-            maxssf = conn.get_option(_ldap.OPT_X_SASL_SSF_MAX)
-            # Always connect with at least an SSF of 56, confidentiality
-            # This also protects us from a broken ldap.conf
-            if minssf < 56:
-                minssf = 56
-                conn.set_option(_ldap.OPT_X_SASL_SSF_MIN, minssf)
-                if maxssf < minssf:
-                    conn.set_option(_ldap.OPT_X_SASL_SSF_MAX, minssf)
-
         ldapi = self.ldap_uri.startswith('ldapi://')
 
         if bind_pw:
@@ -222,6 +260,184 @@ class ldap2(CrudBackend, LDAPClient):
         del self.time_limit
         del self.size_limit
 
+    def _new_paged_search_client(self):
+        """
+        Create a dedicated connection for a paged search, bound with the same
+        credentials as the current request.
+        """
+        client = self._new_client(paths.IPA_CA_CRT)
+        ldapi = self.ldap_uri.startswith('ldapi://')
+        try:
+            if os.getegid() == 0 and ldapi:
+                client.external_bind()
+            else:
+                if ldapi:
+                    with client.error_handler():
+                        client.conn.set_option(
+                            _ldap.OPT_HOST_NAME, self.api.env.host)
+                client.gssapi_bind()
+        except Exception:
+            client.close()
+            raise
+        return client
+
+    def _close_paged_search(self, search):
+        search.client.abandon_paged_search(
+            search.filter, search.attrs_list, search.base_dn, search.scope,
+            search.cookie)
+        try:
+            search.client.close()
+        except errors.PublicError:
+            pass
+
+    def _expire_paged_searches(self, now, owner):
+        """
+        Remove paged searches which were not continued in time and make room
+        for a new one of owner. Must be called with the paged search lock
+        held.
+        :return: list of removed searches, which should be closed
+        """
+        expired = []
+        owned = []
+        for cursor_id, search in list(self._paged_searches.items()):
+            if now - search.last_used > self.paged_search_timeout:
+                expired.append(self._paged_searches.pop(cursor_id))
+            elif search.owner == owner:
+                owned.append(cursor_id)
+        # the oldest searches of the owner make room first
+        while len(owned) >= self.paged_search_owner_limit:
+            expired.append(self._paged_searches.pop(owned.pop(0)))
+        while len(self._paged_searches) >= self.paged_search_limit:
+            expired.append(self._paged_searches.popitem(last=False)[1])
+        return expired
+
+    def _get_paged_search(self, cursor_id, owner):
+        with self._paged_searches_lock:
+            search = self._paged_searches.get(cursor_id)
+            if search is None or search.owner != owner:
+                return None
+            return self._paged_searches.pop(cursor_id)
+
+    def _put_paged_search(self, search):
+        now = time.time()
+        search.last_used = now
+        with self._paged_searches_lock:
+            expired = self._expire_paged_searches(now, search.owner)
+            self._paged_searches[search.cursor_id] = search
+        for expired_search in expired:
+            self._close_paged_search(expired_search)
+
+    def find_entries_paged(self, filter=None, attrs_list=None, base_dn=None,
+                           scope=_ldap.SCOPE_SUBTREE, time_limit=None,
+                           page_size=None, cursor=None):
+        """
+        Return one page of entries matching the specified search parameters
+        as a tuple ([entries], cursor, truncated).
+
+        The returned cursor is an opaque string to be passed to the next
+        call with the same search parameters to get the next page. It is
+        None when there are no more entries.
+
+        The LDAP paged search of each cursor is kept open on a dedicated
+        connection until it is finished, abandoned for more than
+        ``paged_search_timeout`` seconds or evicted by newer searches, of
+        the same principal beyond ``paged_search_owner_limit`` or of anyone
+        beyond ``paged_search_limit``. When
+        the cursor is not known to this process anymore, the search is
+        restarted and the entries returned before are skipped.
+
+        Keyword arguments:
+        see find_entries
+        page_size -- maximal number of entries returned in one page
+        cursor -- cursor returned by the previous call, None to start
+            a new search
+
+        :raises: errors.ValidationError if the cursor is invalid or does not
+                 match the search parameters
+        """
+        if base_dn is None:
+            base_dn = DN()
+        assert isinstance(base_dn, DN)
+        if attrs_list is not None:
+            attrs_list = sorted(set(a.lower() for a in attrs_list))
+
+        digest = hashlib.sha1(repr(
+            (str(base_dn), scope, filter, attrs_list)
+        ).encode('utf-8')).hexdigest()[:16]
+        owner = getattr(context, 'principal', None)
+
+        search = None
+        offset = 0
+        if cursor:
+            try:
+                cursor_id, offset, cursor_digest, cursor_page_size = (
+                    base64.urlsafe_b64decode(
+                        cursor.encode('ascii')).decode('ascii').split(':'))
+                offset = int(offset)
+                cursor_page_size = int(cursor_page_size)
+            except (TypeError, ValueError, UnicodeError):
+                raise errors.ValidationError(
+                    name='cursor', error=_('invalid cursor'))
+            if cursor_digest != digest:
+                raise errors.ValidationError(
+                    name='cursor',
+                    error=_('cursor does not match the search criteria'))
+            if page_size is None:
+                page_size = cursor_page_size
+            search = self._get_paged_search(cursor_id, owner)
+            if search is not None and search.offset != offset:
+                # cursor of an already continued page was reused
+                self._close_paged_search(search)
+                search = None
+
+        if page_size is None:
+            page_size = self.paged_search_page_size
+
+        if search is None:
+            search = _PagedSearch(
+                self._new_paged_search_client(), owner, base_dn, scope,
+                filter, attrs_list)
+
+        try:
+            # restart of a search which is not known to this process,
+            # skip the entries which were already returned
+            while search.offset < offset:
+                entries, search.cookie, truncated = (
+                    search.client.find_entries_page(
+                        filter, attrs_list, base_dn, scope,
+                        time_limit=time_limit,
+                        page_size=min(offset - search.offset, page_size),
+                        cookie=search.cookie))
+                search.offset += len(entries)
+                if truncated or not search.cookie:
+                    break
+
+            if search.offset < offset:
+                # search results shrank since the previous page
+                entries = []
+                search.cookie = ''
+            else:
+                entries, search.cookie, truncated = (
+                    search.client.find_entries_page(
+                        filter, attrs_list, base_dn, scope,
+                        time_limit=time_limit, page_size=page_size,
+                        cookie=search.cookie))
+                search.offset += len(entries)
+        except Exception:
+            self._close_paged_search(search)
+            raise
+
+        if not search.cookie:
+            self._close_paged_search(search)
+            return (entries, None, truncated)
+
+        self._put_paged_search(search)
+        next_cursor = u'{}:{}:{}:{}'.format(
+            search.cursor_id, search.offset, digest, page_size)
+        next_cursor = base64.urlsafe_b64encode(
+            next_cursor.encode('ascii')).decode('ascii')
+        return (entries, next_cursor, truncated)
+
     def get_ipa_config(self, attrs_list=None):
         """Returns the IPA configuration entry (dn, entry_attrs)."""
 
@@ -37,6 +37,7 @@ from .baseldap import (
     LDAPAddMember,
     LDAPRemoveMember)
 from ipalib import _, ngettext
+from ipalib.request import context
 from .hbacrule import is_all
 from ipapython.dn import DN
 
@@ -77,6 +78,53 @@ NETGROUP_PATTERN_ERRMSG='may only include letters, numbers, _, -, and .'
 NISDOMAIN_PATTERN=NETGROUP_PATTERN
 NISDOMAIN_PATTERN_ERRMSG=NETGROUP_PATTERN_ERRMSG
 
+
+def get_managed_netgroups(ldap, dns):
+    """
+    Return the set of DNs from dns which are netgroups managed by the
+    Managed Entries plugin, i.e. netgroups created for host groups.
+
+    The netgroups not checked yet during the current request are checked
+    with a single search, so entries which are members of many netgroups
+    can be processed without a search per netgroup.
+    """
+    ng_container = DN(api.env.container_netgroup, api.env.basedn)
+    try:
+        cache = context.managed_netgroups
+    except AttributeError:
+        cache = context.managed_netgroups = {}
+
+    unknown = set()
+    for dn in dns:
+        dn = DN(dn)
+        if dn in cache:
+            continue
+        if not dn.endswith(ng_container) or dn == ng_container:
+            cache[dn] = False
+            continue
+        unknown.add(dn)
+
+    if unknown:
+        filter = ldap.combine_filters(
+            [ldap.make_filter({'objectclass': 'mepmanagedentry'}),
+             ldap.combine_filters(
+                 [ldap.make_filter_from_attr(dn[0].attr, dn[0].value)
+                  for dn in sorted(unknown)],
+                 rules=ldap.MATCH_ANY)],
+            rules=ldap.MATCH_ALL)
+        try:
+            entries, _truncated = ldap.find_entries(
+                filter=filter, attrs_list=[''], base_dn=ng_container,
+                size_limit=0, paged_search=True)
+        except errors.NotFound:
+            entries = []
+        managed = set(entry.dn for entry in entries)
+        for dn in unknown:
+            cache[dn] = dn in managed
+
+    return set(DN(dn) for dn in dns if cache[DN(dn)])
+
+
 output_params = (
         Str('memberuser_user?',
             label='Member User',
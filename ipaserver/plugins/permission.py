@@ -1247,6 +1247,9 @@ class permission_find(baseldap.LDAPSearch):
     msg_summary = ngettext(
         '%(count)d permission matched', '%(count)d permissions matched', 0)
 
+    # legacy permissions found in ACIs are added to every result
+    paged_results = False
+
     def execute(self, *keys, **options):
         self.obj.preprocess_options(options, merge_targetfilter=True)
         return super(permission_find, self).execute(*keys, **options)
@@ -17,11 +17,13 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import copy
+
 import netaddr
 import six
 
 from ipalib import api, errors
-from ipalib import Str, StrEnum, Bool, Int
+from ipalib import Command, Str, StrEnum, Bool, Int
 from ipalib.plugable import Registry
 from .baseldap import (LDAPObject, LDAPCreate, LDAPDelete,
                                      LDAPUpdate, LDAPSearch, LDAPRetrieve,
@@ -35,6 +37,7 @@ from .hbacrule import is_all
 from ipalib import _, ngettext
 from ipalib.util import validate_hostmask
 from ipapython.dn import DN
+from ipaserver.sudopolicy import get_sudo_policy
 
 if six.PY3:
     unicode = str
@@ -92,6 +95,10 @@ EXAMPLES:
  Set SELinux type and role transitions on a rule:
    ipa sudorule-add-option sysadmin_sudo --sudooption type=unconfined_t
    ipa sudorule-add-option sysadmin_sudo --sudooption role=unconfined_r
+""") + _("""
+ Export the enabled rules with their members expanded, unless the policy
+ still has the hash returned by a previous export:
+   ipa sudorule-export --if-none-match <hash>
 """)
 
 register = Registry()
@@ -1000,3 +1007,59 @@ class sudorule_remove_option(LDAPQuery):
         entry_attrs = entry_to_dict(entry_attrs, **options)
 
         return dict(result=entry_attrs, value=pkey_to_value(cn, options))
+
+
+@register()
+class sudorule_export(Command):
+    __doc__ = _('Export the compiled Sudo policy.')
+
+    takes_options = (
+        Str('if_none_match?',
+            cli_name='if_none_match',
+            label=_('If-None-Match'),
+            doc=_('Hash of a previously exported policy; no rules are '
+                  'returned if the policy has not changed since'),
+        ),
+    )
+
+    has_output = (
+        output.summary,
+        output.ListOfEntries('result'),
+        output.Output('hash', unicode, _('Policy hash')),
+        output.Output('modified', bool, _('Policy modified'),
+                      ['no_display']),
+    )
+
+    has_output_params = (
+        Str('cn', label=_('Rule name')),
+        Str('sudouser', label=_('Sudo Users')),
+        Str('sudohost', label=_('Sudo Hosts')),
+        Str('sudocommand', label=_('Sudo Commands')),
+        Str('sudorunasuser', label=_('Sudo RunAs Users')),
+        Str('sudorunasgroup', label=_('Sudo RunAs Groups')),
+        Str('sudooption', label=_('Sudo Options')),
+        Str('sudonotbefore', label=_('Sudo Not Before')),
+        Str('sudonotafter', label=_('Sudo Not After')),
+        Int('sudoorder', label=_('Sudo order')),
+    )
+
+    def execute(self, **options):
+        policy = get_sudo_policy(self.api)
+        modified = options.get('if_none_match') != policy.hash
+        if modified:
+            # the compiled rules are shared with other requests
+            result = copy.deepcopy(policy.compiled)
+            summary = ngettext(
+                'Sudo policy with %(count)d rule',
+                'Sudo policy with %(count)d rules', len(result)
+            ) % dict(count=len(result))
+        else:
+            result = []
+            summary = _('Sudo policy not modified')
+
+        return dict(
+            result=result,
+            hash=unicode(policy.hash),
+            modified=modified,
+            summary=unicode(summary),
+        )
@@ -36,7 +36,6 @@ from ipapython import kerberos
 from ipapython.dn import DN
 
 if api.env.in_server:
-    import pki.account
     import pki.key
 
 if six.PY3:
@@ -816,23 +815,17 @@ class vault_del(LDAPDelete):
     def post_callback(self, ldap, dn, *args, **options):
         assert isinstance(dn, DN)
 
-        kra_client = self.api.Backend.kra.get_client()
-
-        kra_account = pki.account.AccountClient(kra_client.connection)
-        kra_account.login()
-
         client_key_id = self.obj.get_key_id(dn)
 
-        # deactivate vault record in KRA
-        response = kra_client.keys.list_keys(
-            client_key_id, pki.key.KeyClient.KEY_STATUS_ACTIVE)
+        with self.api.Backend.kra.session() as kra_client:
+            # deactivate vault record in KRA
+            response = kra_client.keys.list_keys(
+                client_key_id, pki.key.KeyClient.KEY_STATUS_ACTIVE)
 
-        for key_info in response.key_infos:
-            kra_client.keys.modify_key_status(
-                key_info.get_key_id(),
-                pki.key.KeyClient.KEY_STATUS_INACTIVE)
-
-        kra_account.logout()
+            for key_info in response.key_infos:
+                kra_client.keys.modify_key_status(
+                    key_info.get_key_id(),
+                    pki.key.KeyClient.KEY_STATUS_INACTIVE)
 
         return True
 
@@ -1037,35 +1030,29 @@ class vault_archive_internal(PKQuery):
         # retrieve vault info
         vault = self.api.Command.vault_show(*args, **options)['result']
 
-        # connect to KRA
-        kra_client = self.api.Backend.kra.get_client()
-
-        kra_account = pki.account.AccountClient(kra_client.connection)
-        kra_account.login()
-
         client_key_id = self.obj.get_key_id(vault['dn'])
 
-        # deactivate existing vault record in KRA
-        response = kra_client.keys.list_keys(
-            client_key_id,
-            pki.key.KeyClient.KEY_STATUS_ACTIVE)
-
-        for key_info in response.key_infos:
-            kra_client.keys.modify_key_status(
-                key_info.get_key_id(),
-                pki.key.KeyClient.KEY_STATUS_INACTIVE)
-
-        # forward wrapped data to KRA
-        kra_client.keys.archive_encrypted_data(
-            client_key_id,
-            pki.key.KeyClient.PASS_PHRASE_TYPE,
-            wrapped_vault_data,
-            wrapped_session_key,
-            None,
-            nonce,
-        )
-
-        kra_account.logout()
+        # connect to KRA
+        with self.api.Backend.kra.session() as kra_client:
+            # deactivate existing vault record in KRA
+            response = kra_client.keys.list_keys(
+                client_key_id,
+                pki.key.KeyClient.KEY_STATUS_ACTIVE)
+
+            for key_info in response.key_infos:
+                kra_client.keys.modify_key_status(
+                    key_info.get_key_id(),
+                    pki.key.KeyClient.KEY_STATUS_INACTIVE)
+
+            # forward wrapped data to KRA
+            kra_client.keys.archive_encrypted_data(
+                client_key_id,
+                pki.key.KeyClient.PASS_PHRASE_TYPE,
+                wrapped_vault_data,
+                wrapped_session_key,
+                None,
+                nonce,
+            )
 
         response = {
             'value': args[-1],
@@ -1104,31 +1091,25 @@ class vault_retrieve_internal(PKQuery):
         # retrieve vault info
         vault = self.api.Command.vault_show(*args, **options)['result']
 
-        # connect to KRA
-        kra_client = self.api.Backend.kra.get_client()
-
-        kra_account = pki.account.AccountClient(kra_client.connection)
-        kra_account.login()
-
         client_key_id = self.obj.get_key_id(vault['dn'])
 
-        # find vault record in KRA
-        response = kra_client.keys.list_keys(
-            client_key_id,
-            pki.key.KeyClient.KEY_STATUS_ACTIVE)
-
-        if not len(response.key_infos):
+        # connect to KRA
+        with self.api.Backend.kra.session() as kra_client:
+            # find vault record in KRA
+            response = kra_client.keys.list_keys(
+                client_key_id,
+                pki.key.KeyClient.KEY_STATUS_ACTIVE)
+
+            key_infos = response.key_infos
+            if key_infos:
+                # retrieve encrypted data from KRA
+                key = kra_client.keys.retrieve_key(
+                    key_infos[0].get_key_id(),
+                    wrapped_session_key)
+
+        if not key_infos:
             raise errors.NotFound(reason=_('No archived data.'))
 
-        key_info = response.key_infos[0]
-
-        # retrieve encrypted data from KRA
-        key = kra_client.keys.retrieve_key(
-            key_info.get_key_id(),
-            wrapped_session_key)
-
-        kra_account.logout()
-
         response = {
             'value': args[-1],
             'result': {
@@ -24,7 +24,11 @@ Also see the `ipalib.rpc` module.
 """
 
 from xml.sax.saxutils import escape
+import cProfile
+import itertools
 import os
+import pstats
+import random
 import traceback
 
 import gssapi
@@ -39,7 +43,7 @@ from six.moves.urllib.parse import parse_qs
 from six.moves.xmlrpc_client import Fault
 # pylint: enable=import-error
 
-from ipalib import plugable, errors
+from ipalib import plugable, errors, timing
 from ipalib.capabilities import VERSION_WITHOUT_CAPABILITIES
 from ipalib.frontend import Local
 from ipalib.install.kinit import kinit_armor, kinit_password
@@ -49,7 +53,7 @@ from ipalib.errors import (PublicError, InternalError, JSONError,
     ExecutionError, PasswordExpired, KrbPrincipalExpired, UserLocked)
 from ipalib.request import context, destroy_context
 from ipalib.rpc import (xml_dumps, xml_loads,
-    json_encode_binary, json_decode_binary)
+    json_encode_binary, json_iterencode_binary, json_decode_binary)
 from ipalib.util import normalize_name
 from ipapython.dn import DN
 from ipaserver.plugins.ldap2 import ldap2
@@ -71,6 +75,9 @@ if six.PY3:
 HTTP_STATUS_SUCCESS = '200 Success'
 HTTP_STATUS_SERVER_ERROR = '500 Internal Server Error'
 
+# number of functions logged for a profiled command
+PROFILE_LINES = 30
+
 _not_found_template = """<html>
 <head>
 <title>404 Not Found</title>
@@ -340,9 +347,12 @@ class WSGIExecutioner(Executioner):
 
         e = None
         if not 'HTTP_REFERER' in environ:
-            return self.marshal(result, RefererError(referer='missing'), _id)
+            return self._marshal_response(
+                result, RefererError(referer='missing'), _id)
         if not environ['HTTP_REFERER'].startswith('https://%s/ipa' % self.api.env.host) and not self.env.in_tree:
-            return self.marshal(result, RefererError(referer=environ['HTTP_REFERER']), _id)
+            return self._marshal_response(
+                result, RefererError(referer=environ['HTTP_REFERER']), _id)
+        request_timing = timing.start()
         try:
             if ('HTTP_ACCEPT_LANGUAGE' in environ):
                 lang_reg_w_q = environ['HTTP_ACCEPT_LANGUAGE'].split(',')[0]
@@ -353,19 +363,22 @@ class WSGIExecutioner(Executioner):
                 else:
                     reg = lang_.upper()
                 os.environ['LANG'] = '%s_%s' % (lang_, reg)
-            if (
-                environ.get('CONTENT_TYPE', '').startswith(self.content_type)
-                and environ['REQUEST_METHOD'] == 'POST'
-            ):
-                data = read_input(environ)
-                (name, args, options, _id) = self.unmarshal(data)
-            else:
-                (name, args, options, _id) = self.simple_unmarshal(environ)
+            with timing.phase('decode'):
+                if (
+                    environ.get('CONTENT_TYPE', '').startswith(
+                        self.content_type)
+                    and environ['REQUEST_METHOD'] == 'POST'
+                ):
+                    data = read_input(environ)
+                    (name, args, options, _id) = self.unmarshal(data)
+                else:
+                    (name, args, options, _id) = self.simple_unmarshal(
+                        environ)
             if name in self._system_commands:
                 result = self._system_commands[name](self, *args, **options)
             else:
                 command = self._get_command(name)
-                result = command(*args, **options)
+                result = self._call_command(command, args, options)
         except PublicError as e:
             if self.api.env.debug:
                 self.debug('WSGI wsgi_execute PublicError: %s', traceback.format_exc())
@@ -407,7 +420,100 @@ class WSGIExecutioner(Executioner):
                       type(error).__name__)
 
         version = options.get('version', VERSION_WITHOUT_CAPABILITIES)
-        return self.marshal(result, error, _id, version)
+        with timing.phase('marshal'):
+            response = self._marshal_response(result, error, _id, version)
+
+        if isinstance(response, bytes):
+            self._log_timing(request_timing, principal, name)
+            return response
+
+        # the rest of a chunked response is serialized while it is sent, the
+        # timing is logged once it is sent completely
+        return self._timed_response(
+            response, request_timing, principal, name)
+
+    def _log_timing(self, request_timing, principal, name):
+        request_timing.stop()
+        if self.api.env.log_timing:
+            log = self.info
+        else:
+            log = self.debug
+        log('[%s] %s: %s: timing %s',
+            type(self).__name__,
+            principal,
+            name,
+            request_timing.format())
+
+    def _timed_response(self, chunks, request_timing, principal, name):
+        """
+        Yield the chunks of a response, adding the time spent serializing
+        them to the marshal phase, and log the timing of the request when
+        the response is sent or abandoned.
+
+        The request context may be destroyed by then, so request_timing is
+        used directly.
+        """
+        chunks = iter(chunks)
+        try:
+            while True:
+                with request_timing.phase('marshal'):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            self._log_timing(request_timing, principal, name)
+
+    def _marshal_response(self, result, error, _id=None,
+                          version=VERSION_WITHOUT_CAPABILITIES):
+        """
+        Marshal the response, serializing the first chunk of a chunked one
+        """
+        response = self.marshal(result, error, _id, version)
+        if isinstance(response, bytes):
+            return response
+
+        # serialize the first chunk before the status is sent, so that an
+        # error in it, which holds the whole of most responses, is still
+        # reported as a server error
+        chunks = iter(response)
+        first = next(chunks, b'')
+        return itertools.chain([first], self._stream_response(chunks))
+
+    def _stream_response(self, chunks):
+        """
+        Yield the remaining chunks of a response.
+
+        The status and headers are sent already, so an error can only be
+        logged; the client receives a truncated body.
+        """
+        try:
+            for chunk in chunks:
+                yield chunk
+        except Exception as e:
+            self.exception(
+                'WSGI %s: failed to serialize the response, the response is '
+                'truncated: %s: %s', self.name, e.__class__.__name__, str(e))
+
+    def _call_command(self, command, args, options):
+        """
+        Call the command, profiling one call in env.profile_sample
+        """
+        sample = self.api.env.profile_sample
+        if not sample or random.randrange(sample):
+            return command(*args, **options)
+
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(command, *args, **options)
+        finally:
+            stream = six.StringIO()
+            stats = pstats.Stats(profiler, stream=stream)
+            stats.sort_stats('cumulative').print_stats(PROFILE_LINES)
+            self.info('[%s] profile of %s:\n%s',
+                      type(self).__name__,
+                      command.name,
+                      stream.getvalue())
 
     def simple_unmarshal(self, environ):
         name = environ['PATH_INFO'].strip('/')
@@ -428,6 +534,10 @@ class WSGIExecutioner(Executioner):
             else:
                 headers = [('Content-Type',
                             self.content_type + '; charset=utf-8')]
+            request_timing = timing.current()
+            if self.api.env.timing_header and request_timing is not None:
+                headers = headers + [
+                    ('X-IPA-Timing', request_timing.format())]
         except Exception:
             self.exception('WSGI %s.__call__():', self.name)
             status = HTTP_STATUS_SERVER_ERROR
@@ -435,13 +545,23 @@ class WSGIExecutioner(Executioner):
             headers = [('Content-Type', 'text/plain; charset=utf-8')]
 
         start_response(status, headers)
-        return [response]
+        if isinstance(response, bytes):
+            return [response]
+        # marshal() may return an iterable of chunks
+        return response
 
     def unmarshal(self, data):
         raise NotImplementedError('%s.unmarshal()' % type(self).__name__)
 
     def marshal(self, result, error, _id=None,
                 version=VERSION_WITHOUT_CAPABILITIES):
+        """
+        Serialize the response, either to bytes or to an iterable of bytes
+        chunks.
+
+        Only the first chunk is produced before the response status is sent,
+        a failure to produce a later one truncates the response.
+        """
         raise NotImplementedError('%s.marshal()' % type(self).__name__)
 
 
@@ -483,10 +603,11 @@ class jsonserver(WSGIExecutioner, HTTP_Status):
             principal=unicode(principal),
             version=unicode(VERSION),
         )
-        dump = json_encode_binary(
-            response, version, pretty_print=self.api.env.debug >= 2
-        )
-        return dump.encode('utf-8')
+        if self.api.env.debug >= 2:
+            dump = json_encode_binary(response, version, pretty_print=True)
+            return dump.encode('utf-8')
+        # large results are converted and sent in chunks, entry by entry
+        return json_iterencode_binary(response, version)
 
     def unmarshal(self, data):
         try:
@@ -5,7 +5,7 @@ from custodia.message.kem import KEMClient, KEY_USAGE_SIG, KEY_USAGE_ENC
 from jwcrypto.common import json_decode
 from jwcrypto.jwk import JWK
 from ipaserver.secrets.kem import IPAKEMKeys
-from ipaserver.secrets.store import iSecStore
+from ipaserver.secrets.store import iSecStore, encode_key_batch
 from ipaplatform.paths import paths
 from base64 import b64encode
 import ldapurl
@@ -63,6 +63,10 @@ class CustodiaClient(object):
 
         self.keystore = self._keystore(realm, ldap_uri, auth_type)
 
+        # Keep the HTTPS connection and the session cookie set by
+        # mod_auth_gssapi across requests
+        self.session = requests.Session()
+
         # FIXME: Remove warnings about missig subjAltName
         requests.packages.urllib3.disable_warnings()
 
@@ -82,30 +86,71 @@ class CustodiaClient(object):
         return {'Authorization': 'Negotiate %s' % b64encode(
             authtok).decode('ascii')}
 
-    def fetch_key(self, keyname, store=True):
-
+    def _request_key(self, keyname):
+        """
+        Perform the KEM exchange for keyname and return the decrypted value
+        """
         # Prepare URL
         url = 'https://%s/ipa/keys/%s' % (self.server, keyname)
 
         # Prepare signed/encrypted request
         encalg = ('RSA-OAEP', 'A256CBC-HS512')
         request = self.kemcli.make_request(keyname, encalg=encalg)
-
-        # Prepare Authentication header
-        headers = self._auth_header()
-
-        # Perform request
-        r = requests.get(url, headers=headers,
-                         params={'type': 'kem', 'value': request})
+        params = {'type': 'kem', 'value': request}
+
+        # Authenticate only if the session is not established yet or has
+        # expired
+        if self.session.cookies:
+            r = self.session.get(url, params=params)
+            if r.status_code == 401:
+                self.session.cookies.clear()
+        if not self.session.cookies:
+            r = self.session.get(url, headers=self._auth_header(),
+                                 params=params)
         r.raise_for_status()
         reply = r.json()
 
         if 'type' not in reply or reply['type'] != 'kem':
             raise RuntimeError('Invlid JSON response type')
 
-        value = self.kemcli.parse_reply(keyname, reply['value'])
+        return self.kemcli.parse_reply(keyname, reply['value'])
+
+    def fetch_key(self, keyname, store=True):
+        value = self._request_key(keyname)
 
         if store:
             self.keystore.set('keys/%s' % keyname, value)
         else:
             return value
+
+    def fetch_keys(self, keynames, store=True):
+        """
+        Fetch several keys in a single KEM exchange
+
+        Either all the keys are transferred or none of them. Servers which
+        do not support batches are queried for each key separately.
+
+        :param keynames: list of key names
+        :param store: if True, import the keys, otherwise return a
+            dictionary mapping key names to their values
+        """
+        keynames = list(keynames)
+        batchname = 'batch/%s' % encode_key_batch(keynames)
+        try:
+            value = self._request_key(batchname)
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                raise
+            values = {}
+            for keyname in keynames:
+                values[keyname] = self._request_key(keyname)
+            if not store:
+                return values
+            for keyname in keynames:
+                self.keystore.set('keys/%s' % keyname, values[keyname])
+            return
+
+        if store:
+            self.keystore.set('keys/%s' % batchname, value)
+        else:
+            return json_decode(value)
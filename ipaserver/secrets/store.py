@@ -3,6 +3,7 @@
 from __future__ import print_function
 from base64 import b64encode, b64decode
 from custodia.store.interface import CSStore
+from jwcrypto.common import base64url_decode, base64url_encode
 from jwcrypto.common import json_decode, json_encode
 from ipaplatform.paths import paths
 from ipapython import ipautil
@@ -12,6 +13,7 @@ import os
 import shutil
 import sys
 import tempfile
+import threading
 
 
 class UnknownKeyName(Exception):
@@ -191,6 +193,86 @@ class DMLDAP(DBMAPHandler):
         conn.modify_s('cn=config', mods)
 
 
+def encode_key_batch(names):
+    """
+    Encode a list of key names (e.g. 'ca/caSigningCert cert-pki-ca') into
+    the nickname of a key of the 'batch' DB
+    """
+    return base64url_encode(json_encode(list(names)))
+
+
+def decode_key_batch(nickname):
+    names = json_decode(base64url_decode(nickname).decode('utf-8'))
+    if (not isinstance(names, list) or not names or
+            not all(isinstance(n, type(u'')) for n in names)):
+        raise ValueError('Invalid key batch')
+    return names
+
+
+def get_key_handler(config, key):
+    path = key.split('/', 3)
+    if len(path) != 3 or path[0] != 'keys':
+        raise ValueError('Invalid name')
+    if path[1] not in NAME_DB_MAP:
+        raise UnknownKeyName("Unknown DB named '%s'" % path[1])
+    dbmap = NAME_DB_MAP[path[1]]
+    return dbmap['handler'](config, dbmap, path[2])
+
+
+class KeyBatch(DBMAPHandler):
+    """
+    Exports or imports several keys at once, so that a client needs a single
+    KEM exchange to transfer them. The nickname is the encoded list of the
+    key names, see `encode_key_batch()`.
+
+    The export fails unless all the keys can be exported. Keys are imported
+    concurrently, except that keys of the same database are imported one
+    after another.
+    """
+
+    def __init__(self, config, dbmap, nickname):
+        self.handlers = []
+        for name in decode_key_batch(nickname):
+            if name.split('/', 1)[0] == 'batch':
+                raise ValueError('Nested key batch')
+            handler = get_key_handler(config, 'keys/%s' % name)
+            group = NAME_DB_MAP[name.split('/', 1)[0]].get('path', name)
+            self.handlers.append((name, group, handler))
+
+    def export_key(self):
+        values = {}
+        for name, _group, handler in self.handlers:
+            values[name] = handler.export_key()
+        return json_encode(values)
+
+    def import_key(self, value):
+        values = json_decode(value)
+        groups = {}
+        for name, group, handler in self.handlers:
+            if name not in values:
+                raise ValueError('Missing key "%s" in batch' % name)
+            groups.setdefault(group, []).append((handler, values[name]))
+
+        errors = []
+
+        def import_group(keys):
+            try:
+                for handler, key_value in keys:
+                    handler.import_key(key_value)
+            except Exception as e:  # pylint: disable=broad-except
+                errors.append(e)
+
+        threads = [threading.Thread(target=import_group, args=(keys,))
+                   for keys in groups.values()]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        if errors:
+            raise errors[0]
+
+
 NAME_DB_MAP = {
     'ca': {
         'type': 'NSSDB',
@@ -213,7 +295,10 @@ NAME_DB_MAP = {
     'dm': {
         'type': 'DMLDAP',
         'handler': DMLDAP,
-    }
+    },
+    'batch': {
+        'handler': KeyBatch,
+    },
 }
 
 
@@ -223,13 +308,7 @@ class IPASecStore(CSStore):
         self.config = config
 
     def _get_handler(self, key):
-        path = key.split('/', 3)
-        if len(path) != 3 or path[0] != 'keys':
-            raise ValueError('Invalid name')
-        if path[1] not in NAME_DB_MAP:
-            raise UnknownKeyName("Unknown DB named '%s'" % path[1])
-        dbmap = NAME_DB_MAP[path[1]]
-        return dbmap['handler'](self.config, dbmap, path[2])
+        return get_key_handler(self.config, key)
 
     def get(self, key):
         try:
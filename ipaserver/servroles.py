@@ -69,15 +69,26 @@ which accepts FQDN of a new master hosting the attribute.
 
 The available role/attribute instances are stored in
 `role_instances`/`attribute_instances` tuples.
+
+Topology Snapshot
+=================
+
+Roles and attributes do not query LDAP by themselves. Instead, they compute
+their status from a `TopologySnapshot`, which reads all master and service
+entries with a single search of the masters container and the AD trust agents
+with a single search of the hosts container. The snapshot returned by
+`get_topology_snapshot()` is shared by subsequent calls until the root DSE
+reports a change of the USN counters.
 """
 
 import abc
 from collections import namedtuple, defaultdict
+import threading
 
-from ldap import SCOPE_ONELEVEL
 import six
 
 from ipalib import _, errors
+from ipalib.request import context
 from ipapython.dn import DN
 
 
@@ -89,6 +100,112 @@ ENABLED = u'enabled'
 CONFIGURED = u'configured'
 ABSENT = u'absent'
 
+_snapshot_lock = threading.Lock()
+_snapshots = {}
+
+
+class TopologySnapshot(object):
+    """
+    Masters, service entries and AD trust agents of the topology
+
+    :param api_instance: API instance
+    :param token: value identifying the state of the directory the snapshot
+        was read from, see `get_topology_snapshot()`
+    """
+
+    def __init__(self, api_instance, token=None):
+        self.token = token
+
+        ldap2 = api_instance.Backend.ldap2
+        masters_dn = DN(api_instance.env.container_masters,
+                        api_instance.env.basedn)
+
+        try:
+            entries = ldap2.get_entries(
+                masters_dn,
+                filter='(objectclass=*)',
+                attrs_list=['cn', 'objectclass', 'ipaConfigString'])
+        except errors.EmptyResult:
+            entries = []
+
+        self.masters = []
+        self.service_entries = defaultdict(list)
+        for e in entries:
+            depth = len(e.dn) - len(masters_dn)
+            if depth == 1:
+                objectclasses = set(
+                    o.lower() for o in e.get('objectclass', []))
+                if 'ipaconfigobject' in objectclasses:
+                    self.masters.append(e['cn'][0])
+            elif depth == 2:
+                self.service_entries[e.dn[1]['cn'].lower()].append(e)
+
+        search_filter = ldap2.make_filter_from_attr(
+            "memberof",
+            DN(('cn', 'adtrust agents'), ('cn', 'sysaccounts'),
+               ('cn', 'etc'), api_instance.env.basedn)
+        )
+        try:
+            self.adtrust_agents = ldap2.get_entries(
+                DN(api_instance.env.container_host, api_instance.env.basedn),
+                filter=search_filter,
+                attrs_list=['fqdn'])
+        except errors.EmptyResult:
+            self.adtrust_agents = []
+
+    def get_service_entries(self, server=None):
+        """
+        return service entries of the given master or of all masters
+        """
+        if server is not None:
+            return list(self.service_entries.get(server.lower(), []))
+
+        return [e for key in sorted(self.service_entries)
+                for e in self.service_entries[key]]
+
+
+def _get_topology_token(ldap2):
+    """
+    Return the USN counters of the root DSE or None if they are not available
+    """
+    try:
+        entry = ldap2.get_entry(DN(), ['lastusn'])
+    except errors.NotFound:
+        return None
+
+    token = tuple(sorted(
+        (name.lower(), tuple(entry.raw[name])) for name in entry.raw
+        if name.lower().startswith('lastusn')))
+
+    return token or None
+
+
+def get_topology_snapshot(api_instance):
+    """
+    Get topology snapshot, reading it again only if the directory has changed
+    since it was last read by the same principal.
+
+    If the directory does not provide USN counters, a new snapshot is read on
+    every call.
+    """
+    ldap2 = api_instance.Backend.ldap2
+    token = _get_topology_token(ldap2)
+    key = (ldap2.ldap_uri, unicode(api_instance.env.basedn),
+           getattr(context, 'principal', None))
+
+    with _snapshot_lock:
+        snapshot = _snapshots.get(key)
+
+    if token is not None and snapshot is not None and snapshot.token == token:
+        return snapshot
+
+    snapshot = TopologySnapshot(api_instance, token)
+    if token is not None:
+        with _snapshot_lock:
+            _snapshots[key] = snapshot
+
+    return snapshot
+
 
 @six.add_metaclass(abc.ABCMeta)
 class LDAPBasedProperty(object):
@@ -130,14 +247,13 @@ class BaseServerRole(LDAPBasedProperty):
             u'status': status}
 
     @abc.abstractmethod
-    def create_search_params(self, ldap, api_instance, server=None):
+    def get_entries_from_snapshot(self, snapshot, server=None):
         """
-        create search base and filter
-        :param ldap: ldap connection
-        :param api_instance: API instance
-        :param server: server FQDN. if given, the method should generate
-        filter and search base matching only the status on this server
-        :returns: tuple of search base (a DN) and search filter
+        select the LDAP entries defining the role status
+        :param snapshot: `TopologySnapshot` instance
+        :param server: server FQDN. if given, the method should return only
+        entries defining the status on this server
+        :returns: list of LDAPEntry objects
         """
         pass
 
@@ -146,34 +262,23 @@ class BaseServerRole(LDAPBasedProperty):
         """
         Get role status from returned LDAP entries
 
-        :param entries: LDAPEntry objects returned by `search()`
+        :param entries: LDAPEntry objects returned by
+                        `get_entries_from_snapshot()`
         :returns: list of dicts generated by `create_role_status_dict()`
                   method
         """
         pass
 
-    def _fill_in_absent_masters(self, ldap2, api_instance, result):
+    def _fill_in_absent_masters(self, snapshot, result):
         """
         get all masters on which the role is absent
 
-        :param ldap2: LDAP connection
-        :param api_instance: API instance
+        :param snapshot: `TopologySnapshot` instance
         :param result: output of `get_result_from_entries` method
 
         :returns: list of masters on which the role is absent
         """
-        search_base = DN(api_instance.env.container_masters,
-                         api_instance.env.basedn)
-        search_filter = '(objectclass=ipaConfigObject)'
-        attrs_list = ['cn']
-
-        all_masters = ldap2.get_entries(
-            search_base,
-            filter=search_filter,
-            scope=SCOPE_ONELEVEL,
-            attrs_list=attrs_list)
-
-        all_master_cns = set(m['cn'][0] for m in all_masters)
+        all_master_cns = set(snapshot.masters)
         enabled_configured_masters = set(r[u'server_server'] for r in result)
 
         absent_masters = all_master_cns.difference(enabled_configured_masters)
@@ -181,7 +286,7 @@ class BaseServerRole(LDAPBasedProperty):
         return [self.create_role_status_dict(m, ABSENT) for m in
                 absent_masters]
 
-    def status(self, api_instance, server=None, attrs_list=("*",)):
+    def status(self, api_instance, server=None, snapshot=None):
         """
         probe and return status of the role either on single server or on the
         whole topology
@@ -189,22 +294,17 @@ class BaseServerRole(LDAPBasedProperty):
         :param api_instance: API instance
         :param server: server FQDN. If given, only the status of the role on
                        this master will be returned
+        :param snapshot: `TopologySnapshot` to use, by default the one returned
+                         by `get_topology_snapshot()`
         :returns: * 'enabled' if the role is enabled on the master
                   * 'configured' if it is not enabled but has
                     been configured by installer
                   * 'absent' otherwise
         """
-        ldap2 = api_instance.Backend.ldap2
-        search_base, search_filter = self.create_search_params(
-            ldap2, api_instance, server=server)
+        if snapshot is None:
+            snapshot = get_topology_snapshot(api_instance)
 
-        try:
-            entries = ldap2.get_entries(
-                search_base,
-                filter=search_filter,
-                attrs_list=attrs_list)
-        except errors.EmptyResult:
-            entries = []
+        entries = self.get_entries_from_snapshot(snapshot, server=server)
 
         if not entries and server is not None:
             return [self.create_role_status_dict(server, ABSENT)]
@@ -212,8 +312,7 @@ class BaseServerRole(LDAPBasedProperty):
         result = self.get_result_from_entries(entries)
 
         if server is None:
-            result.extend(
-                self._fill_in_absent_masters(ldap2, api_instance, result))
+            result.extend(self._fill_in_absent_masters(snapshot, result))
 
         return sorted(result, key=lambda x: x[u'server_server'])
 
@@ -249,40 +348,39 @@ class ServerAttribute(LDAPBasedProperty):
         raise NotImplementedError(
             "{}: no valid associated role found".format(self.attr_name))
 
-    def create_search_filter(self, ldap):
+    def _is_set_on_entry(self, entry):
         """
-        Create search filter which matches LDAP data corresponding to the
-        attribute
+        determine whether the entry is the associated service entry with the
+        attribute set. Both the service name and ipaConfigString values are
+        case-insensitive.
         """
-        svc_filter = ldap.make_filter_from_attr(
-            'cn', self.associated_service_name)
+        if entry['cn'][0].lower() != self.associated_service_name.lower():
+            return False
 
-        configstring_filter = ldap.make_filter_from_attr(
-            'ipaConfigString', self.ipa_config_string_value)
-        return ldap.combine_filters(
-            [svc_filter, configstring_filter], rules=ldap.MATCH_ALL)
+        return self.ipa_config_string_value.lower() in set(
+            v.lower() for v in entry.get('ipaConfigString', []))
 
-    def get(self, api_instance):
+    def get(self, api_instance, snapshot=None):
         """
         get the master which has the attribute set
         :param api_instance: API instance
+        :param snapshot: `TopologySnapshot` to use, by default the one returned
+                         by `get_topology_snapshot()`
         :returns: master FQDN
         """
-        ldap2 = api_instance.Backend.ldap2
-        search_base = DN(api_instance.env.container_masters,
-                         api_instance.env.basedn)
+        if snapshot is None:
+            snapshot = get_topology_snapshot(api_instance)
 
-        search_filter = self.create_search_filter(ldap2)
+        entries = [e for e in snapshot.get_service_entries()
+                   if self._is_set_on_entry(e)]
 
-        try:
-            entries = ldap2.get_entries(search_base, filter=search_filter)
-        except errors.EmptyResult:
+        if not entries:
             return
 
         master_cn = entries[0].dn[1]['cn']
 
         associated_role_providers = set(
-            self._get_assoc_role_providers(api_instance))
+            self._get_assoc_role_providers(api_instance, snapshot))
 
         if master_cn not in associated_role_providers:
             raise errors.ValidationError(
@@ -333,13 +431,13 @@ class ServerAttribute(LDAPBasedProperty):
 
         ldap.update_entry(service_entry)
 
-    def _get_assoc_role_providers(self, api_instance):
+    def _get_assoc_role_providers(self, api_instance, snapshot=None):
         """
         get list of all servers on which the associated role is enabled
         """
         return [
             r[u'server_server'] for r in self.associated_role.status(
-                api_instance) if r[u'status'] == ENABLED]
+                api_instance, snapshot=snapshot) if r[u'status'] == ENABLED]
 
     def _remove(self, api_instance, master):
         """
@@ -355,17 +453,19 @@ class ServerAttribute(LDAPBasedProperty):
         service_entry = self._get_masters_service_entry(ldap, master_dn)
         self._remove_attribute_from_svc_entry(ldap, service_entry)
 
-    def _add(self, api_instance, master):
+    def _add(self, api_instance, master, snapshot=None):
         """
         add attribute to the master
         :param api_instance: API instance
         :param master: master FQDN
+        :param snapshot: `TopologySnapshot` used to check the associated role
 
         :raises: * errors.ValidationError if the associated role is not enabled
                    on the master
         """
 
-        assoc_role_providers = self._get_assoc_role_providers(api_instance)
+        assoc_role_providers = self._get_assoc_role_providers(
+            api_instance, snapshot)
         ldap = api_instance.Backend.ldap2
 
         if master not in assoc_role_providers:
@@ -391,12 +491,13 @@ class ServerAttribute(LDAPBasedProperty):
         :raises: errors.EmptyModlist if the new masters is the same as
                  the original on
         """
-        old_master = self.get(api_instance)
+        snapshot = get_topology_snapshot(api_instance)
+        old_master = self.get(api_instance, snapshot)
 
         if old_master == master:
             raise errors.EmptyModlist
 
-        self._add(api_instance, master)
+        self._add(api_instance, master, snapshot)
 
         if old_master is not None:
             self._remove(api_instance, old_master)
@@ -480,25 +581,11 @@ class ServiceBasedRole(BaseServerRole):
 
         return result
 
-    def create_search_params(self, ldap, api_instance, server=None):
-        search_base = DN(api_instance.env.container_masters,
-                         api_instance.env.basedn)
-
-        search_filter = ldap.make_filter_from_attr(
-            'cn',
-            self.component_services,
-            rules=ldap.MATCH_ANY,
-            exact=True
-        )
-
-        if server is not None:
-            search_base = DN(('cn', server), search_base)
-
-        return search_base, search_filter
+    def get_entries_from_snapshot(self, snapshot, server=None):
+        component_services = set(s.lower() for s in self.component_services)
 
-    def status(self, api_instance, server=None):
-        return super(ServiceBasedRole, self).status(
-            api_instance, server=server, attrs_list=('ipaConfigString', 'cn'))
+        return [e for e in snapshot.get_service_entries(server)
+                if e['cn'][0].lower() in component_services]
 
 
 class ADtrustBasedRole(BaseServerRole):
@@ -516,27 +603,12 @@ class ADtrustBasedRole(BaseServerRole):
             )
         return result
 
-    def create_search_params(self, ldap, api_instance, server=None):
-        search_base = DN(
-            api_instance.env.container_host, api_instance.env.basedn)
-
-        search_filter = ldap.make_filter_from_attr(
-            "memberof",
-            DN(('cn', 'adtrust agents'), ('cn', 'sysaccounts'),
-               ('cn', 'etc'), api_instance.env.basedn)
-        )
-        if server is not None:
-            server_filter = ldap.make_filter_from_attr(
-                'fqdn',
-                server,
-                exact=True
-            )
-            search_filter = ldap.combine_filters(
-                [search_filter, server_filter],
-                rules=ldap.MATCH_ALL
-            )
+    def get_entries_from_snapshot(self, snapshot, server=None):
+        if server is None:
+            return list(snapshot.adtrust_agents)
 
-        return search_base, search_filter
+        return [e for e in snapshot.adtrust_agents
+                if e['fqdn'][0].lower() == server.lower()]
 
 
 role_instances = (
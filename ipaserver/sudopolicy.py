@@ -0,0 +1,497 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Compiled sudo policy.
+
+The sudo rules are compiled into the flattened form of the sudoRole entries
+of the ``ou=sudoers`` compat tree: user, host and command memberships are
+expanded to user names, host names and commands, the same way the schema
+compatibility plugin does, so that clients can read the whole policy at once
+instead of searching the compat tree.
+
+The compiled policy of the directory is kept in a `SudoPolicy` snapshot with
+a content hash. The hash only depends on the compiled rules, so it is the
+same on every server and in every process and clients use it to find out
+whether the policy changed. The snapshot returned by `get_sudo_policy()` is
+shared by subsequent calls and brought up to date incrementally: the entries
+changed since it was compiled are found with their entryUSN, and only the
+rules which are among them or refer to them are compiled again.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import six
+
+from ipalib import errors
+from ipalib.request import context
+from ipapython.dn import DN
+
+if six.PY3:
+    unicode = str
+
+#: attributes of sudo rules read by the compiler
+SUDORULE_ATTRS = [
+    'cn', 'ipaenabledflag', 'compatvisible', 'usercategory', 'hostcategory',
+    'cmdcategory', 'ipasudorunasusercategory', 'ipasudorunasgroupcategory',
+    'memberuser', 'externaluser', 'memberhost', 'externalhost', 'hostmask',
+    'memberallowcmd', 'memberdenycmd', 'ipasudorunas', 'ipasudorunasextuser',
+    'ipasudorunasextusergroup', 'ipasudorunasgroup', 'ipasudorunasextgroup',
+    'ipasudoopt', 'sudonotbefore', 'sudonotafter', 'sudoorder',
+]
+
+#: attributes of sudo rules which refer to other entries
+MEMBER_ATTRS = ('memberuser', 'memberhost', 'memberallowcmd',
+                'memberdenycmd', 'ipasudorunas', 'ipasudorunasgroup')
+
+#: maximal number of values in a single search filter
+FILTER_CHUNK_SIZE = 100
+
+#: maximal number of policies kept by get_sudo_policy()
+POLICY_CACHE_SIZE = 16
+
+_policy_lock = threading.Lock()
+# least recently used first
+_policies = OrderedDict()
+
+
+def _chunks(values, size=FILTER_CHUNK_SIZE):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _rdn_filters(ldap, dns):
+    """
+    Yield filters matching the entries with the given DNs in their
+    container by the values of their RDN
+    """
+    by_attr = OrderedDict()
+    for dn in dns:
+        by_attr.setdefault(dn[0].attr.lower(), []).append(dn[0].value)
+    for attr, values in by_attr.items():
+        for chunk in _chunks(values):
+            yield ldap.make_filter_from_attr(attr, chunk,
+                                             rules=ldap.MATCH_ANY)
+
+
+def _search(ldap, base_dn, filters, attrs_list, scope=None):
+    """
+    Return the entries matching any of the filters, searching once per
+    filter
+    """
+    if scope is None:
+        scope = ldap.SCOPE_SUBTREE
+    entries = []
+    for search_filter in filters:
+        try:
+            result, _truncated = ldap.find_entries(
+                base_dn=base_dn, scope=scope, filter=search_filter,
+                attrs_list=attrs_list, size_limit=0, paged_search=True)
+        except errors.NotFound:
+            continue
+        entries.extend(result)
+    return entries
+
+
+def _is_all(entry, attr):
+    return entry.single_value.get(attr, u'').lower() == u'all'
+
+
+def _is_false(entry, attr):
+    return unicode(entry.single_value.get(attr, u'')).upper() == u'FALSE'
+
+
+class _Members(object):
+    """
+    Member entries of sudo rules, read in bulk.
+
+    Users and hosts are named after the RDN of their entries. Groups, host
+    groups, netgroups and sudo commands are read with one search per
+    container and the members of non-POSIX groups, of host groups and of
+    sudo command groups with one search on their memberOf attribute.
+    """
+    def __init__(self, api_instance, ldap):
+        self.ldap = ldap
+        basedn = api_instance.env.basedn
+        self.containers = OrderedDict(
+            (kind, DN(api_instance.env['container_%s' % kind], basedn))
+            for kind in ('user', 'group', 'host', 'hostgroup', 'netgroup',
+                         'sudocmd', 'sudocmdgroup'))
+        self.entries = {}
+        self.group_users = {}
+        self.hostgroup_hosts = {}
+        self.cmdgroup_commands = {}
+
+    def kind(self, dn):
+        """
+        Return the kind of member dn refers to, or None
+        """
+        for kind, container in self.containers.items():
+            if len(dn) == len(container) + 1 and dn.endswith(container):
+                return kind
+        return None
+
+    def _read(self, kind, dns, attrs_list):
+        dns = [dn for dn in dns if dn not in self.entries]
+        for entry in _search(self.ldap, self.containers[kind],
+                             _rdn_filters(self.ldap, dns), attrs_list):
+            self.entries[entry.dn] = entry
+
+    def _read_members(self, kind, groups, attrs_list):
+        result = dict((dn, set()) for dn in groups)
+        filters = (
+            self.ldap.make_filter_from_attr('memberof', chunk,
+                                            rules=self.ldap.MATCH_ANY)
+            for chunk in _chunks(result))
+        for entry in _search(self.ldap, self.containers[kind], filters,
+                             attrs_list + ['memberof']):
+            value = entry.single_value.get(attrs_list[0])
+            if value is None:
+                continue
+            for dn in entry.get('memberof', []):
+                if dn in result:
+                    result[dn].add(value)
+        return result
+
+    def load(self, rules):
+        """
+        Read the members of the rules which were not read before
+        """
+        by_kind = dict((kind, set()) for kind in self.containers)
+        for rule in rules:
+            for attr in MEMBER_ATTRS:
+                for dn in rule.get(attr, []):
+                    kind = self.kind(dn)
+                    if kind is not None:
+                        by_kind[kind].add(dn)
+
+        self._read('group', by_kind['group'], ['cn', 'objectclass'])
+        self._read('hostgroup', by_kind['hostgroup'], ['cn', 'objectclass'])
+        self._read('netgroup', by_kind['netgroup'], ['cn'])
+        self._read('sudocmd', by_kind['sudocmd'], ['sudocmd'])
+
+        # only the groups of users are expanded, not the runAs ones
+        groups = [dn for rule in rules for dn in rule.get('memberuser', [])
+                  if self.kind(dn) == 'group' and dn in self.entries and
+                  dn not in self.group_users and not self.is_posix_group(dn)]
+        self.group_users.update(
+            self._read_members('user', groups, ['uid']))
+        hostgroups = [dn for dn in by_kind['hostgroup']
+                      if dn in self.entries and
+                      dn not in self.hostgroup_hosts and
+                      not self.is_netgroup_hostgroup(dn)]
+        self.hostgroup_hosts.update(
+            self._read_members('host', hostgroups, ['fqdn']))
+        cmdgroups = [dn for dn in by_kind['sudocmdgroup']
+                     if dn not in self.cmdgroup_commands]
+        self.cmdgroup_commands.update(
+            self._read_members('sudocmd', cmdgroups, ['sudocmd']))
+
+    def _objectclasses(self, dn):
+        entry = self.entries.get(dn)
+        if entry is None:
+            return set()
+        return set(o.lower() for o in entry.get('objectclass', []))
+
+    def is_posix_group(self, dn):
+        return 'posixgroup' in self._objectclasses(dn)
+
+    def is_netgroup_hostgroup(self, dn):
+        # host groups with a managed netgroup are referred to by the
+        # netgroup, like in the compat tree
+        return 'meporiginentry' in self._objectclasses(dn)
+
+    def name(self, dn, attr='cn'):
+        entry = self.entries.get(dn)
+        if entry is None:
+            return None
+        return entry.single_value.get(attr)
+
+    def users(self, dns, runas=False):
+        """
+        Return the sudo names of the users and groups: user names and
+        %group for POSIX groups. Unless runas is set, non-POSIX groups are
+        expanded to their members and netgroups are named +netgroup.
+        """
+        names = set()
+        for dn in dns:
+            kind = self.kind(dn)
+            if kind == 'user':
+                names.add(dn[0].value)
+            elif kind == 'group' and self.is_posix_group(dn):
+                names.add(u'%%%s' % self.name(dn))
+            elif runas:
+                continue
+            elif kind == 'group':
+                names.update(self.group_users.get(dn, ()))
+            elif kind == 'netgroup' and self.name(dn) is not None:
+                names.add(u'+%s' % self.name(dn))
+        return names
+
+    def hosts(self, dns):
+        """
+        Return the sudo names of the hosts and host groups
+        """
+        names = set()
+        for dn in dns:
+            kind = self.kind(dn)
+            if kind == 'host':
+                names.add(dn[0].value)
+            elif kind == 'hostgroup' and self.is_netgroup_hostgroup(dn):
+                names.add(u'+%s' % self.name(dn))
+            elif kind == 'hostgroup':
+                names.update(self.hostgroup_hosts.get(dn, ()))
+            elif kind == 'netgroup' and self.name(dn) is not None:
+                names.add(u'+%s' % self.name(dn))
+        return names
+
+    def commands(self, dns):
+        """
+        Return the commands of the sudo commands and sudo command groups
+        """
+        commands = set()
+        for dn in dns:
+            kind = self.kind(dn)
+            if kind == 'sudocmd' and self.name(dn, 'sudocmd') is not None:
+                commands.add(self.name(dn, 'sudocmd'))
+            elif kind == 'sudocmdgroup':
+                commands.update(self.cmdgroup_commands.get(dn, ()))
+        return commands
+
+
+def compile_rule(rule, members):
+    """
+    Compile a sudo rule entry into a dict with the attributes of the
+    corresponding sudoRole entry of the compat tree.
+
+    Returns None for rules which are not visible in the compat tree.
+    """
+    if _is_false(rule, 'ipaenabledflag') or _is_false(rule, 'compatvisible'):
+        return None
+
+    def values(*attrs):
+        result = set()
+        for attr in attrs:
+            result.update(unicode(v) for v in rule.get(attr, []))
+        return result
+
+    if _is_all(rule, 'usercategory'):
+        users = {u'ALL'}
+    else:
+        users = values('externaluser') | members.users(
+            rule.get('memberuser', []))
+
+    if _is_all(rule, 'hostcategory'):
+        hosts = {u'ALL'}
+    else:
+        hosts = (values('externalhost', 'hostmask') |
+                 members.hosts(rule.get('memberhost', [])))
+
+    if _is_all(rule, 'cmdcategory'):
+        commands = [u'ALL']
+    else:
+        commands = sorted(members.commands(rule.get('memberallowcmd', [])))
+    commands.extend(u'!%s' % command for command in sorted(
+        members.commands(rule.get('memberdenycmd', []))))
+
+    if _is_all(rule, 'ipasudorunasusercategory'):
+        runas_users = {u'ALL'}
+    else:
+        runas_users = (
+            values('ipasudorunasextuser') |
+            set(u'%%%s' % v for v in values('ipasudorunasextusergroup')) |
+            members.users(rule.get('ipasudorunas', []), runas=True))
+
+    if _is_all(rule, 'ipasudorunasgroupcategory'):
+        runas_groups = {u'ALL'}
+    else:
+        runas_groups = values('ipasudorunasextgroup') | set(
+            name[1:] for name in members.users(
+                rule.get('ipasudorunasgroup', []), runas=True)
+            if name.startswith(u'%'))
+
+    compiled = OrderedDict([
+        ('cn', rule.single_value['cn']),
+        ('sudouser', sorted(users)),
+        ('sudohost', sorted(hosts)),
+        ('sudocommand', commands),
+        ('sudorunasuser', sorted(runas_users)),
+        ('sudorunasgroup', sorted(runas_groups)),
+        ('sudooption', sorted(values('ipasudoopt'))),
+        ('sudonotbefore', sorted(values('sudonotbefore'))),
+        ('sudonotafter', sorted(values('sudonotafter'))),
+    ])
+    # like in an LDAP entry, attributes without values are left out
+    for attr, value in list(compiled.items()):
+        if not value:
+            del compiled[attr]
+    order = rule.single_value.get('sudoorder')
+    if order is not None:
+        compiled['sudoorder'] = int(order)
+    return compiled
+
+
+def rule_dependencies(rule):
+    """
+    Return the DNs of the entries the compiled rule depends on
+    """
+    deps = set([rule.dn])
+    for attr in MEMBER_ATTRS:
+        deps.update(rule.get(attr, []))
+    return frozenset(deps)
+
+
+class SudoPolicy(object):
+    """
+    Compiled sudo rules of the directory
+
+    :param rules: dict mapping the DNs of all the sudo rules to their
+        compiled form, see `compile_rule()`
+    :param dependencies: dict mapping the DNs of the rules to the DNs of the
+        entries their compiled form depends on
+    :param usn: USN of the directory when the rules were read, None if the
+        directory does not provide USNs
+    """
+    def __init__(self, rules, dependencies, usn=None):
+        self.rules = rules
+        self.dependencies = dependencies
+        self.usn = usn
+
+        compiled = [rule for rule in rules.values() if rule is not None]
+        compiled.sort(key=lambda r: (r.get('sudoorder', 0), r['cn'].lower()))
+        self.compiled = compiled
+        self.hash = hashlib.sha256(json.dumps(
+            compiled, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _get_usn(ldap):
+    """
+    Return the last USN of the main database or None if it is not available
+    """
+    try:
+        entry = ldap.get_entry(DN(), ['lastusn'])
+    except errors.NotFound:
+        return None
+
+    for name in entry.raw:
+        if name.lower() == 'lastusn;userroot':
+            try:
+                return int(entry.raw[name][0])
+            except ValueError:
+                return None
+    return None
+
+
+def _changed_entries(api_instance, ldap, usn):
+    """
+    Return the DNs of the entries modified after usn and the DNs of the
+    groups they are member of
+    """
+    try:
+        entries, _truncated = ldap.find_entries(
+            base_dn=api_instance.env.basedn,
+            filter='(entryusn>=%d)' % (usn + 1),
+            attrs_list=['memberof'],
+            size_limit=0, paged_search=True)
+    except errors.NotFound:
+        return set()
+
+    changed = set()
+    for entry in entries:
+        changed.add(entry.dn)
+        changed.update(entry.get('memberof', []))
+    return changed
+
+
+def compile_policy(api_instance, previous=None):
+    """
+    Compile the sudo rules of the directory into a new `SudoPolicy`.
+
+    If previous is set and the directory provides USNs, only the rules
+    added after it was compiled and the rules which depend on entries
+    modified after it was compiled are compiled again.
+    """
+    ldap = api_instance.Backend.ldap2
+    sudorule_dn = DN(api_instance.env.container_sudorule,
+                     api_instance.env.basedn)
+
+    # the USN is read before the entries, so a concurrent change makes the
+    # policy stale and the next update compiles it
+    usn = _get_usn(ldap)
+    if previous is None or previous.usn is None or usn is None:
+        changed = None
+    elif usn == previous.usn:
+        return previous
+    else:
+        changed = _changed_entries(api_instance, ldap, previous.usn)
+
+    if changed is None:
+        attrs_list = SUDORULE_ATTRS
+    else:
+        attrs_list = ['cn']
+    try:
+        entries, _truncated = ldap.find_entries(
+            base_dn=sudorule_dn, scope=ldap.SCOPE_ONELEVEL,
+            filter='(objectclass=ipasudorule)', attrs_list=attrs_list,
+            size_limit=0, paged_search=True)
+    except errors.NotFound:
+        entries = []
+
+    rules = OrderedDict()
+    dependencies = {}
+    if changed is None:
+        to_compile = entries
+    else:
+        to_compile = []
+        for entry in entries:
+            deps = previous.dependencies.get(entry.dn)
+            if deps is None or entry.dn in changed or deps & changed:
+                to_compile.append(entry)
+            else:
+                rules[entry.dn] = previous.rules[entry.dn]
+                dependencies[entry.dn] = deps
+
+        # read the rules to compile again with all their attributes
+        to_compile = _search(
+            ldap, sudorule_dn,
+            _rdn_filters(ldap, [entry.dn for entry in to_compile]),
+            SUDORULE_ATTRS, scope=ldap.SCOPE_ONELEVEL)
+
+    members = _Members(api_instance, ldap)
+    members.load(to_compile)
+    for entry in to_compile:
+        rules[entry.dn] = compile_rule(entry, members)
+        dependencies[entry.dn] = rule_dependencies(entry)
+
+    return SudoPolicy(rules, dependencies, usn=usn)
+
+
+def get_sudo_policy(api_instance):
+    """
+    Get the compiled sudo policy, updating the one compiled before for the
+    same principal if the directory has changed since.
+
+    The policies of the POLICY_CACHE_SIZE most recently served principals
+    are kept. If the directory does not provide USNs, the policy is
+    compiled from scratch on every call.
+    """
+    ldap = api_instance.Backend.ldap2
+    key = (ldap.ldap_uri, unicode(api_instance.env.basedn),
+           getattr(context, 'principal', None))
+
+    with _policy_lock:
+        previous = _policies.get(key)
+
+    policy = compile_policy(api_instance, previous)
+    with _policy_lock:
+        _policies.pop(key, None)
+        _policies[key] = policy
+        while len(_policies) > POLICY_CACHE_SIZE:
+            _policies.popitem(last=False)
+
+    return policy
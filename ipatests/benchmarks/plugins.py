@@ -0,0 +1,323 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Benchmarks of server plugin commands.
+
+The commands are executed by an in-server API against the in-memory directory
+of `ipatests.memldap`, populated with the requested number of users, so that
+the results show how the cost of the plugins and of the LDAP requests they
+make grows with the size of the directory, without any network or directory
+server in the way::
+
+    python -m ipatests.benchmarks.plugins --sizes 1000,10000,100000 \\
+        --repeat 5 --output results.json
+
+For every directory size there are as many groups as a tenth of the users,
+each with ten of them as members, and as many HBAC rules as a hundredth of
+the users, each allowing one of the groups to access the benchmark host with
+sshd. All users are members of the ipausers group.
+
+The results are printed and, with --output, written as a JSON document with
+the version of IPA, the version of Python and a list of results, one for each
+benchmark and directory size, with the minimum, median and maximum wall time
+of a command in seconds and the number of LDAP operations it made.
+"""
+
+from __future__ import print_function
+
+import json
+import optparse  # pylint: disable=deprecated-module
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+import ldap
+import six
+
+from ipalib import api, timing
+from ipapython.dn import DN
+from ipapython.version import VERSION
+from ipatests import memldap
+
+if six.PY3:
+    unicode = str
+
+DOMAIN = u'example.com'
+REALM = u'EXAMPLE.COM'
+HOST = u'ipa.example.com'
+BENCHMARK_HOST = u'bench.example.com'
+LDAP_URI = 'memory://benchmark'
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_REPEAT = 5
+
+#: benchmarks by name, see `benchmark`
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name):
+    """
+    Register a benchmark.
+
+    The decorated function is called before each run of the benchmark with
+    the API, the directory, its size and the number of the run, it prepares
+    the directory and returns the callable to time.
+    """
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+def user_dn(uid):
+    return DN(('uid', uid), api.env.container_user, api.env.basedn)
+
+
+def group_dn(cn):
+    return DN(('cn', cn), api.env.container_group, api.env.basedn)
+
+
+def add_user(directory, uid, number):
+    directory.add(user_dn(uid), [
+        ('objectClass', [
+            'top', 'person', 'organizationalperson', 'inetorgperson',
+            'inetuser', 'posixaccount', 'krbprincipalaux',
+            'krbticketpolicyaux', 'ipaobject', 'ipasshuser',
+            'ipaSshGroupOfPubKeys', 'mepOriginEntry']),
+        ('uid', uid),
+        ('givenName', 'Test'),
+        ('sn', 'User%d' % number),
+        ('cn', 'Test User%d' % number),
+        ('displayName', 'Test User%d' % number),
+        ('initials', 'TU'),
+        ('gecos', 'Test User%d' % number),
+        ('uidNumber', '-1'),
+        ('gidNumber', '-1'),
+        ('homeDirectory', '/home/%s' % uid),
+        ('loginShell', '/bin/sh'),
+        ('krbPrincipalName', '%s@%s' % (uid, REALM)),
+        ('krbCanonicalName', '%s@%s' % (uid, REALM)),
+        ('mail', '%s@%s' % (uid, DOMAIN)),
+        ('ipaUniqueID', 'autogenerate'),
+    ])
+
+
+def populate(size):
+    """
+    Create a directory with the given number of users
+    """
+    directory = memldap.bootstrap(REALM, DOMAIN, HOST, api.env.basedn)
+
+    for i in range(size):
+        add_user(directory, u'user%d' % i, i)
+    directory.modify(group_dn(u'ipausers'), [
+        (ldap.MOD_ADD, 'member',
+         [str(user_dn(u'user%d' % i)) for i in range(size)])])
+
+    for i in range(max(size // 10, 1)):
+        directory.add(group_dn(u'group%d' % i), [
+            ('objectClass', [
+                'top', 'groupofnames', 'nestedgroup', 'ipausergroup',
+                'ipaobject', 'posixgroup']),
+            ('cn', 'group%d' % i),
+            ('description', 'Benchmark group %d' % i),
+            ('gidNumber', '-1'),
+            ('ipaUniqueID', 'autogenerate'),
+            ('member', [str(user_dn(u'user%d' % j))
+                        for j in range(i * 10, min(i * 10 + 10, size))]),
+        ])
+
+    host_dn = DN(('fqdn', BENCHMARK_HOST), api.env.container_host,
+                 api.env.basedn)
+    directory.add(host_dn, [
+        ('objectClass', [
+            'top', 'ipaobject', 'nshost', 'ipahost', 'pkiuser',
+            'ipaservice', 'ieee802device', 'ipasshhost',
+            'ipaSshGroupOfPubKeys', 'krbprincipalaux', 'krbprincipal']),
+        ('fqdn', BENCHMARK_HOST),
+        ('cn', BENCHMARK_HOST),
+        ('serverHostName', BENCHMARK_HOST.split('.')[0]),
+        ('krbPrincipalName', 'host/%s@%s' % (BENCHMARK_HOST, REALM)),
+        ('krbCanonicalName', 'host/%s@%s' % (BENCHMARK_HOST, REALM)),
+        ('ipaUniqueID', 'autogenerate'),
+    ])
+
+    service_dn = DN(('cn', 'sshd'), api.env.container_hbacservice,
+                    api.env.basedn)
+    for i in range(max(size // 100, 1)):
+        directory.add(
+            DN(('ipaUniqueID', 'autogenerate'), api.env.container_hbac,
+               api.env.basedn),
+            [
+                ('objectClass', ['ipaassociation', 'ipahbacrule']),
+                ('cn', 'rule%d' % i),
+                ('accessRuleType', 'allow'),
+                ('ipaEnabledFlag', 'TRUE'),
+                ('memberUser', str(group_dn(u'group%d' % i))),
+                ('memberHost', str(host_dn)),
+                ('memberService', str(service_dn)),
+                ('ipaUniqueID', 'autogenerate'),
+            ])
+
+    return directory
+
+
+@benchmark('user_find')
+def bench_user_find(api, directory, size, run):
+    return lambda: api.Command.user_find(u'user1')
+
+
+@benchmark('group_add_member')
+def bench_group_add_member(api, directory, size, run):
+    uid = u'member%d' % run
+    add_user(directory, uid, size + run)
+
+    def call():
+        result = api.Command.group_add_member(u'group0', user=[uid])
+        assert result['completed'] == 1, result['failed']
+    return call
+
+
+@benchmark('hbactest')
+def bench_hbactest(api, directory, size, run):
+    if 'hbactest' not in api.Command:
+        return None
+
+    def call():
+        result = api.Command.hbactest(
+            user=u'user1', targethost=BENCHMARK_HOST, service=u'sshd')
+        assert result['value'], result
+    return call
+
+
+@benchmark('batch')
+def bench_batch(api, directory, size, run):
+    methods = [
+        {'method': 'user_show', 'params': [[u'user%d' % i], {}]}
+        for i in range(0, size, max(size // 20, 1))]
+    return lambda: api.Command.batch(*methods)
+
+
+@benchmark('json_metadata')
+def bench_json_metadata(api, directory, size, run):
+    return lambda: api.Command.json_metadata(object=u'all', method=u'all')
+
+
+def run_benchmark(name, size, directory, repeat):
+    """
+    Run a benchmark repeat times after a warm-up run and return its result,
+    or None if the benchmark is not available
+    """
+    elapsed = []
+    ldap_count = 0
+    for run in range(repeat + 1):
+        call = BENCHMARKS[name](api, directory, size, run)
+        if call is None:
+            return None
+        request_timing = timing.start()
+        start = time.time()
+        call()
+        if run:
+            elapsed.append(time.time() - start)
+            ldap_count = request_timing.operations['ldap'][0]
+
+    elapsed.sort()
+    return OrderedDict([
+        ('benchmark', name),
+        ('entries', size),
+        ('repeat', repeat),
+        ('min', elapsed[0]),
+        ('median', elapsed[len(elapsed) // 2]),
+        ('max', elapsed[-1]),
+        ('ldap_count', ldap_count),
+    ])
+
+
+def run(sizes, repeat, names):
+    """
+    Run the benchmarks for all directory sizes and return their results
+    """
+    results = []
+    for size in sizes:
+        print('Populating directory with %d users' % size, file=sys.stderr)
+        directory = populate(size)
+        memldap.register_directory(LDAP_URI, directory)
+        api.Backend.ldap2.connect()
+        try:
+            for name in names:
+                result = run_benchmark(name, size, directory, repeat)
+                if result is None:
+                    print('%-20s %8d  not available' % (name, size))
+                    continue
+                print('%-20s %8d  min %8.4f  median %8.4f  max %8.4f  '
+                      'ldap %d' % (name, size, result['min'],
+                                   result['median'], result['max'],
+                                   result['ldap_count']))
+                results.append(result)
+        finally:
+            api.Backend.ldap2.disconnect()
+            memldap.unregister_directory(LDAP_URI)
+    return results
+
+
+def bootstrap_api(confdir):
+    api.bootstrap(context='cli', in_server=True, confdir=confdir,
+                  log=None, domain=DOMAIN, realm=REALM, host=HOST,
+                  basedn=DN(*(('dc', dc) for dc in DOMAIN.split('.'))),
+                  ldap_uri=LDAP_URI)
+    api.load_plugins()
+    api.add_plugin(memldap.ldap2, override=True)
+    api.finalize()
+
+
+def main():
+    parser = optparse.OptionParser(
+        usage='%prog [--sizes N,...] [--repeat N] [--output FILE] '
+              '[BENCHMARK...]',
+        description='Benchmark server plugin commands against an in-memory '
+                    'directory. Available benchmarks: %s.' %
+                    ', '.join(BENCHMARKS))
+    parser.add_option('--sizes', default=','.join(
+        str(size) for size in DEFAULT_SIZES),
+        help='comma-separated numbers of users in the directory')
+    parser.add_option('--repeat', type='int', default=DEFAULT_REPEAT,
+                      help='number of timed runs of each benchmark')
+    parser.add_option('--output', help='file to write the results to')
+    options, args = parser.parse_args()
+
+    names = args or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark %s' % name)
+    try:
+        sizes = [int(size) for size in options.sizes.split(',')]
+    except ValueError:
+        parser.error('invalid sizes %s' % options.sizes)
+    if options.repeat < 1:
+        parser.error('repeat must be at least 1')
+
+    confdir = tempfile.mkdtemp(prefix='ipa.benchmark.')
+    try:
+        bootstrap_api(confdir)
+        results = run(sizes, options.repeat, names)
+    finally:
+        shutil.rmtree(confdir)
+
+    if options.output:
+        document = OrderedDict([
+            ('version', VERSION),
+            ('python', platform.python_version()),
+            ('results', results),
+        ])
+        with open(options.output, 'w') as f:
+            json.dump(document, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
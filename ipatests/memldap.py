@@ -0,0 +1,1389 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+In-memory stand-in for the IPA directory server.
+
+`MemoryDirectory` keeps the entries of a directory in memory.
+`MemoryLDAPObject` gives access to it through the subset of the python-ldap
+connection interface used by `ipapython.ipaldap.LDAPClient`, so that the
+`ldap2` backend defined here can run plugin commands without a 389 Directory
+Server::
+
+    directory = memldap.bootstrap(api.env.realm, api.env.domain,
+                                  api.env.host, api.env.basedn)
+    memldap.register_directory('memory://test', directory)
+    api.bootstrap(ldap_uri='memory://test', ...)
+    api.load_plugins()
+    api.add_plugin(memldap.ldap2, override=True)
+    api.finalize()
+
+The schema is read from the schema LDIF files shipped with IPA and from a
+core schema with the standard attribute types and object classes provided by
+389-ds itself. Search filters, scopes, size limits and the simple paged
+results control are supported. Equality filters on the attributes indexed by
+an IPA server are resolved with indexes, other filters are evaluated against
+every entry in the scope of the search. The 389-ds plugins IPA depends on
+are emulated:
+
+* memberOf, for the member, memberUser and memberHost attributes
+* referential integrity, for the attributes configured by IPA
+* UUID, generating ipaUniqueID for the 'autogenerate' magic value
+* DNA, assigning uidNumber and gidNumber for the '-1' magic value
+* USN, counting entry modifications in entryUSN and lastusn
+
+Access control instructions are not evaluated, every operation is allowed as
+for Directory Manager, and the schema is not checked on writes. Managed
+entries are not created, user private groups are therefore not present in
+the directory even though the UPG definition is.
+"""
+
+import binascii
+import collections
+import datetime
+import itertools
+import os
+import re
+import threading
+import uuid
+
+import ldap
+import ldap.schema
+import ldif
+from ldap.controls import SimplePagedResultsControl
+import six
+
+from ipalib.constants import LDAP_GENERALIZED_TIME_FORMAT
+from ipalib.request import context
+from ipaplatform.paths import paths
+from ipapython import ipautil
+from ipapython.dn import DN
+from ipaserver.install.dsinstance import ALL_SCHEMA_FILES
+from ipaserver.plugins import ldap2 as ldap2_plugin
+
+if six.PY3:
+    unicode = str
+
+SYNTAX_DN = '1.3.6.1.4.1.1466.115.121.1.12'
+SYNTAX_INTEGER = '1.3.6.1.4.1.1466.115.121.1.27'
+
+DIRECTORY_MANAGER = DN(('cn', 'directory manager'))
+SCHEMA_DN = DN(('cn', 'schema'))
+
+#: attributes maintained by the memberOf plugin
+MEMBEROF_ATTRS = ('member', 'memberuser', 'memberhost')
+
+#: attributes maintained by the referential integrity plugin
+REFERINT_ATTRS = MEMBEROF_ATTRS + (
+    'uniquemember', 'owner', 'seealso', 'manager', 'secretary', 'sourcehost',
+    'memberservice', 'managedby', 'memberallowcmd', 'memberdenycmd',
+    'ipasudorunas', 'ipasudorunasgroup', 'ipatokenradiusconfiglink',
+    'ipaassignedidview', 'ipaallowedtarget', 'ipamemberca',
+    'ipamembercertprofile', 'ipalocation')
+
+DNA_ATTRS = ('uidnumber', 'gidnumber')
+DNA_MAGIC = b'-1'
+
+UUID_ATTR = 'ipauniqueid'
+UUID_MAGIC = b'autogenerate'
+
+OPERATIONAL_ATTRS = frozenset((
+    'createtimestamp', 'modifytimestamp', 'creatorsname', 'modifiersname',
+    'entryusn', 'nsuniqueid'))
+
+#: attributes with an equality index, the default indexes of 389-ds and the
+#: indexes added by IPA in indices.ldif and the updates
+INDEXED_ATTRS = frozenset((
+    'objectclass', 'cn', 'uid', 'givenname', 'sn', 'mail', 'telephonenumber',
+    'member', 'uniquemember', 'owner', 'seealso', 'nsuniqueid', 'entryusn',
+    'krbprincipalname', 'krbcanonicalname', 'ipakrbprincipalalias', 'ou',
+    'carlicense', 'title', 'manager', 'secretary', 'displayname',
+    'uidnumber', 'gidnumber', 'fqdn', 'macaddress', 'memberof', 'memberuid',
+    'memberuser', 'memberhost', 'sourcehost', 'memberservice', 'managedby',
+    'memberallowcmd', 'memberdenycmd', 'ipasudorunas', 'ipasudorunasgroup',
+    'automountkey', 'ipauniqueid', 'ipatokenradiusconfiglink',
+    'ipaassignedidview', 'ipaallowedtarget', 'ipamemberca',
+    'ipamembercertprofile', 'ipalocation', 'usercertificate', 'ntuniqueid',
+    'ntuserdomainid'))
+
+IDSTART = 1100
+IDRANGE_SIZE = 200000
+
+#: attribute types defined by 389-ds in its own schema files
+CORE_ATTRIBUTE_TYPES = (
+    "( 2.5.4.0 NAME 'objectClass' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.38 )",
+    "( 2.5.4.41 NAME 'name' SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 )",
+    "( 2.5.4.49 NAME 'distinguishedName' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.12 )",
+    "( 2.5.4.3 NAME ( 'cn' 'commonName' ) SUP name )",
+    "( 2.5.4.4 NAME ( 'sn' 'surName' ) SUP name )",
+    "( 2.5.4.42 NAME 'givenName' SUP name )",
+    "( 2.5.4.43 NAME 'initials' SUP name )",
+    "( 2.5.4.12 NAME 'title' SUP name )",
+    "( 2.5.4.7 NAME ( 'l' 'locality' 'localityname' ) SUP name )",
+    "( 2.5.4.8 NAME ( 'st' 'stateOrProvinceName' ) SUP name )",
+    "( 2.5.4.10 NAME ( 'o' 'organizationname' ) SUP name )",
+    "( 2.5.4.11 NAME ( 'ou' 'organizationalUnitName' ) SUP name )",
+    "( 2.5.4.5 NAME 'serialNumber' SYNTAX 1.3.6.1.4.1.1466.115.121.1.44 )",
+    "( 2.5.4.13 NAME 'description' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 )",
+    "( 2.5.4.9 NAME ( 'street' 'streetaddress' ) "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 )",
+    "( 2.5.4.15 NAME 'businessCategory' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 )",
+    "( 2.5.4.17 NAME 'postalCode' SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 )",
+    "( 2.5.4.20 NAME 'telephoneNumber' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.50 )",
+    "( 2.5.4.23 NAME ( 'facsimileTelephoneNumber' 'fax' ) "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.22 )",
+    "( 2.5.4.35 NAME 'userPassword' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.40 )",
+    "( 2.5.4.36 NAME 'userCertificate' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.8 )",
+    "( 2.5.4.31 NAME 'member' SUP distinguishedName )",
+    "( 2.5.4.32 NAME 'owner' SUP distinguishedName )",
+    "( 2.5.4.34 NAME 'seeAlso' SUP distinguishedName )",
+    "( 2.5.4.50 NAME 'uniqueMember' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.34 )",
+    "( 0.9.2342.19200300.100.1.1 NAME ( 'uid' 'userid' ) "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 )",
+    "( 0.9.2342.19200300.100.1.3 NAME ( 'mail' 'rfc822mailbox' ) "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.26 )",
+    "( 0.9.2342.19200300.100.1.6 NAME 'roomNumber' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 )",
+    "( 0.9.2342.19200300.100.1.10 NAME 'manager' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.12 )",
+    "( 0.9.2342.19200300.100.1.20 NAME ( 'homePhone' "
+    "'homeTelephoneNumber' ) SYNTAX 1.3.6.1.4.1.1466.115.121.1.50 )",
+    "( 0.9.2342.19200300.100.1.21 NAME 'secretary' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.12 )",
+    "( 0.9.2342.19200300.100.1.37 NAME 'associatedDomain' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.26 )",
+    "( 0.9.2342.19200300.100.1.41 NAME ( 'mobile' "
+    "'mobileTelephoneNumber' ) SYNTAX 1.3.6.1.4.1.1466.115.121.1.50 )",
+    "( 0.9.2342.19200300.100.1.42 NAME ( 'pager' 'pagerTelephoneNumber' ) "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.50 )",
+    "( 1.3.6.1.4.1.250.1.57 NAME 'labeledURI' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 )",
+    "( 1.2.840.113556.1.2.102 NAME 'memberOf' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.12 )",
+    "( 2.16.840.1.113730.3.1.1 NAME 'carLicense' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 )",
+    "( 2.16.840.1.113730.3.1.2 NAME 'departmentNumber' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 )",
+    "( 2.16.840.1.113730.3.1.3 NAME 'employeeNumber' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 SINGLE-VALUE )",
+    "( 2.16.840.1.113730.3.1.4 NAME 'employeeType' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 )",
+    "( 2.16.840.1.113730.3.1.39 NAME 'preferredLanguage' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 SINGLE-VALUE )",
+    "( 2.16.840.1.113730.3.1.241 NAME 'displayName' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 SINGLE-VALUE )",
+    "( 2.16.840.1.113730.3.1.55 NAME 'aci' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.26 USAGE directoryOperation )",
+    "( 2.16.840.1.113730.3.1.610 NAME 'nsAccountLock' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 SINGLE-VALUE )",
+    "( 2.16.840.1.113730.3.1.692 NAME 'inetUserStatus' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 SINGLE-VALUE )",
+    "( 2.16.840.1.113730.3.1.693 NAME 'inetUserHttpURL' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.26 SINGLE-VALUE )",
+    "( 2.16.840.1.113730.3.1.550 NAME 'cosAttribute' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 )",
+    "( 2.16.840.1.113730.3.1.551 NAME 'cosSpecifier' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 SINGLE-VALUE )",
+    "( 2.16.840.1.113730.3.1.552 NAME 'cosTemplateDn' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.12 )",
+    "( 2.16.840.1.113730.3.1.569 NAME 'cosPriority' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.27 SINGLE-VALUE )",
+    "( 2.16.840.1.113730.3.1.2085 NAME 'mepManagedBy' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.12 SINGLE-VALUE )",
+    "( 2.16.840.1.113730.3.1.2086 NAME 'mepManagedEntry' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.12 SINGLE-VALUE )",
+    "( 2.16.840.1.113730.3.1.2090 NAME 'nsHardwarePlatform' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 )",
+    "( 2.16.840.1.113730.3.1.2091 NAME 'nsOsVersion' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 )",
+    "( 2.16.840.1.113730.3.1.2092 NAME 'nsHostLocation' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 )",
+    "( 2.16.840.1.113730.3.1.2093 NAME 'serverHostName' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 )",
+    "( 1.3.6.1.1.1.1.0 NAME 'uidNumber' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.27 SINGLE-VALUE )",
+    "( 1.3.6.1.1.1.1.1 NAME 'gidNumber' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.27 SINGLE-VALUE )",
+    "( 1.3.6.1.1.1.1.2 NAME 'gecos' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.26 SINGLE-VALUE )",
+    "( 1.3.6.1.1.1.1.3 NAME 'homeDirectory' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.26 SINGLE-VALUE )",
+    "( 1.3.6.1.1.1.1.4 NAME 'loginShell' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.26 SINGLE-VALUE )",
+    "( 1.3.6.1.1.1.1.12 NAME 'memberUid' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.26 )",
+    "( 1.3.6.1.1.1.1.13 NAME 'memberNisNetgroup' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.26 )",
+    "( 1.3.6.1.1.1.1.14 NAME 'nisNetgroupTriple' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.26 )",
+    "( 1.3.6.1.1.1.1.19 NAME 'ipHostNumber' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.26 )",
+    "( 1.3.6.1.1.1.1.22 NAME 'macAddress' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.26 )",
+    "( 2.5.18.1 NAME 'createTimestamp' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.24 SINGLE-VALUE "
+    "NO-USER-MODIFICATION USAGE directoryOperation )",
+    "( 2.5.18.2 NAME 'modifyTimestamp' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.24 SINGLE-VALUE "
+    "NO-USER-MODIFICATION USAGE directoryOperation )",
+    "( 2.5.18.3 NAME 'creatorsName' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.12 SINGLE-VALUE "
+    "NO-USER-MODIFICATION USAGE directoryOperation )",
+    "( 2.5.18.4 NAME 'modifiersName' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.12 SINGLE-VALUE "
+    "NO-USER-MODIFICATION USAGE directoryOperation )",
+    "( 2.16.840.1.113730.3.1.542 NAME 'nsUniqueId' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 SINGLE-VALUE "
+    "NO-USER-MODIFICATION USAGE directoryOperation )",
+    "( 2.16.840.1.113730.3.1.2096 NAME 'entryUSN' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.27 SINGLE-VALUE "
+    "NO-USER-MODIFICATION USAGE directoryOperation )",
+)
+
+#: object classes defined by 389-ds in its own schema files
+CORE_OBJECT_CLASSES = (
+    "( 2.5.6.0 NAME 'top' ABSTRACT MUST objectClass )",
+    "( 2.5.6.4 NAME 'organization' SUP top STRUCTURAL MUST o "
+    "MAY ( description $ l $ st $ street $ postalCode $ seeAlso ) )",
+    "( 2.5.6.5 NAME 'organizationalUnit' SUP top STRUCTURAL MUST ou "
+    "MAY ( description $ l $ st $ street $ postalCode $ seeAlso ) )",
+    "( 2.5.6.6 NAME 'person' SUP top STRUCTURAL MUST ( sn $ cn ) "
+    "MAY ( userPassword $ telephoneNumber $ seeAlso $ description ) )",
+    "( 2.5.6.7 NAME 'organizationalPerson' SUP person STRUCTURAL "
+    "MAY ( title $ ou $ l $ st $ street $ postalCode $ "
+    "facsimileTelephoneNumber ) )",
+    "( 2.16.840.1.113730.3.2.2 NAME 'inetOrgPerson' "
+    "SUP organizationalPerson STRUCTURAL "
+    "MAY ( businessCategory $ carLicense $ departmentNumber $ "
+    "displayName $ employeeNumber $ employeeType $ givenName $ homePhone $ "
+    "initials $ labeledURI $ mail $ manager $ mobile $ o $ pager $ "
+    "preferredLanguage $ roomNumber $ secretary $ uid $ "
+    "userCertificate ) )",
+    "( 2.5.6.9 NAME 'groupOfNames' SUP top STRUCTURAL MUST cn "
+    "MAY ( member $ businessCategory $ seeAlso $ owner $ ou $ o $ "
+    "description ) )",
+    "( 2.5.6.17 NAME 'groupOfUniqueNames' SUP top STRUCTURAL MUST cn "
+    "MAY ( uniqueMember $ businessCategory $ seeAlso $ owner $ ou $ o $ "
+    "description ) )",
+    "( 2.5.6.14 NAME 'device' SUP top STRUCTURAL MUST cn "
+    "MAY ( serialNumber $ seeAlso $ owner $ ou $ o $ l $ description ) )",
+    "( 2.5.6.21 NAME 'pkiUser' SUP top AUXILIARY MAY userCertificate )",
+    "( 0.9.2342.19200300.100.4.13 NAME 'domain' SUP top STRUCTURAL "
+    "MUST dc MAY ( associatedDomain $ o $ description $ seeAlso $ l $ "
+    "st $ street ) )",
+    "( 1.3.6.1.4.1.1466.101.120.111 NAME 'extensibleObject' SUP top "
+    "AUXILIARY )",
+    "( 2.16.840.1.113719.2.142.6.1.1 NAME 'ldapSubEntry' SUP top "
+    "STRUCTURAL MAY cn )",
+    "( 2.16.840.1.113730.3.2.104 NAME 'nsContainer' SUP top STRUCTURAL "
+    "MUST cn )",
+    "( 2.16.840.1.113730.3.2.130 NAME 'inetUser' SUP top AUXILIARY "
+    "MAY ( uid $ inetUserStatus $ inetUserHttpURL $ userPassword $ "
+    "memberOf ) )",
+    "( 2.16.840.1.113730.3.2.99 NAME 'cosSuperDefinition' SUP ldapSubEntry "
+    "STRUCTURAL MUST cosAttribute MAY description )",
+    "( 2.16.840.1.113730.3.2.100 NAME 'cosClassicDefinition' "
+    "SUP cosSuperDefinition STRUCTURAL "
+    "MAY ( cosTemplateDn $ cosSpecifier ) )",
+    "( 2.16.840.1.113730.3.2.128 NAME 'costemplate' SUP top AUXILIARY "
+    "MAY ( cn $ cosPriority ) )",
+    "( 2.16.840.1.113730.3.2.258 NAME 'nsHost' SUP top STRUCTURAL "
+    "MUST cn MAY ( serverHostName $ description $ l $ nsHostLocation $ "
+    "nsHardwarePlatform $ nsOsVersion ) )",
+    "( 2.16.840.1.113730.3.2.319 NAME 'mepManagedEntry' SUP top AUXILIARY "
+    "MAY mepManagedBy )",
+    "( 2.16.840.1.113730.3.2.320 NAME 'mepOriginEntry' SUP top AUXILIARY "
+    "MAY mepManagedEntry )",
+    "( 1.3.6.1.1.1.2.0 NAME 'posixAccount' SUP top AUXILIARY "
+    "MUST ( cn $ uid $ uidNumber $ gidNumber $ homeDirectory ) "
+    "MAY ( userPassword $ loginShell $ gecos $ description ) )",
+    "( 1.3.6.1.1.1.2.2 NAME 'posixGroup' SUP top AUXILIARY "
+    "MUST ( cn $ gidNumber ) "
+    "MAY ( userPassword $ memberUid $ description ) )",
+    "( 1.3.6.1.1.1.2.6 NAME 'ipHost' SUP top AUXILIARY "
+    "MUST ( cn $ ipHostNumber ) MAY ( l $ description $ manager ) )",
+    "( 1.3.6.1.1.1.2.8 NAME 'nisNetgroup' SUP top STRUCTURAL MUST cn "
+    "MAY ( nisNetgroupTriple $ memberNisNetgroup $ description ) )",
+    "( 1.3.6.1.1.1.2.11 NAME 'ieee802Device' SUP top AUXILIARY "
+    "MAY macAddress )",
+)
+
+_ERROR_DESCRIPTIONS = {
+    ldap.NO_SUCH_OBJECT: 'No such object',
+    ldap.ALREADY_EXISTS: 'Already exists',
+    ldap.TYPE_OR_VALUE_EXISTS: 'Type or value exists',
+    ldap.NO_SUCH_ATTRIBUTE: 'No such attribute',
+    ldap.NOT_ALLOWED_ON_NONLEAF: 'Operation not allowed on non-leaf',
+    ldap.FILTER_ERROR: 'Bad search filter',
+    ldap.SIZELIMIT_EXCEEDED: 'Size limit exceeded',
+}
+
+_OID_RE = re.compile(r'^\s*\(\s*([\w.-]+)')
+_NAMES_RE = re.compile(r"\bNAME\s+(?:'([^']*)'|\(([^)]*)\))")
+_FILTER_ITEM_RE = re.compile(r'^([^=~<>]+?)(~=|>=|<=|=)(.*)$', re.DOTALL)
+_FILTER_ESCAPE_RE = re.compile(br'\\([0-9a-fA-F]{2})')
+
+#: directories of the ldap_uri values registered with `register_directory`
+_directories = {}
+
+
+def _error(exc_class, info=''):
+    return exc_class({'desc': _ERROR_DESCRIPTIONS[exc_class], 'info': info})
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    if not isinstance(value, six.string_types):
+        value = unicode(value)
+    return value.encode('utf-8')
+
+
+def _to_text(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return value
+
+
+def _unescape(value):
+    value = _FILTER_ESCAPE_RE.sub(
+        lambda m: binascii.unhexlify(m.group(1)), _to_bytes(value))
+    return value.decode('utf-8', 'replace')
+
+
+def _element_names(definition):
+    match = _NAMES_RE.search(definition)
+    if match is None:
+        return []
+    if match.group(1) is not None:
+        return [match.group(1).lower()]
+    return [name.lower() for name in re.findall(r"'([^']*)'", match.group(2))]
+
+
+def _intersection(sets):
+    result = None
+    for keys in sorted(sets, key=len):
+        if result is None:
+            result = set(keys)
+        else:
+            result.intersection_update(keys)
+        if not result:
+            break
+    return result
+
+
+def get_share_dir():
+    """
+    Return the directory with the LDIF files, preferring the source tree
+    """
+    tree = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        'install', 'share')
+    if os.path.isdir(tree):
+        return tree
+    return paths.USR_SHARE_IPA_DIR
+
+
+def read_ldif(filename, sub_dict=None):
+    """
+    Read the records of an LDIF file as a list of (dn, attrs) tuples.
+
+    :param sub_dict: if set, template variables substituted in the file
+        before it is parsed
+
+    The records may be LDIF change records adding entries.
+    """
+    with open(filename) as f:
+        text = f.read()
+    if sub_dict is not None:
+        text = ipautil.template_str(text, sub_dict)
+    text = re.sub(r'(?im)^changetype:[ \t]*add[ \t]*$\n', '', text)
+
+    parser = ldif.LDIFRecordList(six.StringIO(text))
+    parser.parse()
+    return parser.all_records
+
+
+class _Entry(object):
+    """
+    Directory entry
+
+    `attrs` maps the lower-case names of the attributes to a list of the name
+    as it was given and the list of values. Normalized values are cached in
+    `normalized` until the entry is modified. `seq` orders the entries by
+    the time they were added to the directory.
+    """
+    __slots__ = ('dn', 'attrs', 'normalized', 'seq')
+
+    def __init__(self, dn, attrs):
+        self.dn = dn
+        self.attrs = attrs
+        self.normalized = {}
+        self.seq = 0
+
+    def copy_attrs(self):
+        return collections.OrderedDict(
+            (key, [name, list(values)])
+            for key, (name, values) in self.attrs.items())
+
+
+class MemoryDirectory(object):
+    """
+    Directory with all entries kept in memory.
+
+    :param suffix: DN of the root entry of the directory
+    :param schema_files: schema LDIF files, the files installed by IPA if
+        None
+    :param id_start: first ID assigned by the DNA plugin
+    """
+    def __init__(self, suffix, schema_files=None, id_start=IDSTART):
+        self.suffix = DN(suffix)
+        self.lock = threading.RLock()
+        self.entries = collections.OrderedDict()
+        # parent key -> ordered keys of its children
+        self.children = collections.defaultdict(collections.OrderedDict)
+        # target key -> set of (source key, attribute) referring to it
+        self.references = collections.defaultdict(set)
+        # attribute -> normalized value -> set of keys of entries
+        self.indexes = dict((attr, collections.defaultdict(set))
+                            for attr in INDEXED_ATTRS)
+        self.usn = 0
+        self.next_id = id_start
+        self._seq = itertools.count()
+        self._filters = {}
+        self._load_schema(schema_files)
+
+    # Schema
+
+    def _load_schema(self, schema_files):
+        if schema_files is None:
+            share_dir = get_share_dir()
+            schema_files = [os.path.join(share_dir, name)
+                            for name in ALL_SCHEMA_FILES]
+
+        elements = {
+            'attributetypes': collections.OrderedDict(),
+            'objectclasses': collections.OrderedDict(),
+        }
+        names = {'attributetypes': {}, 'objectclasses': {}}
+
+        def add_element(kind, definition):
+            definition = _to_text(definition)
+            match = _OID_RE.match(definition)
+            if match is None:
+                return
+            oid = match.group(1).lower()
+            # a later definition replaces an earlier one with the same OID
+            # or name, as when the schema is updated
+            for name in _element_names(definition):
+                previous = names[kind].get(name)
+                if previous is not None and previous != oid:
+                    elements[kind].pop(previous, None)
+                names[kind][name] = oid
+            elements[kind][oid] = definition
+
+        for definition in CORE_ATTRIBUTE_TYPES:
+            add_element('attributetypes', definition)
+        for definition in CORE_OBJECT_CLASSES:
+            add_element('objectclasses', definition)
+        for filename in schema_files:
+            for _dn, attrs in read_ldif(filename):
+                for name, values in attrs.items():
+                    if name.lower() in elements:
+                        for value in values:
+                            add_element(name.lower(), value)
+
+        self.schema_entry = _Entry(SCHEMA_DN, collections.OrderedDict([
+            ('objectclass',
+             ['objectClass', [b'top', b'ldapSubentry', b'subschema']]),
+            ('cn', ['cn', [b'schema']]),
+            ('attributetypes',
+             ['attributeTypes',
+              [_to_bytes(v) for v in elements['attributetypes'].values()]]),
+            ('objectclasses',
+             ['objectClasses',
+              [_to_bytes(v) for v in elements['objectclasses'].values()]]),
+        ]))
+        self.schema = ldap.schema.SubSchema(dict(
+            (name, values)
+            for name, values in self.schema_entry.attrs.values()))
+
+        self._canonical_names = {}
+        self._dn_attrs = set()
+        self._integer_attrs = set()
+        for oid in self.schema.listall(ldap.schema.AttributeType):
+            obj = self.schema.get_obj(ldap.schema.AttributeType, oid)
+            attr_names = [name.lower() for name in obj.names] or [oid]
+            for name in attr_names:
+                self._canonical_names[name] = attr_names[0]
+            try:
+                syntax = self.schema.get_inheritedattr(
+                    ldap.schema.AttributeType, oid, 'syntax')
+            except KeyError:
+                syntax = obj.syntax
+            if syntax == SYNTAX_DN:
+                self._dn_attrs.add(attr_names[0])
+            elif syntax == SYNTAX_INTEGER:
+                self._integer_attrs.add(attr_names[0])
+
+    def attr_key(self, name):
+        """
+        Return the key of an attribute in entries: its lower-case primary
+        name without options
+        """
+        name = _to_text(name).split(';', 1)[0].lower()
+        return self._canonical_names.get(name, name)
+
+    def _normalize(self, key, value):
+        text = _to_text(value)
+        if key in self._dn_attrs:
+            try:
+                return unicode(DN(text)).lower()
+            except Exception:
+                pass
+        elif key in self._integer_attrs:
+            try:
+                return int(text)
+            except ValueError:
+                pass
+        return text.lower()
+
+    def _values(self, entry, key, text=False):
+        cache_key = (key, text)
+        values = entry.normalized.get(cache_key)
+        if values is None:
+            item = entry.attrs.get(key)
+            if item is None:
+                values = ()
+            elif text:
+                values = [_to_text(v).lower() for v in item[1]]
+            else:
+                values = set(self._normalize(key, v) for v in item[1])
+            entry.normalized[cache_key] = values
+        return values
+
+    @staticmethod
+    def dn_key(dn):
+        if not isinstance(dn, DN):
+            dn = DN(_to_text(dn))
+        return unicode(dn).lower()
+
+    def _value_key(self, value):
+        try:
+            return self.dn_key(value)
+        except Exception:
+            return _to_text(value).lower()
+
+    # Search filters
+
+    def compile_filter(self, filterstr):
+        """
+        Compile a search filter.
+
+        Return a function testing whether an entry matches the filter and
+        a function returning the keys of the entries which may match it
+        according to the indexes, or None if the filter cannot be resolved
+        by the indexes.
+        """
+        filterstr = _to_text(filterstr or '(objectClass=*)').strip()
+        compiled = self._filters.get(filterstr)
+        if compiled is None:
+            text = filterstr
+            if not text.startswith('('):
+                text = '(%s)' % text
+            try:
+                match, lookup, pos = self._parse_filter(text, 0)
+            except (IndexError, ValueError):
+                raise _error(ldap.FILTER_ERROR, filterstr)
+            if pos != len(text):
+                raise _error(ldap.FILTER_ERROR, filterstr)
+            if lookup is None:
+                lookup = lambda: None
+            compiled = (match, lookup)
+            if len(self._filters) > 1000:
+                self._filters.clear()
+            self._filters[filterstr] = compiled
+        return compiled
+
+    def _parse_filter(self, text, pos):
+        if text[pos] != '(':
+            raise ValueError(pos)
+        pos += 1
+        op = text[pos]
+        lookup = None
+        if op in '&|':
+            pos += 1
+            subfilters = []
+            lookups = []
+            while text[pos] == '(':
+                subfilter, sublookup, pos = self._parse_filter(text, pos)
+                subfilters.append(subfilter)
+                lookups.append(sublookup)
+            if op == '&':
+                function = lambda e: all(f(e) for f in subfilters)
+                # the candidates of any indexed part are enough
+                lookups = [f for f in lookups if f is not None]
+                if lookups:
+                    lookup = lambda: _intersection(f() for f in lookups)
+            else:
+                function = lambda e: any(f(e) for f in subfilters)
+                if lookups and None not in lookups:
+                    lookup = lambda: set().union(*(f() for f in lookups))
+        elif op == '!':
+            subfilter, _sublookup, pos = self._parse_filter(text, pos + 1)
+            function = lambda e: not subfilter(e)
+        else:
+            end = text.index(')', pos)
+            function, lookup = self._compile_item(text[pos:end])
+            pos = end
+        if text[pos] != ')':
+            raise ValueError(pos)
+        return function, lookup, pos + 1
+
+    def _compile_item(self, item):
+        match = _FILTER_ITEM_RE.match(item)
+        if match is None:
+            raise ValueError(item)
+        attr, op, value = match.groups()
+        if ':' in attr:
+            # extensible matching rules are not supported
+            return (lambda e: False), (lambda: set())
+        key = self.attr_key(attr)
+
+        if op == '=' and value == '*':
+            return (lambda e: key in e.attrs), None
+
+        if op == '=' and '*' in value:
+            parts = [_unescape(part).lower() for part in value.split('*')]
+            initial, middle, final = parts[0], parts[1:-1], parts[-1]
+
+            def match_substrings(entry):
+                for v in self._values(entry, key, text=True):
+                    start = len(initial)
+                    end = len(v) - len(final)
+                    if (end < start or not v.startswith(initial) or
+                            not v.endswith(final)):
+                        continue
+                    for part in middle:
+                        index = v.find(part, start, end)
+                        if index < 0:
+                            break
+                        start = index + len(part)
+                    else:
+                        return True
+                return False
+            return match_substrings, None
+
+        assertion = self._normalize(key, _unescape(value))
+
+        if op in ('=', '~='):
+            index = self.indexes.get(key)
+            if index is None:
+                lookup = None
+            else:
+                lookup = lambda: index.get(assertion, ())
+            return (lambda e: assertion in self._values(e, key)), lookup
+
+        def match_ordering(entry):
+            for v in self._values(entry, key):
+                try:
+                    if (v >= assertion if op == '>=' else v <= assertion):
+                        return True
+                except TypeError:
+                    pass
+            return False
+        return match_ordering, None
+
+    # Read operations
+
+    def get(self, dn):
+        """
+        Return the entry with the given DN, raise NO_SUCH_OBJECT if it does
+        not exist
+        """
+        key = self.dn_key(dn)
+        try:
+            return self.entries[key]
+        except KeyError:
+            raise _error(ldap.NO_SUCH_OBJECT, unicode(dn))
+
+    def root_dse(self):
+        attrs = collections.OrderedDict()
+        for name, values in (
+                ('objectClass', [b'top']),
+                ('namingContexts', [_to_bytes(unicode(self.suffix))]),
+                ('defaultnamingcontext', [_to_bytes(unicode(self.suffix))]),
+                ('supportedControl',
+                 [_to_bytes(SimplePagedResultsControl.controlType)]),
+                ('supportedLDAPVersion', [b'3']),
+                ('vendorName', [b'FreeIPA in-memory directory']),
+                ('lastusn;userroot', [_to_bytes(self.usn)])):
+            attrs[self.attr_key(name)] = [name, values]
+        return _Entry(DN(), attrs)
+
+    def _subtree(self, key):
+        stack = [key]
+        while stack:
+            key = stack.pop()
+            entry = self.entries.get(key)
+            if entry is not None:
+                yield entry
+            stack.extend(reversed(list(self.children.get(key, ()))))
+
+    def _indexed(self, keys, base_key, scope):
+        """
+        Return the entries with the given keys in the scope of the base, in
+        the order they were added
+        """
+        if scope == ldap.SCOPE_ONELEVEL:
+            children = self.children.get(base_key, ())
+            keys = [key for key in keys if key in children]
+        else:
+            suffix = ',' + base_key
+            keys = [key for key in keys
+                    if key == base_key or key.endswith(suffix)]
+        entries = [self.entries[key] for key in keys]
+        entries.sort(key=lambda e: e.seq)
+        return entries
+
+    def search(self, base, scope, filterstr=None, limit=None):
+        """
+        Return the list of entries in the scope of the base DN matching the
+        filter, at most limit entries if it is set
+        """
+        with self.lock:
+            base = DN(_to_text(base))
+            match, lookup = self.compile_filter(filterstr)
+            if scope == ldap.SCOPE_BASE and not base:
+                candidates = [self.root_dse()]
+            elif scope == ldap.SCOPE_BASE and base == SCHEMA_DN:
+                candidates = [self.schema_entry]
+            else:
+                entry = self.get(base)
+                base_key = self.dn_key(base)
+                keys = None
+                if scope != ldap.SCOPE_BASE:
+                    keys = lookup()
+                if scope == ldap.SCOPE_BASE:
+                    candidates = [entry]
+                elif keys is not None:
+                    candidates = self._indexed(keys, base_key, scope)
+                elif scope == ldap.SCOPE_ONELEVEL:
+                    candidates = [self.entries[key]
+                                  for key in self.children.get(base_key, ())]
+                else:
+                    candidates = self._subtree(base_key)
+            candidates = (entry for entry in candidates if match(entry))
+            return list(itertools.islice(candidates, limit))
+
+    def project(self, entry, attrlist=None, attrsonly=0):
+        """
+        Return the entry as a python-ldap search result with the requested
+        attributes
+        """
+        wanted = set(self.attr_key(name) for name in attrlist or ['*'])
+        attrs = {}
+        if wanted != {'1.1'}:
+            for key, (name, values) in entry.attrs.items():
+                if key in OPERATIONAL_ATTRS:
+                    if '+' not in wanted and key not in wanted:
+                        continue
+                elif '*' not in wanted and key not in wanted:
+                    continue
+                attrs[name] = [] if attrsonly else list(values)
+        return (str(entry.dn), attrs)
+
+    # Write operations
+
+    def _touch(self, attrs, bind_dn, created=False):
+        self.usn += 1
+        now = _to_bytes(datetime.datetime.utcnow().strftime(
+            LDAP_GENERALIZED_TIME_FORMAT))
+        bind_dn = _to_bytes(unicode(bind_dn or DIRECTORY_MANAGER))
+        if created:
+            attrs['createtimestamp'] = ['createTimestamp', [now]]
+            attrs['creatorsname'] = ['creatorsName', [bind_dn]]
+            attrs['nsuniqueid'] = ['nsUniqueId', [_to_bytes(uuid.uuid4())]]
+        attrs['modifytimestamp'] = ['modifyTimestamp', [now]]
+        attrs['modifiersname'] = ['modifiersName', [bind_dn]]
+        attrs['entryusn'] = ['entryUSN', [_to_bytes(self.usn)]]
+
+    def _assign_ids(self, attrs):
+        value = None
+        for key in DNA_ATTRS:
+            item = attrs.get(key)
+            if item is None or DNA_MAGIC not in item[1]:
+                continue
+            if value is None:
+                value = _to_bytes(self.next_id)
+                self.next_id += 1
+            item[1] = [value if v == DNA_MAGIC else v for v in item[1]]
+
+    def _references(self, attrs):
+        result = set()
+        for key in REFERINT_ATTRS:
+            item = attrs.get(key)
+            if item is not None:
+                result.update((self._value_key(v), key) for v in item[1])
+        return result
+
+    def _update_references(self, source, old_attrs, new_attrs):
+        """
+        Update the index of references from the source entry and return the
+        keys of entries whose group membership changed
+        """
+        old = self._references(old_attrs)
+        new = self._references(new_attrs)
+        changed = set()
+        for target, attr in old - new:
+            self.references[target].discard((source, attr))
+            if not self.references[target]:
+                del self.references[target]
+            if attr in MEMBEROF_ATTRS:
+                changed.add(target)
+        for target, attr in new - old:
+            self.references[target].add((source, attr))
+            if attr in MEMBEROF_ATTRS:
+                changed.add(target)
+        return changed
+
+    def _update_memberof(self, keys):
+        """
+        Recompute memberOf of the entries and of their members
+        """
+        affected = set()
+        queue = collections.deque(keys)
+        while queue:
+            key = queue.popleft()
+            if key in affected:
+                continue
+            affected.add(key)
+            entry = self.entries.get(key)
+            if entry is None:
+                continue
+            for attr in MEMBEROF_ATTRS:
+                item = entry.attrs.get(attr)
+                if item is not None:
+                    queue.extend(self._value_key(v) for v in item[1])
+
+        for key in affected:
+            entry = self.entries.get(key)
+            if entry is None:
+                continue
+            groups = set()
+            queue = collections.deque([key])
+            while queue:
+                for source, attr in self.references.get(queue.popleft(), ()):
+                    if (attr in MEMBEROF_ATTRS and source != key and
+                            source not in groups):
+                        groups.add(source)
+                        queue.append(source)
+            values = [_to_bytes(unicode(self.entries[group].dn))
+                      for group in sorted(groups) if group in self.entries]
+            self._index(key, entry, add=False, attrs=['memberof'])
+            if values:
+                entry.attrs['memberof'] = ['memberOf', values]
+            else:
+                entry.attrs.pop('memberof', None)
+            entry.normalized.clear()
+            self._index(key, entry, attrs=['memberof'])
+
+    def _index(self, key, entry, add=True, attrs=None):
+        """
+        Add the entry to the indexes of its attributes, or remove it
+        """
+        for attr in attrs or entry.attrs:
+            index = self.indexes.get(attr)
+            if index is None:
+                continue
+            for value in self._values(entry, attr):
+                if add:
+                    index[value].add(key)
+                else:
+                    keys = index.get(value)
+                    if keys is not None:
+                        keys.discard(key)
+                        if not keys:
+                            del index[value]
+
+    def _set_attrs(self, key, entry, attrs):
+        """
+        Replace the attributes of an entry and update the indexes
+        """
+        self._index(key, entry, add=False)
+        entry.attrs = attrs
+        entry.normalized.clear()
+        self._index(key, entry)
+
+    def _insert(self, key, entry):
+        entry.seq = next(self._seq)
+        self.entries[key] = entry
+        if entry.dn != self.suffix:
+            self.children[self.dn_key(entry.dn[1:])][key] = None
+        self._index(key, entry)
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self._index(key, entry, add=False)
+        if entry.dn != self.suffix:
+            parent = self.dn_key(entry.dn[1:])
+            self.children[parent].pop(key, None)
+            if not self.children[parent]:
+                del self.children[parent]
+        return entry
+
+    def _check_new_dn(self, dn):
+        key = self.dn_key(dn)
+        if key in self.entries:
+            raise _error(ldap.ALREADY_EXISTS, unicode(dn))
+        if dn != self.suffix and self.dn_key(dn[1:]) not in self.entries:
+            raise _error(ldap.NO_SUCH_OBJECT, unicode(dn[1:]))
+        return key
+
+    def add(self, dn, modlist, bind_dn=None):
+        """
+        Add an entry, modlist is a list of (attribute, values) tuples
+        """
+        with self.lock:
+            dn = DN(_to_text(dn))
+            attrs = collections.OrderedDict()
+            for name, values in modlist:
+                if not isinstance(values, (list, tuple)):
+                    values = [values]
+                item = attrs.setdefault(self.attr_key(name), [name, []])
+                item[1].extend(_to_bytes(v) for v in values)
+
+            self._assign_ids(attrs)
+            item = attrs.get(UUID_ATTR)
+            if item is not None and UUID_MAGIC in [v.lower() for v in item[1]]:
+                item[1] = [_to_bytes(uuid.uuid4())]
+                if self.attr_key(dn[0].attr) == UUID_ATTR:
+                    dn = DN((dn[0].attr, _to_text(item[1][0])), dn[1:])
+
+            for ava in dn[0]:
+                item = attrs.setdefault(self.attr_key(ava.attr),
+                                        [ava.attr, []])
+                if self._normalize(self.attr_key(ava.attr), ava.value) not in (
+                        self._normalize(self.attr_key(ava.attr), v)
+                        for v in item[1]):
+                    item[1].append(_to_bytes(ava.value))
+
+            key = self._check_new_dn(dn)
+            self._touch(attrs, bind_dn, created=True)
+            self._insert(key, _Entry(dn, attrs))
+            changed = self._update_references(key, {}, attrs)
+            changed.add(key)
+            self._update_memberof(changed)
+
+    def modify(self, dn, modlist, bind_dn=None):
+        """
+        Modify an entry, modlist is a list of (operation, attribute, values)
+        tuples
+        """
+        with self.lock:
+            entry = self.get(dn)
+            key = self.dn_key(entry.dn)
+            attrs = entry.copy_attrs()
+            for op, name, values in modlist:
+                attr = self.attr_key(name)
+                if values is None:
+                    values = []
+                elif not isinstance(values, (list, tuple)):
+                    values = [values]
+                values = [_to_bytes(v) for v in values]
+                item = attrs.get(attr)
+
+                if op == ldap.MOD_ADD:
+                    if item is None:
+                        item = attrs[attr] = [name, []]
+                    present = set(self._normalize(attr, v) for v in item[1])
+                    for value in values:
+                        normalized = self._normalize(attr, value)
+                        if normalized in present:
+                            raise _error(ldap.TYPE_OR_VALUE_EXISTS, name)
+                        present.add(normalized)
+                        item[1].append(value)
+                elif op == ldap.MOD_DELETE:
+                    if item is None:
+                        raise _error(ldap.NO_SUCH_ATTRIBUTE, name)
+                    for value in values:
+                        normalized = self._normalize(attr, value)
+                        remaining = [v for v in item[1]
+                                     if self._normalize(attr, v) != normalized]
+                        if len(remaining) == len(item[1]):
+                            raise _error(ldap.NO_SUCH_ATTRIBUTE, name)
+                        item[1] = remaining
+                    if not values or not item[1]:
+                        del attrs[attr]
+                elif op == ldap.MOD_REPLACE:
+                    if values:
+                        attrs[attr] = [name, values]
+                    else:
+                        attrs.pop(attr, None)
+
+            self._assign_ids(attrs)
+            self._touch(attrs, bind_dn)
+            changed = self._update_references(key, entry.attrs, attrs)
+            self._set_attrs(key, entry, attrs)
+            self._update_memberof(changed)
+
+    def delete(self, dn):
+        """
+        Delete a leaf entry and remove the references to it
+        """
+        with self.lock:
+            entry = self.get(dn)
+            key = self.dn_key(entry.dn)
+            if self.children.get(key):
+                raise _error(ldap.NOT_ALLOWED_ON_NONLEAF, unicode(dn))
+
+            # the USN plugin counts deletions as well
+            self.usn += 1
+            self._remove(key)
+            changed = self._update_references(key, entry.attrs, {})
+            for source, attr in sorted(self.references.pop(key, ())):
+                source_entry = self.entries.get(source)
+                if source_entry is None or attr not in source_entry.attrs:
+                    continue
+                attrs = source_entry.copy_attrs()
+                item = attrs[attr]
+                item[1] = [v for v in item[1] if self._value_key(v) != key]
+                if not item[1]:
+                    del attrs[attr]
+                self._touch(attrs, None)
+                self._set_attrs(source, source_entry, attrs)
+            changed.discard(key)
+            self._update_memberof(changed)
+
+    def rename(self, dn, newrdn, newsuperior=None, delold=1, bind_dn=None):
+        """
+        Rename or move a leaf entry and update the references to it
+        """
+        with self.lock:
+            entry = self.get(dn)
+            key = self.dn_key(entry.dn)
+            if self.children.get(key):
+                raise _error(ldap.NOT_ALLOWED_ON_NONLEAF, unicode(dn))
+
+            rdn = DN(_to_text(newrdn))[0]
+            if newsuperior is None:
+                parent = entry.dn[1:]
+            else:
+                parent = DN(_to_text(newsuperior))
+            new_dn = DN(rdn, parent)
+            new_key = self.dn_key(new_dn)
+            if new_key != key:
+                self._check_new_dn(new_dn)
+
+            attrs = entry.copy_attrs()
+            if delold:
+                for ava in entry.dn[0]:
+                    attr = self.attr_key(ava.attr)
+                    old = self._normalize(attr, ava.value)
+                    item = attrs.get(attr)
+                    if item is not None:
+                        item[1] = [v for v in item[1]
+                                   if self._normalize(attr, v) != old]
+                        if not item[1]:
+                            del attrs[attr]
+            for ava in rdn:
+                attr = self.attr_key(ava.attr)
+                item = attrs.setdefault(attr, [ava.attr, []])
+                new = self._normalize(attr, ava.value)
+                if new not in (self._normalize(attr, v) for v in item[1]):
+                    item[1].append(_to_bytes(ava.value))
+            self._touch(attrs, bind_dn)
+
+            self._remove(key)
+            changed = self._update_references(key, entry.attrs, {})
+            entry.dn = new_dn
+            entry.attrs = attrs
+            entry.normalized.clear()
+            self._insert(new_key, entry)
+            changed |= self._update_references(new_key, {}, attrs)
+
+            value = _to_bytes(unicode(new_dn))
+            for source, attr in sorted(self.references.pop(key, ())):
+                source_entry = self.entries.get(source)
+                if source_entry is None or attr not in source_entry.attrs:
+                    continue
+                attrs = source_entry.copy_attrs()
+                item = attrs[attr]
+                item[1] = [value if self._value_key(v) == key else v
+                           for v in item[1]]
+                self.references[new_key].add((source, attr))
+                self._touch(attrs, None)
+                self._set_attrs(source, source_entry, attrs)
+            changed.discard(key)
+            changed.add(new_key)
+            self._update_memberof(changed)
+
+    # Loading
+
+    def ensure_container(self, dn):
+        """
+        Add nsContainer entries for the DN and its missing ancestors
+        """
+        dn = DN(dn)
+        if self.dn_key(dn) in self.entries:
+            return
+        if dn != self.suffix:
+            self.ensure_container(dn[1:])
+        self.add(dn, [('objectClass', [b'top', b'nsContainer'])])
+
+    def load_ldif(self, filename, sub_dict=None):
+        """
+        Add the entries of an LDIF file
+        """
+        for dn, attrs in read_ldif(filename, sub_dict):
+            self.add(dn, list(attrs.items()))
+
+
+def bootstrap(realm, domain, host, basedn, id_start=IDSTART,
+              id_range_size=IDRANGE_SIZE, schema_files=None):
+    """
+    Create a `MemoryDirectory` with the entries created by the IPA server
+    installer in the main suffix
+    """
+    basedn = DN(basedn)
+    directory = MemoryDirectory(basedn, schema_files=schema_files,
+                                id_start=id_start + 1)
+    directory.add(basedn, [
+        ('objectClass', [b'top', b'domain']),
+        (basedn[0].attr, [_to_bytes(basedn[0].value)]),
+    ])
+
+    sub_dict = dict(
+        SUFFIX=unicode(basedn),
+        REALM=realm,
+        DOMAIN=domain,
+        HOST=host,
+        IDSTART=id_start,
+        IDRANGE_SIZE=id_range_size,
+    )
+    share_dir = get_share_dir()
+    for name in ('bootstrap-template.ldif', 'default-hbac.ldif'):
+        directory.load_ldif(os.path.join(share_dir, name), sub_dict)
+
+    upg_dn = DN(('cn', 'UPG Definition'), ('cn', 'Definitions'),
+                ('cn', 'Managed Entries'), ('cn', 'etc'), basedn)
+    directory.ensure_container(upg_dn[1:])
+    directory.add(upg_dn, [
+        ('objectClass', [b'extensibleObject']),
+        ('originScope',
+         [_to_bytes(unicode(DN(('cn', 'users'), ('cn', 'accounts'),
+                                  basedn)))]),
+        ('originFilter',
+         [b'(&(objectclass=posixAccount)(!(description=__no_upg__)))']),
+    ])
+    return directory
+
+
+class MemoryLDAPObject(object):
+    """
+    Connection to a `MemoryDirectory` with the interface of
+    ``ldap.ldapobject.LDAPObject`` used by `ipapython.ipaldap.LDAPClient`.
+
+    Like with python-ldap, errors of asynchronous operations are raised when
+    their result is read.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.bind_dn = DIRECTORY_MANAGER
+        self._options = {}
+        self._results = {}
+        self._msgids = itertools.count(1)
+
+    def get_option(self, option):
+        return self._options.get(option, 0)
+
+    def set_option(self, option, value):
+        self._options[option] = value
+
+    def start_tls_s(self):
+        pass
+
+    def simple_bind_s(self, who='', cred='', serverctrls=None,
+                      clientctrls=None):
+        self.bind_dn = DN(_to_text(who)) if who else DIRECTORY_MANAGER
+
+    def sasl_interactive_bind_s(self, who, auth, serverctrls=None,
+                                clientctrls=None, sasl_flags=None):
+        self.bind_dn = DIRECTORY_MANAGER
+
+    def unbind_s(self):
+        self._results.clear()
+
+    def whoami_s(self):
+        return 'dn: %s' % self.bind_dn
+
+    def abandon(self, msgid, serverctrls=None, clientctrls=None):
+        self._results.pop(msgid, None)
+
+    def _queue(self, messages):
+        msgid = next(self._msgids)
+        self._results[msgid] = collections.deque(messages)
+        return msgid
+
+    def _search(self, base, scope, filterstr, attrlist, attrsonly,
+                serverctrls, sizelimit):
+        paging = None
+        for ctrl in serverctrls or ():
+            if ctrl.controlType == SimplePagedResultsControl.controlType:
+                paging = ctrl
+
+        # without paging, the search can stop past the size limit
+        limit = None
+        if paging is None and sizelimit and sizelimit > 0:
+            limit = sizelimit + 1
+
+        with self.directory.lock:
+            entries = self.directory.search(base, scope, filterstr, limit)
+            ctrls = []
+            error = None
+            if paging is not None:
+                total = len(entries)
+                start = int(paging.cookie or 0)
+                end = start + paging.size
+                # a page size of 0 abandons the paged search
+                if paging.size and end < total:
+                    cookie = str(end)
+                else:
+                    cookie = ''
+                entries = entries[start:end]
+                ctrls.append(SimplePagedResultsControl(
+                    False, size=total, cookie=cookie))
+            if sizelimit and sizelimit > 0 and len(entries) > sizelimit:
+                entries = entries[:sizelimit]
+                error = _error(ldap.SIZELIMIT_EXCEEDED)
+            results = [self.directory.project(e, attrlist, attrsonly)
+                       for e in entries]
+        return results, ctrls, error
+
+    def search_ext(self, base, scope, filterstr='(objectClass=*)',
+                   attrlist=None, attrsonly=0, serverctrls=None,
+                   clientctrls=None, timeout=-1, sizelimit=0):
+        try:
+            results, ctrls, error = self._search(
+                base, scope, filterstr, attrlist, attrsonly, serverctrls,
+                sizelimit)
+        except ldap.LDAPError as e:
+            results, ctrls, error = [], [], e
+        messages = [(ldap.RES_SEARCH_ENTRY, result, None, None)
+                    for result in results]
+        messages.append((ldap.RES_SEARCH_RESULT, None, ctrls, error))
+        return self._queue(messages)
+
+    def search_ext_s(self, base, scope, filterstr='(objectClass=*)',
+                     attrlist=None, attrsonly=0, serverctrls=None,
+                     clientctrls=None, timeout=-1, sizelimit=0):
+        msgid = self.search_ext(base, scope, filterstr, attrlist, attrsonly,
+                                serverctrls, clientctrls, timeout, sizelimit)
+        return self.result3(msgid)[1]
+
+    def search_s(self, base, scope, filterstr='(objectClass=*)',
+                 attrlist=None, attrsonly=0):
+        return self.search_ext_s(base, scope, filterstr, attrlist, attrsonly)
+
+    def result3(self, msgid=ldap.RES_ANY, all=1, timeout=None):
+        messages = self._results[msgid]
+        entries = []
+        while True:
+            rtype, result, ctrls, error = messages.popleft()
+            if rtype == ldap.RES_SEARCH_ENTRY:
+                if not all:
+                    return rtype, [result], msgid, []
+                entries.append(result)
+                continue
+            del self._results[msgid]
+            if error is not None:
+                raise error
+            return rtype, entries, msgid, ctrls
+
+    def _operation(self, rtype, method, *args):
+        try:
+            method(*args)
+        except ldap.LDAPError as e:
+            error = e
+        else:
+            error = None
+        return self._queue([(rtype, None, [], error)])
+
+    def add_ext(self, dn, modlist, serverctrls=None, clientctrls=None):
+        return self._operation(ldap.RES_ADD, self.directory.add,
+                               dn, modlist, self.bind_dn)
+
+    def add_s(self, dn, modlist):
+        return self.result3(self.add_ext(dn, modlist))
+
+    def modify_ext(self, dn, modlist, serverctrls=None, clientctrls=None):
+        return self._operation(ldap.RES_MODIFY, self.directory.modify,
+                               dn, modlist, self.bind_dn)
+
+    def modify_s(self, dn, modlist):
+        return self.result3(self.modify_ext(dn, modlist))
+
+    def delete_ext(self, dn, serverctrls=None, clientctrls=None):
+        return self._operation(ldap.RES_DELETE, self.directory.delete, dn)
+
+    def delete_s(self, dn):
+        return self.result3(self.delete_ext(dn))
+
+    def rename(self, dn, newrdn, newsuperior=None, delold=1,
+               serverctrls=None, clientctrls=None):
+        return self._operation(ldap.RES_MODRDN, self.directory.rename,
+                               dn, newrdn, newsuperior, delold, self.bind_dn)
+
+    def rename_s(self, dn, newrdn, newsuperior=None, delold=1,
+                 serverctrls=None, clientctrls=None):
+        return self.result3(self.rename(dn, newrdn, newsuperior, delold))
+
+    def passwd_s(self, user, oldpw, newpw, serverctrls=None,
+                 clientctrls=None):
+        self.directory.modify(
+            user, [(ldap.MOD_REPLACE, 'userPassword', [newpw])],
+            self.bind_dn)
+
+
+def register_directory(ldap_uri, directory):
+    """
+    Make the `ldap2` backends with the given ldap_uri use the directory
+    """
+    _directories[ldap_uri] = directory
+
+
+def unregister_directory(ldap_uri):
+    _directories.pop(ldap_uri, None)
+
+
+class ldap2(ldap2_plugin.ldap2):
+    """
+    LDAP backend using the `MemoryDirectory` registered for its ldap_uri.
+
+    Connections are bound as Directory Manager, the principal of the request
+    is the admin user.
+    """
+
+    def create_connection(self, ccache=None, bind_dn=None, bind_pw='',
+                          cacert=None, autobind=None, serverctrls=None,
+                          clientctrls=None, time_limit=ldap2_plugin._missing,
+                          size_limit=ldap2_plugin._missing):
+        if time_limit is not ldap2_plugin._missing:
+            self.time_limit = time_limit
+        if size_limit is not ldap2_plugin._missing:
+            self.size_limit = size_limit
+
+        conn = MemoryLDAPObject(_directories[self.ldap_uri])
+        if bind_dn is not None:
+            conn.simple_bind_s(str(bind_dn), bind_pw)
+        setattr(context, 'principal', u'admin@%s' % self.api.env.realm)
+        return conn
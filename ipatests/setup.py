@@ -34,6 +34,7 @@ if __name__ == '__main__':
         package_dir={'ipatests': ''},
         packages=[
             "ipatests",
+            "ipatests.benchmarks",
             "ipatests.pytest_plugins",
             "ipatests.test_cmdline",
             "ipatests.test_install",
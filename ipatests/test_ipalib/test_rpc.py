@@ -197,6 +197,31 @@ def test_xml_loads():
         assert type(e.faultString) is unicode
 
 
+def test_json_iterencode_binary():
+    """
+    Test the `ipalib.rpc.json_iterencode_binary` function.
+    """
+    value = dict(
+        result=dict(
+            count=2,
+            result=[
+                dict(uid=(u'one',), data=(binary_bytes,)),
+                dict(uid=(unicode_str,), data=(utf8_bytes,), other=None),
+            ],
+            truncated=False,
+        ),
+        error=None,
+        id=0,
+    )
+    chunks = list(rpc.json_iterencode_binary(value, API_VERSION,
+                                             chunk_size=16))
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert type(chunk) is bytes
+    assert rpc.json_decode_binary(b''.join(chunks)) == rpc.json_decode_binary(
+        rpc.json_encode_binary(value, API_VERSION))
+
+
 class test_xmlclient(PluginTester):
     """
     Test the `ipalib.rpc.xmlclient` plugin.
@@ -0,0 +1,63 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Test the `ipalib.timing` module.
+"""
+
+import pytest
+
+from ipalib import timing
+from ipalib.request import context
+
+pytestmark = pytest.mark.tier0
+
+
+@pytest.fixture
+def request_timing(request):
+    def fin():
+        del context.timing
+    request.addfinalizer(fin)
+    return timing.start()
+
+
+def test_not_started():
+    assert timing.current() is None
+    with timing.command(), timing.phase('execute'):
+        with timing.operation('ldap'):
+            pass
+
+
+def test_phases(request_timing):
+    with timing.phase('decode'):
+        pass
+    with timing.command():
+        with timing.phase('execute'):
+            with timing.command():
+                # phases of nested commands are not recorded
+                with timing.phase('validate'):
+                    pass
+    request_timing.stop()
+
+    assert list(request_timing.phases) == ['decode', 'execute']
+    assert request_timing.total >= sum(request_timing.phases.values())
+
+
+def test_operations(request_timing):
+    with timing.operation('ldap'):
+        # the time of nested operations is counted only once
+        with timing.operation('ldap'):
+            pass
+    with timing.operation('dogtag'):
+        pass
+
+    assert request_timing.operations['ldap'][0] == 2
+    assert request_timing.operations['dogtag'][0] == 1
+
+    items = dict(item.split('=')
+                 for item in request_timing.format().split())
+    assert items['ldap_count'] == '2'
+    assert items['dogtag_count'] == '1'
+    assert 'ldap_time' in items
+    assert 'total' in items
@@ -0,0 +1,93 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+"""
+Test `backupstore`
+"""
+
+import io
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from ipaserver.install import backupstore
+
+
+def ldif(count, start=0):
+    return b''.join(
+        b'dn: uid=user%d,cn=users,dc=example,dc=com\n'
+        b'objectClass: top\n'
+        b'uid: user%d\n\n' % (i, i)
+        for i in range(start, start + count))
+
+
+@pytest.fixture
+def tempdir(request):
+    path = tempfile.mkdtemp()
+    request.addfinalizer(lambda: shutil.rmtree(path))
+    return path
+
+
+@pytest.mark.tier0
+class TestChunks(object):
+    def test_split_roundtrip(self):
+        data = ldif(20000)
+        chunks = list(backupstore.split_chunks(io.BytesIO(data)))
+        assert len(chunks) > 1
+        assert b''.join(chunks) == data
+        for chunk in chunks:
+            assert len(chunk) <= backupstore.MAX_CHUNK_SIZE
+
+    def test_insertion_changes_few_chunks(self):
+        data = ldif(20000)
+        modified = data[:len(data) // 2] + ldif(1, 50000) + data[len(data) // 2:]
+        old = set(backupstore.split_chunks(io.BytesIO(data)))
+        new = set(backupstore.split_chunks(io.BytesIO(modified)))
+        assert len(new - old) <= 2
+
+
+@pytest.mark.tier0
+class TestManifest(object):
+    def test_incremental(self, tempdir):
+        src = os.path.join(tempdir, 'src')
+        os.makedirs(os.path.join(src, 'bak'))
+        with open(os.path.join(src, 'data.ldif'), 'wb') as f:
+            f.write(ldif(20000))
+        with open(os.path.join(src, 'bak', 'id2entry.db'), 'wb') as f:
+            f.write(os.urandom(4096))
+
+        store = backupstore.ChunkStore(os.path.join(tempdir, 'chunks'))
+        sources = [(src, 'data.ldif'), (src, 'bak')]
+        for name in ('backup1', 'backup2'):
+            os.mkdir(os.path.join(tempdir, name))
+            backupstore.create_manifest(
+                store,
+                os.path.join(tempdir, name, backupstore.MANIFEST_NAME),
+                sources)
+
+        manifests = [
+            backupstore.read_manifest(
+                os.path.join(tempdir, name, backupstore.MANIFEST_NAME))
+            for name in ('backup1', 'backup2')]
+        assert manifests[0]['entries'] == manifests[1]['entries']
+
+        dest = os.path.join(tempdir, 'dest')
+        os.mkdir(dest)
+        backupstore.extract_manifest(
+            os.path.join(tempdir, 'backup2', backupstore.MANIFEST_NAME), dest)
+        for name in ('data.ldif', os.path.join('bak', 'id2entry.db')):
+            with open(os.path.join(src, name), 'rb') as f:
+                expected = f.read()
+            with open(os.path.join(dest, name), 'rb') as f:
+                assert f.read() == expected
+
+    def test_prune(self, tempdir):
+        store = backupstore.ChunkStore(os.path.join(tempdir, 'chunks'))
+        kept = store.put(b'kept')
+        removed = store.put(b'removed')
+        assert store.prune({kept}) == 1
+        assert store.get(kept) == b'kept'
+        with pytest.raises(IOError):
+            store.get(removed)
@@ -0,0 +1,67 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+"""
+Test `upgradesteps`
+"""
+
+import threading
+
+import pytest
+
+from ipaserver.install import upgradesteps
+
+
+@pytest.mark.tier0
+class TestUpgradeScheduler(object):
+    def test_order_and_concurrency(self):
+        order = []
+        started = threading.Event()
+
+        def first():
+            started.wait(5)
+            order.append('first')
+
+        def independent():
+            started.set()
+            order.append('independent')
+
+        def second():
+            order.append('second')
+
+        steps = upgradesteps.UpgradeScheduler()
+        steps.add('first', first, writes=['a'])
+        steps.add('independent', independent, writes=['b'])
+        steps.add('second', second, reads=['a'])
+        steps.run()
+        # independent must not wait for first, second must
+        assert order == ['independent', 'first', 'second']
+
+    def test_restarts_coalesced(self):
+        restarts = []
+        steps = upgradesteps.UpgradeScheduler(
+            restart_callbacks={'named': lambda: restarts.append('named')})
+        for i in range(3):
+            steps.add('step%d' % i, lambda: True, writes=['named.conf'],
+                      restarts=['named'])
+        steps.add('unchanged', lambda: False, restarts=['named'])
+        results = steps.run()
+        assert restarts == ['named']
+        assert results['unchanged'] is False
+        assert len(steps.timings) == 5
+
+    def test_failure(self):
+        restarts = []
+
+        def fail():
+            raise RuntimeError('failed')
+
+        steps = upgradesteps.UpgradeScheduler(
+            restart_callbacks={'named': lambda: restarts.append('named')})
+        steps.add('changed', lambda: True, restarts=['named'])
+        steps.add('fail', fail, writes=['a'])
+        steps.add('dependent', lambda: restarts.append('dependent'),
+                  reads=['a'])
+        with pytest.raises(RuntimeError):
+            steps.run()
+        assert restarts == []
@@ -0,0 +1,222 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Test the `ipatests.memldap` module.
+"""
+
+import ldap
+from ldap.controls import SimplePagedResultsControl
+import pytest
+
+from ipapython.dn import DN
+from ipatests import memldap
+
+pytestmark = pytest.mark.tier0
+
+BASEDN = DN(('dc', 'example'), ('dc', 'com'))
+USERS = DN(('cn', 'users'), ('cn', 'accounts'), BASEDN)
+GROUPS = DN(('cn', 'groups'), ('cn', 'accounts'), BASEDN)
+
+
+def user_dn(uid):
+    return DN(('uid', uid), USERS)
+
+
+def group_dn(cn):
+    return DN(('cn', cn), GROUPS)
+
+
+@pytest.fixture
+def directory():
+    directory = memldap.bootstrap(
+        u'EXAMPLE.COM', u'example.com', u'ipa.example.com', BASEDN)
+    for uid in ('alice', 'bob', 'carol'):
+        directory.add(user_dn(uid), [
+            ('objectClass', ['top', 'person', 'posixaccount', 'ipaobject']),
+            ('uid', uid),
+            ('cn', uid.capitalize()),
+            ('sn', uid.capitalize()),
+            ('uidNumber', '-1'),
+            ('gidNumber', '-1'),
+            ('homeDirectory', '/home/%s' % uid),
+            ('ipaUniqueID', 'autogenerate'),
+        ])
+    return directory
+
+
+@pytest.fixture
+def conn(directory):
+    return memldap.MemoryLDAPObject(directory)
+
+
+def add_group(directory, cn, members=()):
+    directory.add(group_dn(cn), [
+        ('objectClass', ['top', 'groupofnames', 'nestedgroup']),
+        ('cn', cn),
+        ('member', [str(dn) for dn in members]),
+    ])
+
+
+def search_uids(directory, filterstr, base=USERS,
+                scope=ldap.SCOPE_SUBTREE):
+    return sorted(
+        entry.attrs['uid'][1][0].decode('utf-8')
+        for entry in directory.search(base, scope, filterstr)
+        if 'uid' in entry.attrs)
+
+
+def memberof(directory, dn):
+    entry = directory.get(dn)
+    return sorted(DN(v.decode('utf-8'))
+                  for v in entry.attrs.get('memberof', [None, []])[1])
+
+
+@pytest.mark.parametrize('filterstr,expected', [
+    ('(uid=alice)', ['alice']),
+    ('(UID=ALICE)', ['alice']),
+    ('(uid=a*)', ['admin', 'alice']),
+    ('(sn=*o*)', ['admin', 'bob', 'carol']),
+    ('(|(uid=alice)(uid=bob))', ['alice', 'bob']),
+    ('(&(objectClass=posixAccount)(!(uid=bob)))',
+     ['admin', 'alice', 'carol']),
+    ('(&(uid=alice)(cn=Bob))', []),
+    ('(|(uid=alice)(cn=*ar*))', ['alice', 'carol']),
+    ('(uidNumber>=1102)', ['bob', 'carol']),
+    ('(uidNumber=01101)', ['alice']),
+    ('(description=*)', []),
+    ('uid=carol', ['carol']),
+])
+def test_filters(directory, filterstr, expected):
+    assert search_uids(directory, filterstr) == expected
+
+
+def test_invalid_filter(directory):
+    with pytest.raises(ldap.FILTER_ERROR):
+        directory.search(USERS, ldap.SCOPE_SUBTREE, '(uid=alice')
+
+
+def test_scopes(directory):
+    dn = user_dn('alice')
+    assert search_uids(directory, '(uid=alice)', dn, ldap.SCOPE_BASE) == [
+        'alice']
+    assert search_uids(directory, '(uid=alice)', USERS[1:],
+                       ldap.SCOPE_ONELEVEL) == []
+    assert search_uids(directory, '(objectClass=*)', USERS,
+                       ldap.SCOPE_ONELEVEL) == [
+        'admin', 'alice', 'bob', 'carol']
+    with pytest.raises(ldap.NO_SUCH_OBJECT):
+        directory.search(user_dn('dave'), ldap.SCOPE_BASE)
+
+
+def test_plugins(directory):
+    alice = directory.get(user_dn('alice'))
+    assert alice.attrs['uidnumber'][1] == [b'1101']
+    assert alice.attrs['gidnumber'][1] == [b'1101']
+    assert alice.attrs['ipauniqueid'][1] != [b'autogenerate']
+
+    usn = directory.usn
+    directory.modify(user_dn('alice'), [
+        (ldap.MOD_REPLACE, 'description', 'Alice')])
+    assert directory.usn == usn + 1
+    assert alice.attrs['entryusn'][1] == [str(usn + 1).encode('ascii')]
+
+    directory.delete(user_dn('bob'))
+    assert directory.usn == usn + 2
+
+
+def test_modify_errors(directory):
+    dn = user_dn('alice')
+    with pytest.raises(ldap.TYPE_OR_VALUE_EXISTS):
+        directory.modify(dn, [(ldap.MOD_ADD, 'cn', 'alice')])
+    with pytest.raises(ldap.NO_SUCH_ATTRIBUTE):
+        directory.modify(dn, [(ldap.MOD_DELETE, 'description', None)])
+    with pytest.raises(ldap.NO_SUCH_ATTRIBUTE):
+        directory.modify(dn, [(ldap.MOD_DELETE, 'cn', 'Bob')])
+
+    # a failed modification is not applied partially
+    with pytest.raises(ldap.TYPE_OR_VALUE_EXISTS):
+        directory.modify(dn, [
+            (ldap.MOD_REPLACE, 'sn', 'Smith'),
+            (ldap.MOD_ADD, 'cn', 'Alice')])
+    assert search_uids(directory, '(sn=smith)') == []
+
+    with pytest.raises(ldap.ALREADY_EXISTS):
+        directory.add(dn, [('objectClass', 'top')])
+    with pytest.raises(ldap.NO_SUCH_OBJECT):
+        directory.add(DN(('cn', 'x'), ('cn', 'missing'), BASEDN),
+                      [('objectClass', 'top')])
+    with pytest.raises(ldap.NOT_ALLOWED_ON_NONLEAF):
+        directory.delete(USERS)
+
+
+def test_memberof(directory):
+    add_group(directory, 'inner', [user_dn('alice')])
+    add_group(directory, 'outer', [group_dn('inner'), user_dn('bob')])
+    assert memberof(directory, user_dn('alice')) == [
+        group_dn('inner'), group_dn('outer')]
+    assert memberof(directory, user_dn('bob')) == [group_dn('outer')]
+    assert search_uids(
+        directory, '(memberOf=%s)' % group_dn('outer')) == ['alice', 'bob']
+
+    directory.modify(group_dn('outer'), [
+        (ldap.MOD_DELETE, 'member', str(group_dn('inner')))])
+    assert memberof(directory, user_dn('alice')) == [group_dn('inner')]
+    assert search_uids(
+        directory, '(memberOf=%s)' % group_dn('outer')) == ['bob']
+
+
+def test_referential_integrity(directory):
+    add_group(directory, 'inner', [user_dn('alice'), user_dn('bob')])
+    add_group(directory, 'outer', [group_dn('inner')])
+
+    directory.delete(user_dn('alice'))
+    inner = directory.get(group_dn('inner'))
+    assert inner.attrs['member'][1] == [str(user_dn('bob')).encode('utf-8')]
+    assert directory.search(GROUPS, ldap.SCOPE_SUBTREE,
+                            '(member=%s)' % user_dn('alice')) == []
+
+    directory.rename(group_dn('inner'), 'cn=middle')
+    outer = directory.get(group_dn('outer'))
+    assert outer.attrs['member'][1] == [
+        str(group_dn('middle')).encode('utf-8')]
+    assert memberof(directory, user_dn('bob')) == [
+        group_dn('middle'), group_dn('outer')]
+    assert [e.dn for e in directory.search(
+        GROUPS, ldap.SCOPE_SUBTREE, '(cn=inner)')] == []
+
+
+def test_paged_search(conn):
+    found = []
+    cookie = ''
+    while True:
+        ctrl = SimplePagedResultsControl(True, size=2, cookie=cookie)
+        msgid = conn.search_ext(str(USERS), ldap.SCOPE_ONELEVEL,
+                                '(objectClass=posixAccount)', ['uid'],
+                                serverctrls=[ctrl])
+        _rtype, results, _msgid, ctrls = conn.result3(msgid)
+        found.extend(attrs['uid'][0] for _dn, attrs in results)
+        cookie = ctrls[0].cookie
+        if not cookie:
+            break
+    assert found == [b'admin', b'alice', b'bob', b'carol']
+
+
+def test_size_limit(conn):
+    msgid = conn.search_ext(str(USERS), ldap.SCOPE_ONELEVEL,
+                            '(objectClass=posixAccount)', sizelimit=2)
+    results = []
+    with pytest.raises(ldap.SIZELIMIT_EXCEEDED):
+        while True:
+            _rtype, data, _msgid, _ctrls = conn.result3(msgid, 0)
+            results.extend(data)
+    assert len(results) == 2
+
+
+def test_root_dse_and_schema(conn):
+    [(_dn, attrs)] = conn.search_s('', ldap.SCOPE_BASE)
+    assert attrs['namingContexts'] == [str(BASEDN).encode('utf-8')]
+    [(_dn, attrs)] = conn.search_s('cn=schema', ldap.SCOPE_BASE,
+                                   attrlist=['attributetypes'])
+    assert any(b"'ipaUniqueID'" in v for v in attrs['attributeTypes'])
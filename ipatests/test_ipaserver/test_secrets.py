@@ -1,8 +1,16 @@
 # Copyright (C) 2015  FreeIPA Project Contributors - see LICENSE file
 
 from __future__ import print_function
+from custodia.message.kem import KEMClient, KEY_USAGE_SIG, KEY_USAGE_ENC
+from custodia.message.kem import make_enc_kem
+from jwcrypto.common import json_decode
+from jwcrypto.jwk import JWK
+from jwcrypto.jwt import JWT
+from ipaserver.secrets.client import CustodiaClient
 from ipaserver.secrets.store import iSecStore, NAME_DB_MAP, NSSCertDB
+from ipaserver.secrets.store import DBMAPHandler
 import os
+import requests
 import shutil
 import subprocess
 import unittest
@@ -53,3 +61,113 @@ class TestiSecStore(unittest.TestCase):
 
         NAME_DB_MAP['test']['path'] = self.cert2db
         iss.set('keys/test/testCACert', value)
+
+
+class MemoryDB(DBMAPHandler):
+    keys = {}
+    imported = {}
+
+    def __init__(self, config, dbmap, nickname):
+        self.nickname = nickname
+
+    def export_key(self):
+        return self.keys[self.nickname]
+
+    def import_key(self, value):
+        self.imported[self.nickname] = value
+
+
+class LocalCustodiaServer(object):
+    """
+    Answers KEM requests of a CustodiaClient from an IPASecStore, without
+    HTTP and Kerberos
+    """
+    def __init__(self, server_keys, client_keys, keystore):
+        self.server_keys = server_keys
+        self.client_keys = client_keys
+        self.keystore = keystore
+        self.cookies = {}
+        self.requests = []
+
+    def get(self, url, headers=None, params=None):
+        keyname = url.split('/ipa/keys/', 1)[1]
+        self.requests.append(keyname)
+
+        # the request must be encrypted for the server and signed by the
+        # client
+        jwe = JWT(jwt=params['value'], key=self.server_keys[KEY_USAGE_ENC])
+        jws = JWT(jwt=jwe.claims, key=self.client_keys[KEY_USAGE_SIG])
+        assert json_decode(jws.claims)['sub'] == keyname
+
+        value = self.keystore.get('keys/%s' % keyname)
+        if value is None:
+            return LocalResponse(404)
+        reply = make_enc_kem(keyname, value,
+                             self.server_keys[KEY_USAGE_SIG], 'RS256',
+                             self.client_keys[KEY_USAGE_ENC],
+                             ('RSA-OAEP', 'A256CBC-HS512'))
+        return LocalResponse(200, {'type': 'kem', 'value': reply})
+
+
+class LocalResponse(object):
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self.data = data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(response=self)
+
+    def json(self):
+        return self.data
+
+
+class LocalCustodiaClient(CustodiaClient):
+    def __init__(self, server, keystore):
+        # pylint: disable=super-init-not-called
+        self.server = 'localhost'
+        self.session = server
+        self.kemcli = KEMClient(server.server_keys, server.client_keys)
+        self.keystore = keystore
+
+    def _auth_header(self):
+        return {}
+
+
+def _throwaway_keys(kid):
+    return (JWK(generate='RSA', use='sig', kid=kid),
+            JWK(generate='RSA', use='enc', kid=kid))
+
+
+class TestKeyBatch(unittest.TestCase):
+    def setUp(self):
+        NAME_DB_MAP['memory'] = {'handler': MemoryDB}
+        MemoryDB.keys = {'key1': u'value1', 'key2': u'value2'}
+        MemoryDB.imported = {}
+        self.server = LocalCustodiaServer(
+            _throwaway_keys(u'host/server.example.com@EXAMPLE.COM'),
+            _throwaway_keys(u'host/replica.example.com@EXAMPLE.COM'),
+            iSecStore({}))
+        self.client = LocalCustodiaClient(self.server, iSecStore({}))
+
+    def tearDown(self):
+        del NAME_DB_MAP['memory']
+
+    def test_fetch_keys(self):
+        values = self.client.fetch_keys(
+            [u'memory/key1', u'memory/key2'], store=False)
+        assert values == {u'memory/key1': u'value1',
+                          u'memory/key2': u'value2'}
+        assert len(self.server.requests) == 1
+
+    def test_fetch_keys_store(self):
+        self.client.fetch_keys([u'memory/key1', u'memory/key2'])
+        assert MemoryDB.imported == {'key1': u'value1', 'key2': u'value2'}
+        assert len(self.server.requests) == 1
+
+    def test_fetch_keys_missing(self):
+        with self.assertRaises(requests.HTTPError):
+            self.client.fetch_keys([u'memory/key1', u'memory/missing'],
+                                   store=False)
+        # the batch is refused as a whole, then each key is requested
+        assert len(self.server.requests) == 3
@@ -0,0 +1,181 @@
+#
+# Copyright (C) 2017  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Test the `ipaserver.sudopolicy` module.
+"""
+
+from collections import OrderedDict
+
+import pytest
+
+from ipalib import api
+from ipalib.request import context
+from ipapython.dn import DN
+from ipaserver import sudopolicy
+
+pytestmark = pytest.mark.tier0
+
+
+class Entry(dict):
+    """
+    Stand-in for LDAPEntry with the interface used by the compiler
+    """
+    def __init__(self, dn, **attrs):
+        super(Entry, self).__init__(
+            (name, value if isinstance(value, list) else [value])
+            for name, value in attrs.items())
+        self.dn = dn
+
+    @property
+    def single_value(self):
+        return dict((name, values[0]) for name, values in self.items())
+
+
+def dn(kind, rdn_value, rdn_attr='cn'):
+    return DN((rdn_attr, rdn_value), api.env['container_%s' % kind],
+              api.env.basedn)
+
+
+@pytest.fixture
+def members():
+    members = sudopolicy._Members(api, None)
+    for entry in (
+            Entry(dn('group', u'admins'), cn=u'admins',
+                  objectclass=[u'ipausergroup', u'posixgroup']),
+            Entry(dn('group', u'staff'), cn=u'staff',
+                  objectclass=[u'ipausergroup']),
+            Entry(dn('hostgroup', u'web'), cn=u'web',
+                  objectclass=[u'ipahostgroup', u'mepOriginEntry']),
+            Entry(dn('hostgroup', u'db'), cn=u'db',
+                  objectclass=[u'ipahostgroup']),
+            Entry(dn('sudocmd', u'1', 'ipauniqueid'), sudocmd=u'/bin/rm'),
+            Entry(dn('sudocmd', u'2', 'ipauniqueid'),
+                  sudocmd=u'/usr/bin/vim')):
+        members.entries[entry.dn] = entry
+    members.group_users[dn('group', u'staff')] = {u'bob', u'carol'}
+    members.hostgroup_hosts[dn('hostgroup', u'db')] = {u'db1.example.com'}
+    members.cmdgroup_commands[dn('sudocmdgroup', u'viewers')] = {
+        u'/usr/bin/less', u'/usr/bin/vim'}
+    return members
+
+
+def rule(name, **attrs):
+    return Entry(DN(('ipauniqueid', name), api.env.container_sudorule,
+                    api.env.basedn), cn=name, **attrs)
+
+
+def test_categories(members):
+    compiled = sudopolicy.compile_rule(
+        rule(u'all', usercategory=u'all', hostcategory=u'all',
+             cmdcategory=u'all', ipasudorunasusercategory=u'all',
+             ipasudorunasgroupcategory=u'all', sudoorder=u'5'),
+        members)
+    assert compiled == OrderedDict([
+        ('cn', u'all'),
+        ('sudouser', [u'ALL']),
+        ('sudohost', [u'ALL']),
+        ('sudocommand', [u'ALL']),
+        ('sudorunasuser', [u'ALL']),
+        ('sudorunasgroup', [u'ALL']),
+        ('sudoorder', 5),
+    ])
+
+
+def test_hidden_rules(members):
+    assert sudopolicy.compile_rule(
+        rule(u'disabled', ipaenabledflag=False), members) is None
+    assert sudopolicy.compile_rule(
+        rule(u'hidden', compatvisible=u'FALSE'), members) is None
+
+
+def test_members(members):
+    entry = rule(
+        u'members',
+        memberuser=[dn('user', u'alice', 'uid'), dn('group', u'admins'),
+                    dn('group', u'staff')],
+        externaluser=u'ext',
+        memberhost=[dn('host', u'a.example.com', 'fqdn'),
+                    dn('hostgroup', u'web'), dn('hostgroup', u'db')],
+        hostmask=u'192.0.2.0/24',
+        memberallowcmd=[dn('sudocmd', u'2', 'ipauniqueid'),
+                        dn('sudocmdgroup', u'viewers')],
+        memberdenycmd=dn('sudocmd', u'1', 'ipauniqueid'),
+        ipasudorunas=[dn('user', u'root', 'uid'), dn('group', u'admins'),
+                      dn('group', u'staff')],
+        ipasudorunasextusergroup=u'wheel',
+        ipasudorunasgroup=[dn('group', u'admins'), dn('group', u'staff')],
+        ipasudoopt=[u'!authenticate', u'env_keep=HOME'])
+
+    compiled = sudopolicy.compile_rule(entry, members)
+    assert compiled == OrderedDict([
+        ('cn', u'members'),
+        ('sudouser', [u'%admins', u'alice', u'bob', u'carol', u'ext']),
+        ('sudohost', [u'+web', u'192.0.2.0/24', u'a.example.com',
+                      u'db1.example.com']),
+        ('sudocommand', [u'/usr/bin/less', u'/usr/bin/vim', u'!/bin/rm']),
+        ('sudorunasuser', [u'%admins', u'%wheel', u'root']),
+        ('sudorunasgroup', [u'admins']),
+        ('sudooption', [u'!authenticate', u'env_keep=HOME']),
+    ])
+    assert sudopolicy.rule_dependencies(entry) >= {
+        entry.dn, dn('group', u'staff'), dn('sudocmdgroup', u'viewers')}
+
+
+def test_policy_hash(members):
+    first = rule(u'first', usercategory=u'all', sudoorder=u'1')
+    second = rule(u'second', hostcategory=u'all', sudoorder=u'2')
+    rules = OrderedDict(
+        (entry.dn, sudopolicy.compile_rule(entry, members))
+        for entry in (second, first))
+    rules[rule(u'disabled').dn] = None
+
+    policy = sudopolicy.SudoPolicy(rules, {}, usn=10)
+    assert [r['cn'] for r in policy.compiled] == [u'first', u'second']
+
+    # the hash does not depend on the order of the rules nor on the USN
+    same = sudopolicy.SudoPolicy(OrderedDict(reversed(rules.items())), {},
+                                 usn=12)
+    assert same.hash == policy.hash
+
+    del rules[second.dn]
+    changed = sudopolicy.SudoPolicy(rules, {}, usn=13)
+    assert changed.hash != policy.hash
+
+
+def test_policy_cache(monkeypatch):
+    class Connection(object):
+        ldap_uri = u'ldapi://test'
+
+    class Backend(object):
+        ldap2 = Connection()
+
+    class API(object):
+        env = api.env
+
+    API.Backend = Backend
+
+    monkeypatch.setattr(sudopolicy, '_policies', OrderedDict())
+    monkeypatch.setattr(sudopolicy, 'POLICY_CACHE_SIZE', 2)
+    previous = {}
+
+    def compile_policy(api_instance, policy):
+        previous[context.principal] = policy
+        return policy or sudopolicy.SudoPolicy({}, {}, usn=1)
+
+    monkeypatch.setattr(sudopolicy, 'compile_policy', compile_policy)
+
+    policies = {}
+    for principal in (u'a', u'b', u'a', u'c', u'a', u'b'):
+        context.principal = principal
+        try:
+            policy = sudopolicy.get_sudo_policy(API)
+        finally:
+            del context.principal
+        policies.setdefault(principal, policy)
+
+    # a was kept as the most recently used policy, b was evicted by c
+    assert previous[u'a'] is policies[u'a']
+    assert previous[u'b'] is None
+    assert len(sudopolicy._policies) == 2
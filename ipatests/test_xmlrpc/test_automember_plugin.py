@@ -268,6 +268,36 @@ class TestAutomemberRebuildHostMembership(XMLRPC_test):
         hostgroup1.remove_member(dict(host=host1.fqdn))
         hostgroup1.retrieve()
 
+    def test_rebuild_membership_dry_run(self, automember_hostgroup,
+                                       hostgroup1, host1):
+        """ Show the membership a rebuild would add for one host without
+        adding it, then add it without a rebuild task. """
+        change = u'%s -> %s (rule %s: fqdn=%s)' % (
+            host1.fqdn, hostgroup1.cn, hostgroup1.cn, hostgroup_include_regex)
+
+        command = automember_hostgroup.make_rebuild_command(hosts=host1.fqdn,
+                                                            dry_run=True)
+        result = command()
+        assert_deepequal(dict(
+            value=None,
+            result=dict(changes=[change]),
+            summary=u'1 membership would be added',
+            ), result)
+        hostgroup1.retrieve()
+
+        command = automember_hostgroup.make_rebuild_command(hosts=host1.fqdn,
+                                                            no_task=True)
+        result = command()
+        assert_deepequal(dict(
+            value=None,
+            result=dict(changes=[change]),
+            summary=u'1 membership added',
+            ), result)
+        hostgroup1.attrs.update(member_host=[host1.fqdn])
+        hostgroup1.retrieve()
+        hostgroup1.remove_member(dict(host=host1.fqdn))
+        hostgroup1.retrieve()
+
     def test_rebuild_membership_for_host(self, host1, automember_hostgroup,
                                          hostgroup1):
         """ Rebuild automember membership for one host, both synchronously and